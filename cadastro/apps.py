@@ -4,5 +4,5 @@ from django.apps import AppConfig
 class CadastroConfig(AppConfig):
     name = 'cadastro'
 
-def ready(self):
-        import cadastro.signals
\ No newline at end of file
+    def ready(self):
+        import cadastro.signals
@@ -0,0 +1,160 @@
+# cadastro/arquivo.py
+
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from .models import Atendimento, LogAtividade, AtendimentoArquivado, LogAtividadeArquivado
+from .signals import atendimentos_arquivados
+
+# ==============================================================================
+# ARQUIVO FRIO DE PROCESSOS FINALIZADOS
+# ==============================================================================
+# Atendimento e LogAtividade só crescem, e quase tudo que o sistema consulta no
+# dia a dia é recente ou está em aberto. Processos aprovados e pagos, ou
+# cancelados, com mais de DIAS_PADRAO dias (e os logs deles) vão para
+# AtendimentoArquivado / LogAtividadeArquivado, em lotes de uma transação cada.
+#
+# Os relatórios chamam modelos_do_periodo(): se o período pedido começa depois
+# do processo arquivado mais recente do escritório, leem só a tabela quente;
+# senão leem as duas e juntam (agregar, somar_contagens, paginar com lista).
+# A data do arquivado mais recente fica no cache (arquivo_ate_<id>).
+
+DIAS_PADRAO = 365
+LOTE_PADRAO = 500
+
+# Só o que não muda mais. APROVADO em aberto continua quente (inadimplência, cobrança)
+ARQUIVAVEIS = Q(status='APROVADO', status_financeiro='PAGO') | Q(status='CANCELADO')
+
+# Cache: data do arquivado mais recente ('' = escritório sem arquivo)
+SEM_ARQUIVO = ''
+
+
+def _chave_limite(despachante_id):
+    return f"arquivo_ate_{despachante_id}"
+
+
+def _campos(modelo):
+    """Colunas copiadas do original (as do arquivo menos as que só existem nele)."""
+    return [campo.attname for campo in modelo._meta.concrete_fields if campo.name != 'data_arquivamento']
+
+
+CAMPOS_PROCESSO = _campos(AtendimentoArquivado)
+CAMPOS_LOG = _campos(LogAtividadeArquivado)
+
+
+# ------------------------------------------------------------------------------
+# LEITURA (RELATÓRIOS)
+# ------------------------------------------------------------------------------
+
+def arquivado_ate(despachante_id):
+    """Data de solicitação do processo arquivado mais recente do escritório (ou None)."""
+    chave = _chave_limite(despachante_id)
+    valor = cache.get(chave)
+    if valor is None:
+        ultimo = AtendimentoArquivado.objects.filter(despachante_id=despachante_id).aggregate(
+            ultimo=Max('data_solicitacao')
+        )['ultimo']
+        valor = ultimo.isoformat() if ultimo else SEM_ARQUIVO
+        cache.set(chave, valor, None)
+    return date.fromisoformat(valor) if valor else None
+
+
+def _como_data(valor):
+    if isinstance(valor, date):
+        return valor
+    try:
+        return date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def modelos_do_periodo(despachante_id, data_inicio=None):
+    """
+    Modelos que um relatório a partir de 'data_inicio' precisa ler.
+    Sem data de início (ou inválida), o período pode alcançar o arquivo.
+    """
+    limite = arquivado_ate(despachante_id)
+    inicio = _como_data(data_inicio)
+    if limite is None or (inicio is not None and inicio > limite):
+        return [Atendimento]
+    return [Atendimento, AtendimentoArquivado]
+
+
+def agregar(consultas, **agregacoes):
+    """aggregate() de cada consulta, somado chave a chave (None só se todas derem None)."""
+    total = {}
+    for consulta in consultas:
+        for chave, valor in consulta.aggregate(**agregacoes).items():
+            anterior = total.get(chave)
+            total[chave] = valor if anterior is None else (anterior if valor is None else anterior + valor)
+    return total
+
+
+def somar_contagens(consultas, campo):
+    """[{campo: x, 'total': n}] com as contagens por 'campo' de todas as consultas somadas."""
+    totais = {}
+    for consulta in consultas:
+        for linha in consulta.values(campo).annotate(total=Count('id')).order_by(campo):
+            totais[linha[campo]] = totais.get(linha[campo], 0) + linha['total']
+    return [{campo: valor, 'total': totais[valor]} for valor in sorted(totais, key=lambda v: (v is None, v))]
+
+
+def buscar_processo(**filtros):
+    """Processo ativo ou, se já foi arquivado, a cópia do arquivo (recibo, rastreio público)."""
+    return (
+        Atendimento.objects.filter(**filtros).first()
+        or AtendimentoArquivado.objects.filter(**filtros).first()
+    )
+
+
+# ------------------------------------------------------------------------------
+# ARQUIVAMENTO
+# ------------------------------------------------------------------------------
+
+def _arquivar_lote(despachante_id, limite, lote):
+    """Move um lote numa transação. Retorna quantos processos foram movidos."""
+    with transaction.atomic():
+        ids = list(
+            Atendimento.objects.select_for_update()
+            .filter(ARQUIVAVEIS, despachante_id=despachante_id, data_solicitacao__lt=limite)
+            .order_by('id').values_list('id', flat=True)[:lote]
+        )
+        if not ids:
+            return 0
+
+        processos = list(Atendimento.objects.filter(id__in=ids).values(*CAMPOS_PROCESSO))
+        AtendimentoArquivado.objects.bulk_create([AtendimentoArquivado(**linha) for linha in processos])
+
+        logs = LogAtividade.objects.filter(atendimento_id__in=ids)
+        LogAtividadeArquivado.objects.bulk_create(
+            [LogAtividadeArquivado(**linha) for linha in logs.values(*CAMPOS_LOG)], batch_size=1000
+        )
+        logs.delete()
+
+        # DELETE direto: os logs (única tabela que aponta para o processo, o que o
+        # ArquivoTest confere) já saíram, e os receivers de post_delete fariam uma
+        # escrita por processo. O efeito deles é aplicado de uma vez logo abaixo.
+        Atendimento.objects.filter(id__in=ids)._raw_delete(Atendimento.objects.db)
+
+        atendimentos_arquivados(despachante_id, [
+            (linha['cliente_id'], linha['status'], linha['data_solicitacao']) for linha in processos
+        ])
+
+    # O arquivado mais recente pode ter mudado: a próxima leitura recalcula
+    cache.delete(_chave_limite(despachante_id))
+    return len(ids)
+
+
+def arquivar(despachante_id, dias=DIAS_PADRAO, lote=LOTE_PADRAO, progresso=None):
+    """Arquiva os processos finalizados com mais de 'dias' dias. Retorna o total movido."""
+    limite = timezone.localdate() - timedelta(days=dias)
+    total = 0
+    while True:
+        movidos = _arquivar_lote(despachante_id, limite, lote)
+        if not movidos:
+            return total
+        total += movidos
+        if progresso:
+            progresso(total)
@@ -0,0 +1,301 @@
+# cadastro/autocompletar.py
+
+import bisect
+import unicodedata
+import uuid
+from collections import OrderedDict
+from django.core.cache import cache
+from .models import Cliente, Veiculo
+from .normalizacao import so_digitos, chave_placa, parece_documento, parece_placa
+
+# ==============================================================================
+# ÍNDICE DE PREFIXOS DO AUTOCOMPLETE DE CLIENTES (SELECT2)
+# ==============================================================================
+# O Select2 chama buscar_clientes a cada tecla. Em vez de um OR de icontains com
+# join em Veículo, cada escritório tem um índice com listas ordenadas
+# (nome, documento, telefone, placa) guardado no cache compartilhado:
+#   autocompletar_<id>            -> (base, índice) montado na primeira busca
+#   autocompletar_alteracoes_<id> -> (base, [alterações feitas depois do índice])
+#   autocompletar_versao_<id>     -> marca aleatória, trocada a cada alteração
+# Cada worker guarda a última cópia que leu (só dos escritórios usados por
+# último); enquanto a versão no cache for a mesma, a busca é só um bisect em
+# memória. Os signals de Cliente/Veículo acrescentam a alteração na lista
+# (pequena) em vez de regravar o índice inteiro; quem já tem a cópia aplica só
+# as alterações novas. A cada MAX_ALTERACOES a lista é incorporada ao índice.
+# Gravações em massa (bulk_create/bulk_update) chamam descartar().
+
+VALIDADE_INDICE = 60 * 60 * 24
+LIMITE_RESULTADOS = 20
+MAX_ALTERACOES = 100
+MAX_INDICES_LOCAIS = 50
+
+# Ranking: documento/placa exatos, depois começo (nome, documento, telefone, placa), depois meio do nome
+EXATO, PREFIXO, CONTEM = 0, 1, 2
+
+# despachante_id -> (versao, base, alterações aplicadas, indice) neste processo, do menos ao mais recente
+_locais = OrderedDict()
+
+
+def _chave_indice(despachante_id):
+    return f"autocompletar_{despachante_id}"
+
+
+def _chave_alteracoes(despachante_id):
+    return f"autocompletar_alteracoes_{despachante_id}"
+
+
+def _chave_versao(despachante_id):
+    return f"autocompletar_versao_{despachante_id}"
+
+
+def _chave_trava(despachante_id):
+    return f"autocompletar_trava_{despachante_id}"
+
+
+def normalizar_nome(nome):
+    """'  José  da Silva' -> 'jose da silva' (sem acento, para o prefixo casar com o que se digita)"""
+    texto = unicodedata.normalize('NFKD', nome or '').encode('ascii', 'ignore').decode()
+    return ' '.join(texto.split()).casefold()
+
+
+# ------------------------------------------------------------------------------
+# MONTAGEM E ALTERAÇÃO DO ÍNDICE
+# ------------------------------------------------------------------------------
+
+def _inserir(lista, item):
+    bisect.insort(lista, item)
+
+
+def _remover(lista, item):
+    posicao = bisect.bisect_left(lista, item)
+    if posicao < len(lista) and lista[posicao] == item:
+        del lista[posicao]
+
+
+def _colocar_cliente(indice, cliente_id, nome, cpf_cnpj, documento, telefone):
+    _tirar_cliente(indice, cliente_id)
+    chave_nome = normalizar_nome(nome)
+    indice['clientes'][cliente_id] = (nome, cpf_cnpj, chave_nome, documento, telefone)
+    _inserir(indice['nomes'], (chave_nome, cliente_id))
+    if documento:
+        _inserir(indice['documentos'], (documento, cliente_id))
+    if telefone:
+        _inserir(indice['telefones'], (telefone, cliente_id))
+
+
+def _tirar_cliente(indice, cliente_id):
+    anterior = indice['clientes'].pop(cliente_id, None)
+    if anterior is None:
+        return
+    _, _, chave_nome, documento, telefone = anterior
+    _remover(indice['nomes'], (chave_nome, cliente_id))
+    _remover(indice['documentos'], (documento, cliente_id))
+    _remover(indice['telefones'], (telefone, cliente_id))
+
+
+def _colocar_veiculo(indice, veiculo_id, placa, cliente_id):
+    _tirar_veiculo(indice, veiculo_id)
+    if placa:
+        indice['veiculos'][veiculo_id] = (placa, cliente_id)
+        _inserir(indice['placas'], (placa, cliente_id, veiculo_id))
+
+
+def _tirar_veiculo(indice, veiculo_id):
+    anterior = indice['veiculos'].pop(veiculo_id, None)
+    if anterior is not None:
+        placa, cliente_id = anterior
+        _remover(indice['placas'], (placa, cliente_id, veiculo_id))
+
+
+def montar_indice(despachante_id):
+    """Duas consultas (clientes e placas) e as listas já ordenadas."""
+    indice = {'clientes': {}, 'nomes': [], 'documentos': [], 'telefones': [], 'veiculos': {}, 'placas': []}
+    clientes = Cliente.objects.filter(despachante_id=despachante_id).values_list(
+        'id', 'nome', 'cpf_cnpj', 'documento_busca', 'telefone_busca'
+    )
+    for cliente_id, nome, cpf_cnpj, documento, telefone in clientes.iterator(chunk_size=5000):
+        chave_nome = normalizar_nome(nome)
+        indice['clientes'][cliente_id] = (nome, cpf_cnpj, chave_nome, documento, telefone)
+        indice['nomes'].append((chave_nome, cliente_id))
+        if documento:
+            indice['documentos'].append((documento, cliente_id))
+        if telefone:
+            indice['telefones'].append((telefone, cliente_id))
+
+    veiculos = Veiculo.objects.filter(despachante_id=despachante_id).exclude(placa_busca='').values_list(
+        'id', 'placa_busca', 'cliente_id'
+    )
+    for veiculo_id, placa, cliente_id in veiculos.iterator(chunk_size=5000):
+        indice['veiculos'][veiculo_id] = (placa, cliente_id)
+        indice['placas'].append((placa, cliente_id, veiculo_id))
+
+    for lista in ('nomes', 'documentos', 'telefones', 'placas'):
+        indice[lista].sort()
+    return indice
+
+
+OPERACOES = {
+    'colocar_cliente': _colocar_cliente,
+    'tirar_cliente': _tirar_cliente,
+    'colocar_veiculo': _colocar_veiculo,
+    'tirar_veiculo': _tirar_veiculo,
+}
+
+
+def _aplicar(indice, alteracoes):
+    for operacao, argumentos in alteracoes:
+        OPERACOES[operacao](indice, *argumentos)
+
+
+def _trocar_versao(despachante_id):
+    # Marca aleatória em vez de contador: se o cache perder a chave, nenhuma cópia antiga "volta a valer"
+    versao = uuid.uuid4().hex
+    cache.set(_chave_versao(despachante_id), versao, None)
+    return versao
+
+
+def _gravar_indice(despachante_id, indice):
+    """Novo índice base (alterações já incorporadas) com a lista de alterações vazia."""
+    base = uuid.uuid4().hex
+    cache.set(_chave_alteracoes(despachante_id), (base, []), VALIDADE_INDICE)
+    cache.set(_chave_indice(despachante_id), (base, indice), VALIDADE_INDICE)
+    return base
+
+
+def _guardar_local(despachante_id, copia):
+    _locais[despachante_id] = copia
+    _locais.move_to_end(despachante_id)
+    while len(_locais) > MAX_INDICES_LOCAIS:
+        _locais.popitem(last=False)
+
+
+def obter_indice(despachante_id):
+    versao = cache.get(_chave_versao(despachante_id))
+    local = _locais.get(despachante_id)
+    if versao is not None and local is not None and local[0] == versao:
+        _locais.move_to_end(despachante_id)
+        return local[3]
+
+    base, alteracoes = (cache.get(_chave_alteracoes(despachante_id)) if versao is not None else None) or (None, None)
+    if base is not None and local is not None and local[1] == base and local[2] <= len(alteracoes):
+        # Mesma base da cópia local: aplica só o que mudou desde a última leitura
+        indice = local[3]
+        _aplicar(indice, alteracoes[local[2]:])
+    else:
+        guardado = cache.get(_chave_indice(despachante_id)) if base is not None else None
+        if guardado is not None and guardado[0] == base:
+            indice = guardado[1]
+            _aplicar(indice, alteracoes)
+        else:
+            indice = montar_indice(despachante_id)
+            # Índice antes da versão: quem ler a versão nova já encontra o índice novo
+            base, alteracoes = _gravar_indice(despachante_id, indice), []
+            versao = _trocar_versao(despachante_id)
+
+    _guardar_local(despachante_id, (versao, base, len(alteracoes), indice))
+    return indice
+
+
+def descartar(despachante_id):
+    """Joga o índice fora: a próxima busca monta de novo a partir do banco."""
+    if despachante_id:
+        cache.delete_many([_chave_indice(despachante_id), _chave_alteracoes(despachante_id)])
+        _trocar_versao(despachante_id)
+
+
+def _alterar(despachante_id, operacao, *argumentos):
+    """Acrescenta a alteração na lista do cache. Se outro processo estiver alterando, descarta."""
+    if not despachante_id:
+        return
+    if not cache.add(_chave_trava(despachante_id), 1, 10):
+        descartar(despachante_id)
+        return
+    try:
+        guardado = cache.get(_chave_alteracoes(despachante_id))
+        if guardado is None:
+            # Sem índice montado (ou a lista sumiu do cache): a próxima busca monta do banco
+            cache.delete(_chave_indice(despachante_id))
+        else:
+            base, alteracoes = guardado
+            alteracoes.append((operacao, argumentos))
+            indice = cache.get(_chave_indice(despachante_id)) if len(alteracoes) >= MAX_ALTERACOES else None
+            if indice is not None and indice[0] == base:
+                # Lista cheia: incorpora tudo ao índice numa gravação só
+                _aplicar(indice[1], alteracoes)
+                _gravar_indice(despachante_id, indice[1])
+            else:
+                cache.set(_chave_alteracoes(despachante_id), (base, alteracoes), VALIDADE_INDICE)
+        _trocar_versao(despachante_id)
+    finally:
+        cache.delete(_chave_trava(despachante_id))
+
+
+def cliente_salvo(cliente):
+    dados = (cliente.id, cliente.nome, cliente.cpf_cnpj, cliente.documento_busca, cliente.telefone_busca)
+    _alterar(cliente.despachante_id, 'colocar_cliente', *dados)
+
+
+def cliente_excluido(despachante_id, cliente_id):
+    _alterar(despachante_id, 'tirar_cliente', cliente_id)
+
+
+def veiculo_salvo(veiculo):
+    dados = (veiculo.id, veiculo.placa_busca, veiculo.cliente_id)
+    _alterar(veiculo.despachante_id, 'colocar_veiculo', *dados)
+
+
+def veiculo_excluido(despachante_id, veiculo_id):
+    _alterar(despachante_id, 'tirar_veiculo', veiculo_id)
+
+
+# ------------------------------------------------------------------------------
+# BUSCA
+# ------------------------------------------------------------------------------
+
+def _com_prefixo(lista, prefixo):
+    """Itens de uma lista ordenada de tuplas cuja chave começa com 'prefixo'."""
+    posicao = bisect.bisect_left(lista, (prefixo,))
+    while posicao < len(lista) and lista[posicao][0].startswith(prefixo):
+        yield lista[posicao]
+        posicao += 1
+
+
+def buscar(despachante_id, termo, limite=LIMITE_RESULTADOS):
+    """[(id, nome, cpf_cnpj)] em ordem de relevância e, dentro dela, de nome."""
+    indice = obter_indice(despachante_id)
+    clientes = indice['clientes']
+    termo = (termo or '').strip()
+
+    if not termo:
+        return [(cliente_id, *clientes[cliente_id][:2]) for _, cliente_id in indice['nomes'][:limite]]
+
+    posicoes = {}  # cliente_id -> melhor posição no ranking
+
+    def achou(cliente_id, posicao):
+        if cliente_id in clientes and posicao < posicoes.get(cliente_id, CONTEM + 1):
+            posicoes[cliente_id] = posicao
+
+    if parece_documento(termo):
+        digitos = so_digitos(termo)
+        for documento, cliente_id in _com_prefixo(indice['documentos'], digitos):
+            achou(cliente_id, EXATO if documento == digitos else PREFIXO)
+        for _, cliente_id in _com_prefixo(indice['telefones'], digitos):
+            achou(cliente_id, PREFIXO)
+
+    if parece_placa(termo):
+        chave = chave_placa(termo)
+        for placa, cliente_id, _ in _com_prefixo(indice['placas'], chave):
+            achou(cliente_id, EXATO if placa == chave else PREFIXO)
+
+    chave_nome = normalizar_nome(termo)
+    if chave_nome:
+        for _, cliente_id in _com_prefixo(indice['nomes'], chave_nome):
+            achou(cliente_id, PREFIXO)
+        # Meio do nome: varre só se o começo não bastou para encher a lista
+        if len(posicoes) < limite:
+            for cliente_id, (_, _, nome, _, _) in clientes.items():
+                if chave_nome in nome:
+                    achou(cliente_id, CONTEM)
+
+    ordem = sorted(posicoes, key=lambda cliente_id: (posicoes[cliente_id], clientes[cliente_id][2], cliente_id))
+    return [(cliente_id, *clientes[cliente_id][:2]) for cliente_id in ordem[:limite]]
@@ -0,0 +1,84 @@
+# cadastro/carteira.py
+
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Atendimento, Veiculo
+from .contadores import STATUS_FINALIZADOS
+from . import arquivo
+
+# ==============================================================================
+# RESUMO DE ATIVIDADE DA CARTEIRA DE CLIENTES
+# ==============================================================================
+# Colunas calculadas da lista de clientes (veículos, processos em aberto, valor
+# devido, último serviço). Cada uma é uma subconsulta correlacionada pelo
+# cliente_id (índice da FK): a página inteira sai numa consulta só, sem N+1,
+# e dá para ordenar a carteira por qualquer uma delas no banco.
+# Processos arquivados (cadastro/arquivo.py) são sempre finalizados e pagos, ou
+# cancelados: nunca contam como em aberto nem devidos, mas o último serviço lê
+# também o arquivo quando o escritório tem processos arquivados.
+
+# Devido = o que o cliente ainda não pagou dos processos não cancelados
+STATUS_SEM_COBRANCA = ['CANCELADO']
+
+# ?ordem= da lista -> order_by (o 'id' desempata para a paginação ser estável)
+ORDENACOES = {
+    'nome': ['nome', 'id'],
+    'veiculos': ['-qtd_veiculos', 'nome', 'id'],
+    'abertos': ['-processos_abertos', 'nome', 'id'],
+    'devido': ['-valor_devido', 'nome', 'id'],
+    'ultimo_servico': [F('ultimo_servico').desc(nulls_last=True), 'nome', 'id'],
+}
+ORDENACAO_PADRAO = 'nome'
+
+
+def _por_cliente(queryset, agregacao):
+    """Subquery do agregado de 'queryset' agrupado pelo cliente da linha externa."""
+    return Subquery(
+        queryset.filter(cliente_id=OuterRef('pk'))
+        .order_by()
+        .values('cliente_id')
+        .annotate(valor=agregacao)
+        .values('valor')[:1]
+    )
+
+
+def _ultimo_servico(despachante_id):
+    datas = [_por_cliente(modelo.objects.all(), Max('data_solicitacao')) for modelo in arquivo.modelos_do_periodo(despachante_id)]
+    if len(datas) == 1:
+        return datas[0]
+    # Greatest dá NULL se qualquer lado for NULL (SQLite): cada lado cai no outro quando vazio
+    ativo, arquivado = datas
+    return Greatest(Coalesce(ativo, arquivado), Coalesce(arquivado, ativo))
+
+
+def anotar_resumo(clientes, despachante_id):
+    """Acrescenta qtd_veiculos, processos_abertos, valor_devido e ultimo_servico a cada cliente do escritório."""
+    dinheiro = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(Decimal('0.00'))
+    devedores = Atendimento.objects.filter(status_financeiro='ABERTO').exclude(status__in=STATUS_SEM_COBRANCA)
+    # Cada parcela com Coalesce: um NULL na soma anularia o processo inteiro no Sum
+    total_processo = (
+        Coalesce(F('valor_taxas_detran'), zero, output_field=dinheiro)
+        + Coalesce(F('valor_honorarios'), zero, output_field=dinheiro)
+    )
+
+    return clientes.annotate(
+        qtd_veiculos=Coalesce(
+            _por_cliente(Veiculo.objects.all(), Count('id')), Value(0), output_field=IntegerField()
+        ),
+        processos_abertos=Coalesce(
+            _por_cliente(Atendimento.objects.exclude(status__in=STATUS_FINALIZADOS), Count('id')),
+            Value(0), output_field=IntegerField(),
+        ),
+        valor_devido=Coalesce(
+            _por_cliente(devedores, Sum(total_processo, output_field=dinheiro)),
+            zero, output_field=dinheiro,
+        ),
+        ultimo_servico=_ultimo_servico(despachante_id),
+    )
+
+
+def ordenar(clientes, ordem):
+    """Aplica a ordenação pedida (ou a padrão, se vier algo fora da lista)."""
+    return clientes.order_by(*ORDENACOES.get(ordem, ORDENACOES[ORDENACAO_PADRAO]))
@@ -0,0 +1,118 @@
+# cadastro/contadores.py
+
+from datetime import datetime
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Atendimento, ContadorDespachante
+
+# Status que tiram o processo da fila (mesma regra do dashboard)
+STATUS_FINALIZADOS = ['APROVADO', 'CANCELADO', 'CONCLUIDO', 'ENTREGUE']
+
+CHAVE_ABERTOS = 'abertos'
+
+# Sequência dos eventos da fila (cadastro/eventos.py): só cresce, nunca é recontada
+CHAVE_EVENTOS = 'fila_eventos'
+
+
+def chave_mes(data):
+    """Chave do contador mensal. Ex: 'mes_2026_01'."""
+    return f"mes_{data.year}_{data.month:02d}"
+
+
+def como_data(valor):
+    # data_solicitacao pode chegar como datetime antes do refresh (ex: timezone.now())
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.date()
+    return valor
+
+
+def chaves_do_atendimento(status, data_solicitacao):
+    """Retorna as chaves de contador em que um processo com esses dados entra."""
+    chaves = []
+    if status not in STATUS_FINALIZADOS:
+        chaves.append(CHAVE_ABERTOS)
+    data = como_data(data_solicitacao)
+    if data:
+        chaves.append(chave_mes(data))
+    return chaves
+
+
+def _contar_no_banco(despachante_id, chave):
+    """Contagem completa (usada só para inicializar um contador que ainda não existe)."""
+    processos = Atendimento.objects.filter(despachante_id=despachante_id)
+    if chave == CHAVE_ABERTOS:
+        return processos.exclude(status__in=STATUS_FINALIZADOS).count()
+
+    _, ano, mes = chave.split('_')
+    return processos.filter(
+        data_solicitacao__year=int(ano),
+        data_solicitacao__month=int(mes)
+    ).count()
+
+
+def ler(despachante_id, chave):
+    """Lê o contador. Na primeira leitura, conta no banco e grava o resultado."""
+    contador = ContadorDespachante.objects.filter(
+        despachante_id=despachante_id, chave=chave
+    ).values_list('valor', flat=True).first()
+
+    if contador is not None:
+        return contador
+
+    contador, _ = ContadorDespachante.objects.get_or_create(
+        despachante_id=despachante_id,
+        chave=chave,
+        defaults={'valor': _contar_no_banco(despachante_id, chave)}
+    )
+    return contador.valor
+
+
+def ajustar(despachante_id, deltas):
+    """
+    Aplica variações nos contadores: {'abertos': -1, 'mes_2026_01': +1}.
+    Contadores que ainda não existem são ignorados: serão contados na primeira leitura.
+    """
+    for chave, delta in deltas.items():
+        if delta:
+            ContadorDespachante.objects.filter(
+                despachante_id=despachante_id, chave=chave
+            ).update(valor=F('valor') + delta)
+
+
+def incrementar(despachante_id, chave):
+    """
+    Soma 1 e devolve o novo valor. Atômico entre workers: o UPDATE trava a
+    linha até o fim da transação, então a leitura seguinte vê o próprio valor.
+    """
+    filtro = dict(despachante_id=despachante_id, chave=chave)
+    with transaction.atomic():
+        if not ContadorDespachante.objects.filter(**filtro).update(valor=F('valor') + 1):
+            try:
+                with transaction.atomic():
+                    ContadorDespachante.objects.create(**filtro, valor=1)
+                return 1
+            except IntegrityError:
+                # Outro worker criou a linha entre o UPDATE e o INSERT
+                ContadorDespachante.objects.filter(**filtro).update(valor=F('valor') + 1)
+        return ContadorDespachante.objects.filter(**filtro).values_list('valor', flat=True).get()
+
+
+def zerar(despachante_id=None):
+    """Apaga os contadores para que sejam recontados na próxima leitura (a sequência de eventos fica)."""
+    contadores = ContadorDespachante.objects.exclude(chave=CHAVE_EVENTOS)
+    if despachante_id:
+        contadores = contadores.filter(despachante_id=despachante_id)
+    contadores.delete()
+
+
+def total_abertos(despachante):
+    return ler(despachante.id, CHAVE_ABERTOS)
+
+
+def total_mes(despachante, hoje=None):
+    # Data local, como o como_data(): em UTC o mês vira às 21h do último dia
+    hoje = hoje or timezone.localdate()
+    return ler(despachante.id, chave_mes(hoje))
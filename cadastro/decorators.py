@@ -1,6 +1,9 @@
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from functools import wraps
+from .versoes import etag_pagina, data_pagina
 
 def plano_minimo(plano_exigido):
     """
@@ -18,34 +21,21 @@ def plano_minimo(plano_exigido):
             if not request.user.is_authenticated:
                 return redirect('login')
 
-            # 3. Tenta recuperar o plano do despachante vinculado ao usuário
-            try:
-                # Caminho: User -> PerfilUsuario -> Despachante -> Campo 'plano'
-                plano_atual = request.user.perfilusuario.despachante.plano
-            except AttributeError:
+            # 3. Contexto do escritório carregado pelo TenantMiddleware (sem novas queries)
+            tenant = getattr(request, 'tenant', None)
+            if not tenant or not tenant.despachante:
                 # Se o usuário não tiver perfil ou despachante vinculado, manda pro login
                 return redirect('login')
 
-            # 4. Define a "força" (peso) de cada plano para comparação matemática
-            niveis = {
-                'BASICO': 1,
-                'MEDIO': 2,
-                'PREMIUM': 3
-            }
-
-            # 5. Mapeia os códigos para nomes amigáveis (para a mensagem de erro)
+            # 4. Mapeia os códigos para nomes amigáveis (para a mensagem de erro)
             nomes_amigaveis = {
                 'BASICO': 'Básico',
                 'MEDIO': 'Médio',
                 'PREMIUM': 'Premium'
             }
 
-            # Converte os planos em números. Se não achar, assume 1 (Básico)
-            nivel_usuario = niveis.get(plano_atual, 1)
-            nivel_necessario = niveis.get(plano_exigido, 1)
-
-            # 6. A Lógica de Bloqueio
-            if nivel_usuario >= nivel_necessario:
+            # 5. A Lógica de Bloqueio
+            if tenant.tem_plano(plano_exigido):
                 # Se o nível do usuário for maior ou igual ao exigido, deixa passar
                 return view_func(request, *args, **kwargs)
             else:
@@ -58,4 +48,31 @@ def plano_minimo(plano_exigido):
                 return redirect('dashboard')
 
         return _wrapped_view
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def admin_obrigatorio(login_url='/dashboard/'):
+    """
+    Decorator que libera a view apenas para Superusuário ou perfil ADMIN.
+    Substitui o user_passes_test(is_admin_or_superuser) lendo o request.tenant.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            tenant = getattr(request, 'tenant', None)
+            if tenant and tenant.is_admin:
+                return view_func(request, *args, **kwargs)
+            return redirect(login_url)
+
+        return _wrapped_view
+    return decorator
+
+
+def pagina_condicional(view_func):
+    """
+    GET condicional para listagens: ETag/Last-Modified pela versão dos dados
+    do escritório (cadastro/versoes.py). Se nada mudou, responde 304 sem
+    rodar a view. 'no-cache' faz o navegador sempre revalidar.
+    """
+    view_condicional = condition(etag_func=etag_pagina, last_modified_func=data_pagina)(view_func)
+    return cache_control(private=True, no_cache=True)(view_condicional)
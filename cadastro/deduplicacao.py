@@ -0,0 +1,218 @@
+# cadastro/deduplicacao.py
+
+from collections import defaultdict
+from difflib import SequenceMatcher
+from django.db import transaction
+from django.db.models import Case, When, Value, BigIntegerField
+from .models import Cliente, Veiculo, Atendimento, Orcamento, LogAtividade, AtendimentoArquivado, LogAtividadeArquivado
+from .autocompletar import normalizar_nome
+from . import versoes, autocompletar
+
+# ==============================================================================
+# DEDUPLICAÇÃO DE CLIENTES (POR ESCRITÓRIO)
+# ==============================================================================
+# Comparar todos com todos é O(n²). Cada cliente recebe "chaves de bloco"
+# (documento normalizado; primeiro + último nome) e só se comparam clientes que
+# dividem uma chave. Os pares recebem uma nota (mesmo documento, ou mesmo
+# nome sem documento nos dois e com telefone ou e-mail em comum); os que passam
+# do limiar viram grupos (union-find) e cada grupo é mesclado no cliente mais
+# antigo com documento. Veículos, processos, orçamentos e logs (inclusive os
+# do arquivo) mudam de dono com um UPDATE por tabela para o lote inteiro de
+# grupos (CASE cliente_id WHEN ... THEN ...).
+
+LIMIAR_PADRAO = 0.8
+GRUPOS_POR_LOTE = 200
+
+# Blocos enormes (ex: "maria silva") não dizem nada: ficam de fora
+MAX_POR_BLOCO = 50
+
+PALAVRAS_IGNORADAS = {'da', 'de', 'do', 'das', 'dos', 'e', 'ltda', 'me', 'epp', 'sa', 'eireli'}
+
+# Campos que o cliente que fica herda dos mesclados quando estão vazios nele
+CAMPOS_COMPLEMENTARES = (
+    'cpf_cnpj', 'rg', 'orgao_expedidor', 'uf_rg', 'data_nascimento', 'naturalidade', 'filiacao',
+    'estado_civil', 'profissao', 'email', 'complemento', 'quadra', 'lote',
+)
+
+# Todas as tabelas com FK para Cliente: as que ficarem de fora são apagadas em cascata junto com o duplicado
+TABELAS_DO_CLIENTE = (Veiculo, Atendimento, Orcamento, LogAtividade, AtendimentoArquivado, LogAtividadeArquivado)
+
+
+def _documento_util(digitos):
+    """CPF/CNPJ completo e que não seja preenchimento (000.000.000-00, 111...)."""
+    return digitos if len(digitos) in (11, 14) and len(set(digitos)) > 1 else ''
+
+
+def _telefone_util(digitos):
+    """Descarta o telefone genérico dos clientes avulsos: (00) 00000-0000."""
+    return digitos if len(digitos) >= 10 and len(set(digitos)) > 1 else ''
+
+
+class _Ficha:
+    """O mínimo do cliente para comparar, sem instanciar o model."""
+    __slots__ = ('id', 'nome', 'tokens', 'documento', 'telefone', 'email')
+
+    def __init__(self, cliente_id, nome, documento, telefone, email):
+        self.id = cliente_id
+        self.nome = normalizar_nome(nome)
+        self.tokens = [t for t in self.nome.split() if t not in PALAVRAS_IGNORADAS and len(t) > 1]
+        self.documento = _documento_util(documento or '')
+        self.telefone = _telefone_util(telefone or '')
+        self.email = (email or '').strip().lower()
+
+    def chaves_bloco(self):
+        chaves = []
+        if self.documento:
+            chaves.append(f"doc:{self.documento}")
+        if self.tokens:
+            chaves.append(f"nome:{self.tokens[0]}:{self.tokens[-1]}")
+        return chaves
+
+
+def pontuar(a, b):
+    """Nota de 0 a 1 de que as duas fichas são a mesma pessoa/empresa."""
+    if a.documento and b.documento and a.documento != b.documento:
+        return 0.0  # Documentos diferentes: não são a mesma pessoa, por mais parecido que seja o nome
+
+    mesmo_telefone = bool(a.telefone) and a.telefone == b.telefone
+    mesmo_email = bool(a.email) and a.email == b.email
+
+    pontos = 0.25 * SequenceMatcher(None, a.nome, b.nome).ratio()
+    if a.documento and a.documento == b.documento:
+        pontos += 0.6
+    elif not a.documento and not b.documento and a.nome == b.nome and (mesmo_telefone or mesmo_email):
+        # Avulsos sem documento: nome completo idêntico só vale confirmado por telefone ou e-mail.
+        # Só o nome (ou um com documento e outro sem) fica abaixo do limiar: homônimos existem.
+        pontos += 0.6
+    if mesmo_telefone:
+        pontos += 0.1
+    if mesmo_email:
+        pontos += 0.05
+    return min(pontos, 1.0)
+
+
+def _carregar_fichas(despachante_id):
+    clientes = Cliente.objects.filter(despachante_id=despachante_id).order_by('id').values_list(
+        'id', 'nome', 'documento_busca', 'telefone_busca', 'email'
+    )
+    return [_Ficha(*linha) for linha in clientes.iterator(chunk_size=5000)]
+
+
+def encontrar_pares(fichas, limiar=LIMIAR_PADRAO):
+    """Pares (id_a, id_b, nota) acima do limiar, comparando só dentro de cada bloco."""
+    blocos = defaultdict(list)
+    for ficha in fichas:
+        for chave in ficha.chaves_bloco():
+            blocos[chave].append(ficha)
+
+    pares, vistos = [], set()
+    for membros in blocos.values():
+        if len(membros) < 2 or len(membros) > MAX_POR_BLOCO:
+            continue
+        for i, a in enumerate(membros):
+            for b in membros[i + 1:]:
+                par = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if par in vistos:
+                    continue
+                vistos.add(par)
+                nota = pontuar(a, b)
+                if nota >= limiar:
+                    pares.append((*par, nota))
+    return pares
+
+
+def agrupar(pares):
+    """Union-find: [[id, id, ...], ...] com os clientes ligados por algum par."""
+    pai = {}
+
+    def raiz(x):
+        pai.setdefault(x, x)
+        while pai[x] != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    for a, b, _ in pares:
+        ra, rb = raiz(a), raiz(b)
+        if ra != rb:
+            pai[max(ra, rb)] = min(ra, rb)
+
+    grupos = defaultdict(list)
+    for cliente_id in pai:
+        grupos[raiz(cliente_id)].append(cliente_id)
+    return [sorted(ids) for ids in grupos.values()]
+
+
+def _escolher_sobrevivente(grupo, fichas):
+    """O mais antigo com documento; se nenhum tiver, o mais antigo."""
+    return min(grupo, key=lambda cliente_id: (not fichas[cliente_id].documento, cliente_id))
+
+
+def _mesclar_lote(despachante_id, grupos, fichas):
+    """Um lote de grupos numa transação: complementa o sobrevivente, muda os donos e apaga os duplicados."""
+    destino = {}  # duplicado -> sobrevivente
+    for grupo in grupos:
+        sobrevivente = _escolher_sobrevivente(grupo, fichas)
+        for cliente_id in grupo:
+            if cliente_id != sobrevivente:
+                destino[cliente_id] = sobrevivente
+
+    with transaction.atomic():
+        clientes = Cliente.objects.in_bulk(list(destino) + list(set(destino.values())))
+        alterados = {}
+        for duplicado, sobrevivente in destino.items():
+            origem, alvo = clientes.get(duplicado), clientes.get(sobrevivente)
+            if origem is None or alvo is None:
+                continue
+            for campo in CAMPOS_COMPLEMENTARES:
+                if not getattr(alvo, campo) and getattr(origem, campo):
+                    setattr(alvo, campo, getattr(origem, campo))
+                    alterados[alvo.id] = alvo
+        for alvo in alterados.values():
+            alvo.save()
+
+        novo_dono = Case(
+            *[When(cliente_id=duplicado, then=Value(sobrevivente)) for duplicado, sobrevivente in destino.items()],
+            output_field=BigIntegerField(),
+        )
+        for modelo in TABELAS_DO_CLIENTE:
+            modelo.objects.filter(cliente_id__in=list(destino)).update(cliente_id=novo_dono)
+
+        LogAtividade.objects.bulk_create([
+            LogAtividade(
+                despachante_id=despachante_id,
+                cliente_id=sobrevivente,
+                acao='EDICAO',
+                descricao=f"Cadastro duplicado #{duplicado} ({fichas[duplicado].nome.upper()}) mesclado neste cliente.",
+            )
+            for duplicado, sobrevivente in destino.items()
+        ])
+        Cliente.objects.filter(id__in=list(destino)).delete()
+
+    for sobrevivente in set(destino.values()):
+        versoes.tocar_cliente(sobrevivente)
+    return len(destino)
+
+
+def deduplicar(despachante_id, limiar=LIMIAR_PADRAO, grupos_por_lote=GRUPOS_POR_LOTE, simular=False, progresso=None):
+    """
+    Procura e (se não for simulação) mescla os clientes duplicados do escritório.
+    Retorna {'pares': [...], 'grupos': [...], 'mesclados': n}.
+    """
+    lista = _carregar_fichas(despachante_id)
+    fichas = {ficha.id: ficha for ficha in lista}
+    pares = encontrar_pares(lista, limiar)
+    grupos = agrupar(pares)
+    resultado = {'pares': pares, 'grupos': grupos, 'mesclados': 0}
+    if simular or not grupos:
+        return resultado
+
+    for inicio in range(0, len(grupos), grupos_por_lote):
+        resultado['mesclados'] += _mesclar_lote(despachante_id, grupos[inicio:inicio + grupos_por_lote], fichas)
+        if progresso:
+            progresso(resultado)
+
+    # UPDATE em massa não dispara signals: renova versão das páginas e o índice do autocomplete
+    versoes.tocar(despachante_id)
+    autocompletar.descartar(despachante_id)
+    return resultado
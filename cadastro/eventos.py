@@ -0,0 +1,116 @@
+# cadastro/eventos.py
+
+import asyncio
+from contextlib import asynccontextmanager
+from django.core.cache import cache
+from .models import ContadorDespachante
+from . import contadores
+
+# ==============================================================================
+# EVENTOS DA FILA (PUB/SUB PELO CACHE COMPARTILHADO)
+# ==============================================================================
+# Cada escritório tem uma sequência numérica no banco e os eventos recentes no cache:
+#   ContadorDespachante 'fila_eventos' -> número do último evento publicado
+#   fila_evento_<id>_<n>               -> {'tipo': 'criado' | 'status' | 'excluido', ...}
+# Os signals do Atendimento publicam; o endpoint SSE (views.eventos_fila)
+# espera a sequência mudar (observar(), abaixo) e envia o que for novo.
+# A sequência fica no banco porque o incr do cache em arquivos não é atômico:
+# dois workers poderiam receber o mesmo número e um evento sobrescreveria o outro.
+
+VALIDADE_EVENTO = 300  # segundos: quem ficar desconectado mais que isso recarrega a página
+MAX_EVENTOS_POR_LEITURA = 100
+INTERVALO_LEITURA = 1  # segundos entre leituras da sequência (por escritório, por worker)
+
+
+def _chave_evento(despachante_id, seq):
+    return f"fila_evento_{despachante_id}_{seq}"
+
+
+def _sequencia(despachante_id):
+    return ContadorDespachante.objects.filter(
+        despachante_id=despachante_id, chave=contadores.CHAVE_EVENTOS
+    ).values_list('valor', flat=True)
+
+
+def publicar(despachante_id, tipo, **dados):
+    """Registra um evento da fila do escritório e devolve o número dele."""
+    seq = contadores.incrementar(despachante_id, contadores.CHAVE_EVENTOS)
+    cache.set(_chave_evento(despachante_id, seq), {'tipo': tipo, **dados}, VALIDADE_EVENTO)
+    return seq
+
+
+def ultimo_id(despachante_id):
+    """Número do último evento: a página usa como ponto de partida do stream."""
+    return _sequencia(despachante_id).first() or 0
+
+
+async def aultimo_id(despachante_id):
+    return await _sequencia(despachante_id).afirst() or 0
+
+
+async def aeventos_desde(despachante_id, ultimo, atual):
+    """Lista [(seq, evento)] publicados depois de 'ultimo' (até 'atual'), em ordem."""
+    inicio = max(ultimo + 1, atual - MAX_EVENTOS_POR_LEITURA + 1)
+    chaves = {_chave_evento(despachante_id, seq): seq for seq in range(inicio, atual + 1)}
+    encontrados = await cache.aget_many(list(chaves))
+    return sorted(((chaves[chave], evento) for chave, evento in encontrados.items()), key=lambda par: par[0])
+
+
+# ------------------------------------------------------------------------------
+# OBSERVADOR POR ESCRITÓRIO (UM POR WORKER)
+# ------------------------------------------------------------------------------
+# As conexões SSE não consultam o banco: um só laço por escritório neste worker
+# lê a sequência a cada INTERVALO_LEITURA e acorda todas as conexões do
+# escritório. O custo cresce com o número de escritórios com a tela aberta, não
+# com o número de abas. O laço para quando a última conexão do escritório sai.
+
+_observadores = {}
+
+
+class _Observador:
+
+    def __init__(self, despachante_id, atual):
+        self.despachante_id = despachante_id
+        self.atual = atual
+        self.conexoes = 0
+        self._mudou = asyncio.Event()
+        self.tarefa = asyncio.create_task(self._vigiar())
+
+    async def _vigiar(self):
+        while True:
+            await asyncio.sleep(INTERVALO_LEITURA)
+            atual = await aultimo_id(self.despachante_id)
+            if atual != self.atual:
+                self.atual = atual
+                # Acorda quem está esperando e arma um evento novo para a próxima mudança
+                self._mudou.set()
+                self._mudou = asyncio.Event()
+
+    async def esperar(self, conhecido, limite):
+        """Número do último evento assim que for diferente de 'conhecido' (ou após 'limite' segundos)."""
+        if self.atual == conhecido:
+            try:
+                await asyncio.wait_for(self._mudou.wait(), limite)
+            except asyncio.TimeoutError:
+                pass
+        return self.atual
+
+
+@asynccontextmanager
+async def observar(despachante_id):
+    """Inscreve uma conexão no observador do escritório (criado na primeira)."""
+    observador = _observadores.get(despachante_id)
+    if observador is None:
+        atual = await aultimo_id(despachante_id)
+        # Outra conexão pode ter criado o observador durante a leitura
+        observador = _observadores.get(despachante_id) or _Observador(despachante_id, atual)
+        _observadores[despachante_id] = observador
+    observador.conexoes += 1
+    try:
+        yield observador
+    finally:
+        observador.conexoes -= 1
+        if not observador.conexoes:
+            observador.tarefa.cancel()
+            if _observadores.get(despachante_id) is observador:
+                del _observadores[despachante_id]
@@ -1,4 +1,5 @@
 from django import forms
+from django.core.validators import FileExtensionValidator
 from django.contrib.auth.models import User
 from .models import Atendimento, Cliente, Veiculo, Despachante, PerfilUsuario
 from .models import BaseConhecimento 
@@ -162,6 +163,17 @@ class CompressaoPDFForm(forms.Form):
         })
     )
 
+class ImportacaoClientesForm(forms.Form):
+    arquivo = forms.FileField(
+        label="Planilha de clientes e veículos",
+        help_text="Arquivo .csv ou .xlsx com cabeçalho na primeira linha (mínimo: nome e cpf_cnpj).",
+        validators=[FileExtensionValidator(allowed_extensions=['csv', 'xlsx'])],
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'form-control form-control-lg',
+            'accept': '.csv,.xlsx'
+        })
+    )
+
 # ==============================================================================
 # NOVOS FORMULÁRIOS: PAINEL MASTER (SaaS)
 # ==============================================================================
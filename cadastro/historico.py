@@ -0,0 +1,118 @@
+# cadastro/historico.py
+
+import hashlib
+from datetime import datetime, time, timezone as dt_timezone
+from django.core.cache import cache
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Atendimento, Orcamento, LogAtividade, AtendimentoArquivado, LogAtividadeArquivado
+from .paginacao import paginar_por_cursor, PaginaCursor
+from . import versoes
+
+# ==============================================================================
+# HISTÓRICO (LINHA DO TEMPO) DO CLIENTE
+# ==============================================================================
+# Processos, orçamentos e registros de auditoria de um cliente numa lista só,
+# do mais recente para o mais antigo, paginada por cursor (cadastro/paginacao.py)
+# sobre as 5 tabelas (incluindo as do arquivo): cada página são 5 consultas de
+# até ITENS_POR_PAGINA + 1 linhas, juntadas em memória, em qualquer ponto do
+# histórico. Cada página fica no cache até a versão do cliente mudar
+# (versoes.tocar_cliente, chamado pelos signals).
+#
+# Ordem (decrescente): dia local, processos abaixo do resto do dia (só têm
+# data), hora, tipo e id. O tipo desempata ids iguais de tabelas diferentes;
+# processo ativo e arquivado têm o mesmo id de origem, nunca os dois ao mesmo tempo.
+
+ITENS_POR_PAGINA = 20
+VALIDADE_CACHE = 60 * 60 * 24
+
+ORDENACAO = ['-dia', '-grupo', '-instante', '-ordem', '-id']
+PROCESSO, ORCAMENTO, REGISTRO = 0, 1, 2
+# Processos não têm hora: todos do mesmo dia empatam aqui e se ordenam pelo id
+_SEM_HORA = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+STATUS_PROCESSO = dict(Atendimento.STATUS_CHOICES)
+STATUS_ORCAMENTO = dict(Orcamento.STATUS_ORCAMENTO)
+ACOES_LOG = dict(LogAtividade.ACAO_CHOICES)
+
+
+def _momento_do_dia(data):
+    """Processo só tem data: aparece com o começo do dia (abaixo dos registros feitos no mesmo dia)."""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def _consultas(cliente_id):
+    """As 5 fontes com os mesmos campos de ordenação (dia, grupo, instante, ordem, id)."""
+    processo = dict(
+        dia=F('data_solicitacao'), grupo=Value(0),
+        instante=Value(_SEM_HORA, output_field=DateTimeField()), ordem=Value(PROCESSO),
+    )
+    campos_processo = (
+        'id', 'numero_atendimento', 'servico', 'status', 'status_financeiro',
+        'valor_taxas_detran', 'valor_honorarios', 'veiculo__placa',
+    )
+    campos_log = ('id', 'acao', 'descricao', 'usuario__first_name', 'usuario__username')
+
+    consultas = [
+        modelo.objects.filter(cliente_id=cliente_id).values(*campos_processo).annotate(**processo)
+        for modelo in (Atendimento, AtendimentoArquivado)
+    ]
+    consultas.append(
+        Orcamento.objects.filter(cliente_id=cliente_id)
+        .values('id', 'status', 'valor_total', 'veiculo__placa')
+        .annotate(dia=TruncDate('data_criacao'), grupo=Value(1), instante=F('data_criacao'), ordem=Value(ORCAMENTO))
+    )
+    consultas.extend(
+        modelo.objects.filter(cliente_id=cliente_id).values(*campos_log)
+        .annotate(dia=TruncDate('data'), grupo=Value(1), instante=F('data'), ordem=Value(REGISTRO))
+        for modelo in (LogAtividade, LogAtividadeArquivado)
+    )
+    return consultas
+
+
+def _item(linha):
+    """Linha de qualquer fonte -> item do template (mantém os campos da ordenação, usados pelo cursor)."""
+    chaves = {campo.lstrip('-'): linha[campo.lstrip('-')] for campo in ORDENACAO}
+    if linha['ordem'] == PROCESSO:
+        return {
+            **chaves,
+            'tipo': 'processo',
+            'momento': _momento_do_dia(linha['dia']),
+            'titulo': f"Processo #{linha['numero_atendimento'] or linha['id']} - {linha['servico']}",
+            'status': STATUS_PROCESSO.get(linha['status'], linha['status']),
+            'pago': linha['status_financeiro'] == 'PAGO',
+            'valor': (linha['valor_taxas_detran'] or 0) + (linha['valor_honorarios'] or 0),
+            'placa': linha['veiculo__placa'],
+        }
+    if linha['ordem'] == ORCAMENTO:
+        return {
+            **chaves,
+            'tipo': 'orcamento',
+            'momento': linha['instante'],
+            'titulo': f"Orçamento #{linha['id']}",
+            'status': STATUS_ORCAMENTO.get(linha['status'], linha['status']),
+            'valor': linha['valor_total'],
+            'placa': linha['veiculo__placa'],
+        }
+    return {
+        **chaves,
+        'tipo': 'log',
+        'momento': linha['instante'],
+        'titulo': ACOES_LOG.get(linha['acao'], linha['acao']),
+        'descricao': linha['descricao'],
+        'usuario': linha['usuario__first_name'] or linha['usuario__username'],
+    }
+
+
+def pagina_historico(cliente_id, cursor=None):
+    """PaginaCursor do histórico: a partir do cursor (parâmetro ?historico=) ou a mais recente."""
+    marca = hashlib.md5((cursor or '').encode()).hexdigest()
+    chave = f"historico_cliente_{cliente_id}_{versoes.carimbo_cliente(cliente_id)}_{marca}"
+    guardado = cache.get(chave)
+    if guardado is None:
+        pagina = paginar_por_cursor(_consultas(cliente_id), cursor, ITENS_POR_PAGINA, ORDENACAO)
+        guardado = ([_item(linha) for linha in pagina], pagina.tem_proxima, pagina.tem_anterior)
+        cache.set(chave, guardado, VALIDADE_CACHE)
+    itens, tem_proxima, tem_anterior = guardado
+    return PaginaCursor(itens, ORDENACAO, tem_proxima, tem_anterior)
@@ -0,0 +1,578 @@
+# cadastro/importacao.py
+
+import io
+import csv
+import json
+import secrets
+import unicodedata
+from datetime import date, datetime
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from config.cache import cache_estado
+from .models import Cliente, Veiculo
+from .normalizacao import so_digitos, chave_placa
+from . import versoes, autocompletar
+
+# ==============================================================================
+# IMPORTAÇÃO DE CLIENTES E VEÍCULOS (CSV / XLSX)
+# ==============================================================================
+# O arquivo é lido linha a linha (nunca inteiro na memória) e gravado em lotes:
+# por lote, 1 consulta de clientes (documento_busca__in), 1 de veículos (placa_busca__in),
+# e bulk_update/bulk_create para cada um. Cada linha pode trazer um cliente e,
+# opcionalmente, um veículo dele. Clientes repetidos (vários veículos) são
+# juntados. O cliente é identificado pelos dígitos do CPF/CNPJ: "123.456.789-00"
+# e "12345678900" são a mesma pessoa; o veículo, pela placa normalizada.
+# Placa já cadastrada para outro cliente não muda de dono: vira erro da linha.
+# Linhas com problema vão para um relatório CSV de erros.
+
+TAMANHO_LOTE = 1000
+
+# Campo do model -> nomes aceitos no cabeçalho (os mesmos do formulário do novo_cliente)
+COLUNAS_CLIENTE = {
+    'nome': ('nome', 'cliente_nome', 'cliente', 'razao_social'),
+    'cpf_cnpj': ('cpf_cnpj', 'cliente_cpf_cnpj', 'cpf', 'cnpj', 'documento'),
+    'telefone': ('telefone', 'cliente_telefone', 'celular', 'fone'),
+    'email': ('email', 'cliente_email', 'e_mail'),
+    'rg': ('rg',),
+    'data_nascimento': ('data_nascimento', 'nascimento'),
+    'orgao_expedidor': ('orgao_expedidor',),
+    'profissao': ('profissao',),
+    'filiacao': ('filiacao', 'mae', 'nome_da_mae'),
+    'uf_rg': ('uf_rg',),
+    'cep': ('cep',),
+    'rua': ('rua', 'endereco', 'logradouro'),
+    'numero': ('numero',),
+    'bairro': ('bairro',),
+    'cidade': ('cidade', 'municipio'),
+    'uf': ('uf', 'estado'),
+    'complemento': ('complemento',),
+}
+
+COLUNAS_VEICULO = {
+    'placa': ('placa', 'veiculo_placa'),
+    'modelo': ('modelo', 'veiculo_modelo'),
+    'renavam': ('renavam', 'veiculo_renavam'),
+    'chassi': ('chassi', 'veiculo_chassi'),
+    'marca': ('marca', 'veiculo_marca'),
+    'cor': ('cor', 'veiculo_cor'),
+    'tipo': ('tipo', 'veiculo_tipo', 'tipo_veiculo'),
+    'ano_fabricacao': ('ano_fabricacao', 'veiculo_ano_fabricacao', 'ano_fab'),
+    'ano_modelo': ('ano_modelo', 'veiculo_ano_modelo', 'ano_mod'),
+    'proprietario_nome': ('proprietario_nome', 'veiculo_proprietario_nome'),
+    'proprietario_cpf': ('proprietario_cpf', 'veiculo_proprietario_cpf'),
+    'proprietario_telefone': ('proprietario_telefone', 'veiculo_proprietario_fone'),
+}
+
+# Obrigatórios no banco para criar um veículo novo
+CAMPOS_VEICULO_NOVO = ('ano_fabricacao', 'ano_modelo')
+
+
+class ArquivoInvalido(Exception):
+    """Arquivo que não dá para importar (formato, cabeçalho, dependência ausente)."""
+
+
+def _normalizar_cabecalho(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return '_'.join(texto.strip().lower().replace('-', ' ').replace('/', ' ').split())
+
+
+def _mapear_cabecalho(cabecalho):
+    """Índice da coluna -> ('cliente' | 'veiculo', campo). Colunas desconhecidas são ignoradas."""
+    apelidos = {}
+    for grupo, colunas in (('cliente', COLUNAS_CLIENTE), ('veiculo', COLUNAS_VEICULO)):
+        for campo, nomes in colunas.items():
+            for nome in nomes:
+                apelidos[nome] = (grupo, campo)
+
+    mapa = {}
+    for indice, titulo in enumerate(cabecalho):
+        destino = apelidos.get(_normalizar_cabecalho(titulo))
+        if destino and destino not in mapa.values():
+            mapa[indice] = destino
+
+    campos = {campo for _, campo in mapa.values()}
+    if not {'nome', 'cpf_cnpj'} <= campos:
+        raise ArquivoInvalido("O cabeçalho precisa ter pelo menos as colunas 'nome' e 'cpf_cnpj'.")
+    return mapa
+
+
+# ------------------------------------------------------------------------------
+# LEITURA EM STREAMING
+# ------------------------------------------------------------------------------
+
+def _valor_celula(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _linhas_csv(arquivo):
+    amostra = arquivo.read(64 * 1024)
+    arquivo.seek(0)
+    try:
+        amostra.decode('utf-8')
+        codificacao = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Excel em português costuma exportar CSV em Windows-1252
+        codificacao = 'cp1252'
+
+    texto_amostra = amostra.decode(codificacao, errors='ignore')
+    try:
+        dialeto = csv.Sniffer().sniff(texto_amostra.split('\n', 1)[0], delimiters=';,\t|')
+    except csv.Error:
+        dialeto = csv.excel
+
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao, newline='')
+    for linha in csv.reader(texto, dialeto):
+        yield [celula.strip() for celula in linha]
+    texto.detach()
+
+
+def _linhas_xlsx(arquivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ArquivoInvalido("Para importar arquivos .xlsx instale o pacote 'openpyxl' (ou salve a planilha como CSV).")
+
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        for linha in planilha.active.iter_rows(values_only=True):
+            yield [_valor_celula(celula) for celula in linha]
+    finally:
+        planilha.close()
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """Gera (número da linha, cabeçalho, valores) sem carregar o arquivo inteiro."""
+    # UploadedFile do Django: trabalha direto no arquivo por baixo (BytesIO ou temporário)
+    arquivo = getattr(arquivo, 'file', arquivo)
+    extensao = Path(nome_arquivo).suffix.lower()
+    if extensao == '.csv':
+        linhas = _linhas_csv(arquivo)
+    elif extensao == '.xlsx':
+        linhas = _linhas_xlsx(arquivo)
+    else:
+        raise ArquivoInvalido("Formato não suportado. Envie um arquivo .csv ou .xlsx.")
+
+    cabecalho = next(linhas, None)
+    if not cabecalho:
+        raise ArquivoInvalido("O arquivo está vazio.")
+
+    for numero, valores in enumerate(linhas, start=2):
+        if any(valores):
+            yield numero, cabecalho, valores
+
+
+# ------------------------------------------------------------------------------
+# VALIDAÇÃO (mesmas regras dos campos do model)
+# ------------------------------------------------------------------------------
+
+def _converter_data(valor):
+    # Aceita 31/12/1980 além do formato ISO
+    if '/' in valor:
+        try:
+            return datetime.strptime(valor, '%d/%m/%Y').date()
+        except ValueError:
+            pass
+    return valor
+
+
+def _limpar(modelo, campo, valor):
+    field = modelo._meta.get_field(campo)
+    if campo == 'data_nascimento':
+        valor = _converter_data(valor)
+    elif campo == 'placa':
+        valor = chave_placa(valor)
+    elif campo == 'tipo':
+        valor = valor.upper()
+    try:
+        return field.clean(valor, None)
+    except ValidationError as erro:
+        raise ValidationError(f"{campo}: {' '.join(erro.messages)}")
+
+
+def validar_linha(mapa, valores):
+    """Retorna (dados_cliente, dados_veiculo ou None). Só entram os valores preenchidos."""
+    cliente, veiculo = {}, {}
+    for indice, (grupo, campo) in mapa.items():
+        valor = valores[indice] if indice < len(valores) else ''
+        if not valor:
+            continue
+        destino, modelo = (cliente, Cliente) if grupo == 'cliente' else (veiculo, Veiculo)
+        destino[campo] = _limpar(modelo, campo, valor)
+
+    for obrigatorio in ('nome', 'cpf_cnpj'):
+        if not cliente.get(obrigatorio):
+            raise ValidationError(f"{obrigatorio}: campo obrigatório.")
+    if not so_digitos(cliente['cpf_cnpj']):
+        raise ValidationError("cpf_cnpj: sem números.")
+
+    if veiculo and not veiculo.get('placa'):
+        raise ValidationError("placa: obrigatória quando a linha traz dados de veículo.")
+
+    return cliente, (veiculo or None)
+
+
+# ------------------------------------------------------------------------------
+# RELATÓRIO DE ERROS
+# ------------------------------------------------------------------------------
+
+def pasta_relatorios(despachante_id):
+    return Path(settings.MEDIA_ROOT) / 'importacoes' / str(despachante_id)
+
+
+class RelatorioErros:
+    """CSV com as linhas recusadas (criado só se houver erro). Com 'nome', continua um relatório já começado."""
+
+    def __init__(self, despachante_id, nome=None, total=0):
+        self.despachante_id = despachante_id
+        self.nome = nome
+        self.total = total
+        self._arquivo = None
+        self._escritor = None
+
+    def registrar(self, numero_linha, mensagem, cabecalho, valores):
+        if self._escritor is None:
+            pasta = pasta_relatorios(self.despachante_id)
+            pasta.mkdir(parents=True, exist_ok=True)
+            novo = self.nome is None
+            if novo:
+                self.nome = f"erros_{secrets.token_hex(8)}.csv"
+            self._arquivo = open(pasta / self.nome, 'w' if novo else 'a', newline='', encoding='utf-8-sig')
+            self._escritor = csv.writer(self._arquivo, delimiter=';')
+            if novo:
+                self._escritor.writerow(['linha', 'erro', *cabecalho])
+        self._escritor.writerow([numero_linha, mensagem, *valores])
+        self.total += 1
+
+    def fechar(self):
+        if self._arquivo:
+            self._arquivo.close()
+
+
+# ------------------------------------------------------------------------------
+# GRAVAÇÃO EM LOTES
+# ------------------------------------------------------------------------------
+
+def _aplicar(objeto, dados, campos_alterados):
+    """Copia os dados para o objeto. False se nada mudou (reimportar o mesmo arquivo não regrava nada)."""
+    mudou = False
+    for campo, valor in dados.items():
+        field = objeto._meta.get_field(campo)
+        # Chave estrangeira: compara pelo id, sem buscar o objeto relacionado
+        atual = getattr(objeto, field.attname)
+        if atual != (valor.pk if field.is_relation else valor):
+            setattr(objeto, campo, valor)
+            campos_alterados.add(campo)
+            mudou = True
+    return mudou
+
+
+def _gravar_lote(despachante, lote, relatorio, resultado):
+    """lote: [(numero, cabecalho, valores, cliente, veiculo)] já validados."""
+    # Cliente repetido em várias linhas (um por veículo): junta os dados, a última linha vence
+    # Chave: só os dígitos do documento (a mesma do Cliente.documento_busca)
+    clientes_dados = {}
+    for _, _, _, cliente, _ in lote:
+        clientes_dados.setdefault(so_digitos(cliente['cpf_cnpj']), {}).update(cliente)
+
+    existentes = {}
+    consulta = Cliente.objects.filter(despachante=despachante, documento_busca__in=list(clientes_dados)).order_by('id')
+    for cliente in consulta:
+        existentes.setdefault(cliente.documento_busca, cliente)
+
+    clientes = {}
+    novos, alterados, campos_alterados = [], [], set()
+    for documento, dados in clientes_dados.items():
+        cliente = existentes.get(documento)
+        if cliente is None:
+            cliente = Cliente(despachante=despachante, **dados)
+            novos.append(cliente)
+        else:
+            # Mesmo documento com outra pontuação: mantém a do cadastro
+            dados = {campo: valor for campo, valor in dados.items() if campo != 'cpf_cnpj'}
+            if _aplicar(cliente, dados, campos_alterados):
+                alterados.append(cliente)
+        clientes[documento] = cliente
+
+    # bulk_create/bulk_update não passam pelo save(): recalcula as chaves de busca aqui
+    for cliente in novos + alterados:
+        cliente.atualizar_chaves_busca()
+    Cliente.objects.bulk_create(novos, batch_size=500)
+    if alterados:
+        campos = sorted(campos_alterados.union(Cliente.CAMPOS_BUSCA))
+        Cliente.objects.bulk_update(alterados, campos, batch_size=500)
+    resultado['clientes_criados'] += len(novos)
+    resultado['clientes_atualizados'] += len(alterados)
+
+    # --- VEÍCULOS ---
+    veiculos_dados = {}
+    for numero, cabecalho, valores, cliente, veiculo in lote:
+        if not veiculo:
+            continue
+        dono = clientes[so_digitos(cliente['cpf_cnpj'])]
+        item = veiculos_dados.setdefault(veiculo['placa'], {'dados': {}, 'dono': dono})
+        if item['dono'] is not dono:
+            relatorio.registrar(numero, "placa repetida no arquivo para outro cliente", cabecalho, valores)
+            continue
+        item['dados'].update(veiculo, cliente=dono)
+        item['linha'] = (numero, cabecalho, valores)
+
+    if not veiculos_dados:
+        return
+
+    consulta = Veiculo.objects.filter(despachante=despachante, placa_busca__in=list(veiculos_dados))
+    existentes = {v.placa_busca: v for v in consulta.annotate(nome_dono=F('cliente__nome'))}
+    novos, alterados, campos_alterados = [], [], set()
+    for placa, item in veiculos_dados.items():
+        dados = item['dados']
+        veiculo = existentes.get(placa)
+        if veiculo is None:
+            faltando = [campo for campo in CAMPOS_VEICULO_NOVO if dados.get(campo) is None]
+            if faltando:
+                relatorio.registrar(item['linha'][0], f"veículo novo sem {', '.join(faltando)}", *item['linha'][1:])
+                continue
+            novos.append(Veiculo(despachante=despachante, **dados))
+        elif veiculo.cliente_id != item['dono'].pk:
+            # A planilha não troca o dono de um veículo: quem transfere é o cadastro
+            relatorio.registrar(
+                item['linha'][0], f"placa já cadastrada para outro cliente ({veiculo.nome_dono})", *item['linha'][1:]
+            )
+        else:
+            # Mesma placa com outra máscara: mantém a do cadastro
+            dados = {campo: valor for campo, valor in dados.items() if campo != 'placa'}
+            if _aplicar(veiculo, dados, campos_alterados):
+                alterados.append(veiculo)
+
+    for veiculo in novos + alterados:
+        veiculo.atualizar_chaves_busca()
+    Veiculo.objects.bulk_create(novos, batch_size=500)
+    if alterados:
+        campos = sorted(campos_alterados.union(Veiculo.CAMPOS_BUSCA))
+        Veiculo.objects.bulk_update(alterados, campos, batch_size=500)
+    resultado['veiculos_criados'] += len(novos)
+    resultado['veiculos_atualizados'] += len(alterados)
+
+
+def _novo_estado(nome_arquivo):
+    """Estado de uma importação: última linha já processada (1 = cabeçalho) e o resultado até ali."""
+    return {
+        'nome': nome_arquivo,
+        'ultima_linha': 1,
+        'concluida': False,
+        'resultado': {
+            'linhas': 0,
+            'clientes_criados': 0, 'clientes_atualizados': 0,
+            'veiculos_criados': 0, 'veiculos_atualizados': 0,
+            'erros': 0, 'relatorio': None,
+        },
+    }
+
+
+def _gravados(resultado):
+    return (
+        resultado['clientes_criados'] + resultado['clientes_atualizados']
+        + resultado['veiculos_criados'] + resultado['veiculos_atualizados']
+    )
+
+
+def _processar(despachante, linhas, estado, tamanho_lote, limite=None, progresso=None):
+    """
+    Valida e grava as linhas recebidas, no máximo 'limite' delas. Atualiza o
+    estado a cada lote gravado e chama progresso(estado).
+    Retorna True se chegou ao fim das linhas.
+    """
+    resultado = estado['resultado']
+    relatorio = RelatorioErros(despachante.id, resultado['relatorio'], resultado['erros'])
+    mapa = None
+    lote = []
+    lidas = 0
+    fim = False
+
+    def gravar(ultima_linha):
+        if lote:
+            with transaction.atomic():
+                _gravar_lote(despachante, lote, relatorio, resultado)
+            lote.clear()
+        estado['ultima_linha'] = ultima_linha
+        resultado['erros'] = relatorio.total
+        resultado['relatorio'] = relatorio.nome
+        if progresso:
+            progresso(estado)
+
+    ultima_linha = estado['ultima_linha']
+    try:
+        for numero, cabecalho, valores in linhas:
+            if limite is not None and lidas >= limite:
+                break
+            if mapa is None:
+                mapa = _mapear_cabecalho(cabecalho)
+            lidas += 1
+            resultado['linhas'] += 1
+            ultima_linha = numero
+            try:
+                cliente, veiculo = validar_linha(mapa, valores)
+            except ValidationError as erro:
+                relatorio.registrar(numero, ' '.join(erro.messages), cabecalho, valores)
+                continue
+
+            lote.append((numero, cabecalho, valores, cliente, veiculo))
+            if len(lote) >= tamanho_lote:
+                gravar(ultima_linha)
+        else:
+            fim = True
+
+        gravar(ultima_linha)
+    finally:
+        relatorio.fechar()
+    return fim
+
+
+def _renovar(despachante_id):
+    # bulk_create/bulk_update não disparam os signals
+    versoes.tocar(despachante_id)
+    autocompletar.descartar(despachante_id)
+
+
+def importar(despachante, arquivo, nome_arquivo, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Importa o arquivo inteiro para o escritório, de uma vez (comando importar_clientes).
+    'progresso' (opcional) é chamado com o dicionário de resultado depois de cada lote gravado.
+    Retorna o resultado, com 'relatorio' = nome do CSV de erros (ou None).
+    """
+    estado = _novo_estado(nome_arquivo)
+    _processar(
+        despachante, ler_linhas(arquivo, nome_arquivo), estado, tamanho_lote,
+        progresso=(lambda estado: progresso(estado['resultado'])) if progresso else None,
+    )
+    if _gravados(estado['resultado']):
+        _renovar(despachante.id)
+    return estado['resultado']
+
+
+# ------------------------------------------------------------------------------
+# IMPORTAÇÃO EM ETAPAS (PELA TELA)
+# ------------------------------------------------------------------------------
+# No upload (iniciar) a planilha é lida uma única vez e convertida para um
+# arquivo de linhas: uma linha JSON [número, valores] por linha de dados. A
+# página chama continuar() em requests seguidos; cada etapa posiciona o arquivo
+# no byte onde a anterior parou (estado['posicao']) e lê no máximo
+# LINHAS_POR_ETAPA linhas. O CSV/XLSX nunca é relido e o trabalho total cresce
+# com o tamanho do arquivo, não com o número de etapas. O estado fica no
+# cache_estado e qualquer worker continua de onde o anterior parou. Uploads
+# abandonados somem depois de VALIDADE_ETAPAS.
+
+LINHAS_POR_ETAPA = 2 * TAMANHO_LOTE
+VALIDADE_ETAPAS = 60 * 60 * 24
+TRAVA_ETAPA = 5 * 60  # Segundos: uma etapa que quebrou no meio não bloqueia a importação para sempre
+
+
+def _chave_estado(despachante_id, token):
+    return f"importacao_{despachante_id}_{token}"
+
+
+def _limpar_abandonados(pasta):
+    limite = datetime.now().timestamp() - VALIDADE_ETAPAS
+    for caminho in pasta.glob('pendente_*'):
+        if caminho.stat().st_mtime < limite:
+            caminho.unlink(missing_ok=True)
+
+
+def _decodificar(linha):
+    """[número, valores] de uma linha do arquivo convertido."""
+    return json.loads(linha)
+
+
+def _linhas_convertidas(arquivo, cabecalho, posicoes):
+    """
+    Gera (número, cabecalho, valores) a partir da posição atual do arquivo
+    convertido. posicoes[número] = byte logo depois da linha, para a etapa
+    seguinte começar dali.
+    """
+    for linha in iter(arquivo.readline, b''):
+        numero, valores = _decodificar(linha)
+        posicoes[numero] = arquivo.tell()
+        yield numero, cabecalho, valores
+
+
+def iniciar(despachante, arquivo, nome_arquivo):
+    """
+    Converte o upload para o arquivo de linhas e devolve o token da importação.
+    ArquivoInvalido se o formato ou o cabeçalho não servirem (nada fica salvo).
+    """
+    pasta = pasta_relatorios(despachante.id)
+    pasta.mkdir(parents=True, exist_ok=True)
+    _limpar_abandonados(pasta)
+
+    token = secrets.token_hex(8)
+    caminho = pasta / f"pendente_{token}.jsonl"
+    getattr(arquivo, 'file', arquivo).seek(0)
+    cabecalho = None
+    try:
+        with open(caminho, 'w', encoding='utf-8') as destino:
+            for numero, cabecalho_lido, valores in ler_linhas(arquivo, nome_arquivo):
+                if cabecalho is None:
+                    _mapear_cabecalho(cabecalho_lido)
+                    cabecalho = cabecalho_lido
+                destino.write(json.dumps([numero, valores], ensure_ascii=False) + '\n')
+    except ArquivoInvalido:
+        caminho.unlink(missing_ok=True)
+        raise
+
+    estado = _novo_estado(nome_arquivo)
+    estado.update(arquivo=caminho.name, cabecalho=cabecalho, posicao=0)
+    cache_estado.set(_chave_estado(despachante.id, token), estado, VALIDADE_ETAPAS)
+    return token
+
+
+def estado_importacao(despachante_id, token):
+    """Estado da importação ({'resultado', 'concluida', ...}) ou None se não existir."""
+    return cache_estado.get(_chave_estado(despachante_id, token))
+
+
+def continuar(despachante, token, linhas_por_etapa=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Processa a próxima etapa e devolve o estado (None se o token não existir).
+    Se outra etapa da mesma importação estiver rodando, só devolve o estado atual.
+    """
+    chave = _chave_estado(despachante.id, token)
+    estado = cache_estado.get(chave)
+    if estado is None or estado['concluida']:
+        return estado
+    if not cache_estado.add(f"{chave}_trava", 1, TRAVA_ETAPA):
+        return estado
+
+    posicoes = {}
+
+    def salvar(estado):
+        # Só depois do lote gravado: uma etapa que cair no meio refaz o lote inteiro
+        estado['posicao'] = posicoes.get(estado['ultima_linha'], estado['posicao'])
+        cache_estado.set(chave, estado, VALIDADE_ETAPAS)
+
+    try:
+        caminho = pasta_relatorios(despachante.id) / estado['arquivo']
+        gravados = _gravados(estado['resultado'])
+        with open(caminho, 'rb') as arquivo:
+            arquivo.seek(estado['posicao'])
+            fim = _processar(
+                despachante, _linhas_convertidas(arquivo, estado['cabecalho'], posicoes), estado, tamanho_lote,
+                linhas_por_etapa or LINHAS_POR_ETAPA, progresso=salvar,
+            )
+        if _gravados(estado['resultado']) != gravados:
+            _renovar(despachante.id)
+        if fim:
+            estado['concluida'] = True
+            caminho.unlink(missing_ok=True)
+            cache_estado.set(chave, estado, VALIDADE_ETAPAS)
+    finally:
+        cache_estado.delete(f"{chave}_trava")
+    return estado
@@ -0,0 +1,184 @@
+# cadastro/lote.py
+
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+from .models import Atendimento, Veiculo, TipoServico
+from .contadores import STATUS_FINALIZADOS
+from .normalizacao import chave_placa, placa_valida
+from .signals import atendimentos_criados_em_lote
+from . import autocompletar, precificacao
+
+# ==============================================================================
+# CADASTRO EM LOTE (FROTAS)
+# ==============================================================================
+# Número de queries fixo por lote, seja 1 placa ou 40:
+#   1 query para os serviços do escritório (dicionário por nome normalizado)
+#   1 query para as placas já cadastradas (placa_busca__in, a mesma chave do consultar_placas)
+#   1 bulk_create para os veículos novos e 1 para os processos
+# O bulk_create não chama save() nem signals: contadores, versão dos dados e
+# eventos da fila são aplicados por atendimentos_criados_em_lote().
+
+
+def normalizar_nome_servico(nome):
+    """'  Transferência   de Propriedade ' -> 'transferência de propriedade'"""
+    return ' '.join((nome or '').split()).casefold()
+
+
+def mapa_servicos(despachante):
+    """Serviços ativos do escritório por nome normalizado (o primeiro da ordem vence, como no .first())."""
+    mapa = {}
+    for servico in TipoServico.objects.filter(despachante=despachante, ativo=True):
+        mapa.setdefault(normalizar_nome_servico(servico.nome), servico)
+    return mapa
+
+
+def _somar_servicos(nomes, servicos, despachante):
+    """Totais de taxas/honorários/sindicato dos serviços do '+'. Vincula o tipo só se for um serviço."""
+    total_taxas_detran = Decimal('0.00')
+    total_honorarios = Decimal('0.00')
+    total_custo_sindego = Decimal('0.00')
+    tipo_servico_vinculado = None
+
+    for nome in nomes:
+        s_base = servicos.get(normalizar_nome_servico(nome))
+        if not s_base:
+            continue
+
+        total_taxas_detran += s_base.valor_base
+        total_honorarios += s_base.honorarios
+        total_custo_sindego += precificacao.taxa_sindego(despachante, s_base)
+
+        if len(nomes) == 1:
+            tipo_servico_vinculado = s_base
+
+    return total_taxas_detran, total_honorarios, total_custo_sindego, tipo_servico_vinculado
+
+
+def criar_processos_em_lote(despachante, cliente, responsavel, linhas, prazo_entrega=None, observacoes=''):
+    """
+    linhas: [{'placa', 'modelo', 'servico', 'numero'}, ...] como vieram do formulário.
+    Deve ser chamado dentro de transaction.atomic(). Retorna os Atendimentos criados.
+    """
+    linhas = [dict(linha, placa=chave_placa(linha.get('placa'))) for linha in linhas]
+    linhas = [linha for linha in linhas if linha['placa']]
+    if not linhas:
+        return []
+
+    servicos = mapa_servicos(despachante)
+
+    # --- VEÍCULOS: uma consulta para todas as placas, um insert para as novas ---
+    # Pela placa normalizada: 'ABC-1D23' já cadastrada é o mesmo veículo que 'abc1d23' digitada
+    placas = {linha['placa'] for linha in linhas}
+    veiculos = {
+        v.placa_busca: v for v in Veiculo.objects.filter(despachante=despachante, placa_busca__in=placas)
+    }
+    novos = []
+    for linha in linhas:
+        if linha['placa'] not in veiculos:
+            veiculo = Veiculo(
+                despachante=despachante,
+                cliente=cliente,
+                placa=linha['placa'],
+                modelo=(linha.get('modelo') or '').upper(),
+            )
+            veiculo.atualizar_chaves_busca()
+            veiculos[linha['placa']] = veiculo
+            novos.append(veiculo)
+    if novos:
+        Veiculo.objects.bulk_create(novos)
+        transaction.on_commit(lambda: autocompletar.descartar(despachante.id))
+
+    # --- PROCESSOS ---
+    hoje = timezone.now().date()
+
+    atendimentos = []
+    for linha in linhas:
+        nome_servico = linha.get('servico') or ''
+        nomes = [s.strip() for s in nome_servico.split('+')]
+        taxas, honorarios, sindego, tipo_servico = _somar_servicos(nomes, servicos, despachante)
+
+        atendimentos.append(Atendimento(
+            despachante=despachante,
+            cliente=cliente,
+            veiculo=veiculos[linha['placa']],
+            tipo_servico=tipo_servico,
+            servico=nome_servico,
+            responsavel=responsavel,
+            numero_atendimento=linha.get('numero') or '',
+
+            valor_taxas_detran=taxas,
+            valor_honorarios=honorarios,
+
+            custo_impostos=precificacao.custo_impostos(despachante, honorarios),
+            custo_taxa_bancaria=precificacao.custo_bancario(despachante, taxas, honorarios),
+            custo_taxa_sindego=sindego,
+
+            status_financeiro='ABERTO',
+            status='SOLICITADO',
+            data_solicitacao=hoje,
+            data_entrega=prazo_entrega or None,
+            observacoes_internas=f"{observacoes}\nGerado via Cadastro Rápido.",
+        ))
+
+    Atendimento.objects.bulk_create(atendimentos)
+    atendimentos_criados_em_lote(despachante.id, atendimentos)
+    return atendimentos
+
+
+# ------------------------------------------------------------------------------
+# PRÉ-VALIDAÇÃO DAS PLACAS DO LOTE
+# ------------------------------------------------------------------------------
+
+MAX_PLACAS_CONSULTA = 100
+
+
+def consultar_placas(despachante, placas):
+    """
+    Situação de cada placa antes de lançar o lote, numa consulta só:
+    veículo + cliente + processos em aberto (LEFT JOIN filtrado), pelo índice (despachante, placa_busca).
+    Retorna {'encontradas': {placa: {...}}, 'novas': [...], 'invalidas': [...]} na ordem recebida.
+    """
+    chaves, invalidas = [], []
+    for placa in placas:
+        chave = chave_placa(placa)
+        if not placa_valida(chave):
+            if placa.strip():
+                invalidas.append(placa.strip())
+        elif chave not in chaves:
+            chaves.append(chave)
+
+    linhas = Veiculo.objects.filter(despachante=despachante, placa_busca__in=chaves).annotate(
+        abertos=FilteredRelation('atendimento', condition=~Q(atendimento__status__in=STATUS_FINALIZADOS)),
+    ).values(
+        'id', 'placa_busca', 'modelo', 'marca', 'cliente_id', 'cliente__nome', 'cliente__cpf_cnpj',
+        'abertos__id', 'abertos__numero_atendimento', 'abertos__servico', 'abertos__status',
+    ).order_by('placa_busca', 'abertos__id')
+
+    encontradas = {}
+    for linha in linhas:
+        veiculo = encontradas.setdefault(linha['placa_busca'], {
+            'veiculo_id': linha['id'],
+            'modelo': linha['modelo'],
+            'marca': linha['marca'],
+            'cliente': {
+                'id': linha['cliente_id'],
+                'nome': linha['cliente__nome'],
+                'cpf_cnpj': linha['cliente__cpf_cnpj'],
+            },
+            'processos_abertos': [],
+        })
+        if linha['abertos__id']:
+            veiculo['processos_abertos'].append({
+                'id': linha['abertos__id'],
+                'numero': linha['abertos__numero_atendimento'] or '',
+                'servico': linha['abertos__servico'],
+                'status': linha['abertos__status'],
+            })
+
+    return {
+        'encontradas': {chave: encontradas[chave] for chave in chaves if chave in encontradas},
+        'novas': [chave for chave in chaves if chave not in encontradas],
+        'invalidas': invalidas,
+    }
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from cadastro.models import Despachante
+from cadastro.arquivo import arquivar, DIAS_PADRAO, LOTE_PADRAO
+
+
+class Command(BaseCommand):
+    help = 'Move para o arquivo os processos finalizados (aprovados e pagos, ou cancelados) antigos e os logs deles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--despachante', type=int, help='ID do escritório (padrão: todos)')
+        parser.add_argument('--dias', type=int, default=DIAS_PADRAO, help=f'Idade mínima do processo, pela data de solicitação (padrão: {DIAS_PADRAO})')
+        parser.add_argument('--lote', type=int, default=LOTE_PADRAO, help=f'Processos movidos por transação (padrão: {LOTE_PADRAO})')
+
+    def handle(self, *args, **options):
+        despachantes = Despachante.objects.all()
+        if options['despachante']:
+            despachantes = despachantes.filter(id=options['despachante'])
+
+        total = 0
+        for despachante in despachantes:
+            def progresso(movidos):
+                self.stdout.write(f"   > {movidos} processos arquivados...")
+
+            movidos = arquivar(despachante.id, options['dias'], options['lote'], progresso)
+            if movidos:
+                self.stdout.write(f"📦 {despachante.nome_fantasia}: {movidos} processos arquivados.")
+            total += movidos
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} processos arquivados."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from cadastro.models import Despachante
+from cadastro.deduplicacao import deduplicar, LIMIAR_PADRAO, GRUPOS_POR_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Encontra e mescla clientes duplicados (mesmo documento, ou mesmo nome sem documento e com telefone/e-mail em comum), por escritório'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--despachante', type=int, help='ID do escritório (padrão: todos)')
+        parser.add_argument('--limiar', type=float, default=LIMIAR_PADRAO, help=f'Nota mínima do par, de 0 a 1 (padrão: {LIMIAR_PADRAO})')
+        parser.add_argument('--lote', type=int, default=GRUPOS_POR_LOTE, help=f'Grupos mesclados por transação (padrão: {GRUPOS_POR_LOTE})')
+        parser.add_argument('--simular', action='store_true', help='Só lista os grupos encontrados, sem mesclar')
+
+    def handle(self, *args, **options):
+        despachantes = Despachante.objects.all()
+        if options['despachante']:
+            despachantes = despachantes.filter(id=options['despachante'])
+
+        total = 0
+        for despachante in despachantes:
+            def progresso(resultado):
+                self.stdout.write(f"   > {resultado['mesclados']} cadastros mesclados...")
+
+            resultado = deduplicar(
+                despachante.id, options['limiar'], options['lote'], options['simular'], progresso
+            )
+            if not resultado['grupos']:
+                continue
+
+            self.stdout.write(f"🔎 {despachante.nome_fantasia}: {len(resultado['grupos'])} grupos de duplicados.")
+            if options['simular']:
+                for grupo in resultado['grupos'][:50]:
+                    self.stdout.write(f"   - clientes {', '.join(map(str, grupo))}")
+            total += resultado['mesclados']
+
+        if options['simular']:
+            self.stdout.write(self.style.WARNING("Simulação: nada foi alterado."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {total} cadastros duplicados mesclados."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from cadastro.models import Despachante
+from cadastro.importacao import importar, ArquivoInvalido, pasta_relatorios, TAMANHO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Importa clientes e veículos de uma planilha (.csv ou .xlsx) para um escritório'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .xlsx')
+        parser.add_argument('--despachante', type=int, required=True, help='ID do escritório')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help=f'Linhas gravadas por vez (padrão: {TAMANHO_LOTE})')
+
+    def handle(self, *args, **options):
+        try:
+            despachante = Despachante.objects.get(id=options['despachante'])
+        except Despachante.DoesNotExist:
+            raise CommandError(f"Escritório {options['despachante']} não encontrado.")
+
+        def progresso(resultado):
+            self.stdout.write(f"   > {resultado['linhas']} linhas lidas, {resultado['erros']} com erro...")
+
+        self.stdout.write(f"📥 Importando para {despachante.nome_fantasia}...")
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar(despachante, arquivo, options['arquivo'], options['lote'], progresso)
+        except (OSError, ArquivoInvalido) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Clientes: {resultado['clientes_criados']} novos, {resultado['clientes_atualizados']} atualizados. "
+            f"Veículos: {resultado['veiculos_criados']} novos, {resultado['veiculos_atualizados']} atualizados."
+        ))
+        if resultado['relatorio']:
+            caminho = pasta_relatorios(despachante.id) / resultado['relatorio']
+            self.stdout.write(self.style.WARNING(f"⚠️ {resultado['erros']} linhas com erro. Relatório: {caminho}"))
@@ -0,0 +1,53 @@
+import time
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Só faz sentido com as sessões no banco (SESSION_ENGINE db ou cached_db, ver
+# config/settings.py). Com o padrão signed_cookies a sessão fica no cookie, a
+# tabela não recebe nada e a expiração é conferida na assinatura.
+ENGINES_COM_TABELA = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga sessões expiradas da tabela django_session em lotes (sem travar a tabela). '
+        'Só para SESSION_ENGINE db/cached_db: com sessão no cookie não há o que apagar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Sessões apagadas por vez (padrão: 1000)')
+        parser.add_argument('--pausa', type=float, default=0.2, help='Segundos de espera entre os lotes (padrão: 0.2)')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE not in ENGINES_COM_TABELA:
+            self.stdout.write(self.style.WARNING(
+                f"Sessões em {settings.SESSION_ENGINE}: nada a limpar no banco."
+            ))
+            return
+
+        lote = options['lote']
+        agora = timezone.now()
+        total = 0
+
+        while True:
+            chaves = list(
+                Session.objects.filter(expire_date__lt=agora)
+                .values_list('session_key', flat=True)[:lote]
+            )
+            if not chaves:
+                break
+
+            apagadas, _ = Session.objects.filter(session_key__in=chaves).delete()
+            total += apagadas
+            self.stdout.write(f"   > {total} sessões apagadas...")
+
+            if len(chaves) < lote:
+                break
+            time.sleep(options['pausa'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Limpeza concluída: {total} sessões expiradas removidas."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from cadastro.models import Despachante
+from cadastro import contadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores do dashboard (processos em aberto e do mês)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--despachante', type=int, help='ID do escritório (padrão: todos)')
+
+    def handle(self, *args, **options):
+        despachantes = Despachante.objects.all()
+        if options['despachante']:
+            despachantes = despachantes.filter(id=options['despachante'])
+
+        for despachante in despachantes:
+            contadores.zerar(despachante.id)
+            abertos = contadores.total_abertos(despachante)
+            mes = contadores.total_mes(despachante)
+            self.stdout.write(f"   > {despachante.nome_fantasia}: {abertos} em aberto, {mes} no mês.")
+
+        self.stdout.write(self.style.SUCCESS("✅ Contadores recalculados."))
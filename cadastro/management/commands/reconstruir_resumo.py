@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from cadastro.models import Despachante
+from cadastro import resumo, versoes
+
+
+class Command(BaseCommand):
+    help = 'Refaz o resumo diário dos relatórios financeiros a partir dos processos (ativos e arquivados)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--despachante', type=int, help='ID do escritório (padrão: todos)')
+
+    def handle(self, *args, **options):
+        despachantes = Despachante.objects.all()
+        if options['despachante']:
+            despachantes = despachantes.filter(id=options['despachante'])
+
+        for despachante in despachantes:
+            total = resumo.reconstruir(despachante.id)
+            versoes.tocar(despachante.id)
+            self.stdout.write(f"   > {despachante.nome_fantasia}: {total} linhas no resumo.")
+
+        self.stdout.write(self.style.SUCCESS("✅ Resumo diário reconstruído."))
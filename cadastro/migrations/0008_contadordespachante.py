@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0007_perfilusuario_precisa_mudar_senha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorDespachante',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=30)),
+                ('valor', models.IntegerField(default=0)),
+                ('despachante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores', to='cadastro.despachante')),
+            ],
+            options={
+                'verbose_name': 'Contador do Dashboard',
+                'verbose_name_plural': 'Contadores do Dashboard',
+                'unique_together': {('despachante', 'chave')},
+            },
+        ),
+    ]
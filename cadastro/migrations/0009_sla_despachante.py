@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0008_contadordespachante'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despachante',
+            name='sla_dias_alerta',
+            field=models.PositiveSmallIntegerField(default=15, help_text='Processo sem prazo de entrega entra em ALERTA após estes dias.', verbose_name='Alerta após (dias na fila)'),
+        ),
+        migrations.AddField(
+            model_name='despachante',
+            name='sla_dias_atraso',
+            field=models.PositiveSmallIntegerField(default=30, help_text='Processo sem prazo de entrega fica ATRASADO após estes dias.', verbose_name='Atrasado após (dias na fila)'),
+        ),
+        migrations.AddField(
+            model_name='despachante',
+            name='sla_dias_aviso_prazo',
+            field=models.PositiveSmallIntegerField(default=2, help_text='Processo com prazo de entrega entra em ALERTA quando faltarem estes dias ou menos.', verbose_name='Aviso antes do prazo (dias)'),
+        ),
+        migrations.AddIndex(
+            model_name='atendimento',
+            index=models.Index(fields=['despachante', 'data_entrega'], name='cadastro_at_despach_bb61e8_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 6.0 on 2026-10-18 15:14
+
+from django.db import migrations, models
+from cadastro.normalizacao import so_digitos, chave_placa
+
+
+def preencher_chaves(apps, schema_editor):
+    # Modelos históricos não têm o save() do app: calcula aqui e grava em lotes
+    Cliente = apps.get_model('cadastro', 'Cliente')
+    Veiculo = apps.get_model('cadastro', 'Veiculo')
+
+    lote = []
+    for cliente in Cliente.objects.only('id', 'cpf_cnpj', 'telefone').iterator(chunk_size=2000):
+        cliente.documento_busca = so_digitos(cliente.cpf_cnpj)
+        cliente.telefone_busca = so_digitos(cliente.telefone)
+        lote.append(cliente)
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['documento_busca', 'telefone_busca'])
+            lote = []
+    Cliente.objects.bulk_update(lote, ['documento_busca', 'telefone_busca'])
+
+    lote = []
+    for veiculo in Veiculo.objects.only('id', 'placa').iterator(chunk_size=2000):
+        veiculo.placa_busca = chave_placa(veiculo.placa)
+        lote.append(veiculo)
+        if len(lote) >= 2000:
+            Veiculo.objects.bulk_update(lote, ['placa_busca'])
+            lote = []
+    Veiculo.objects.bulk_update(lote, ['placa_busca'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0009_sla_despachante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='documento_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=18),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='veiculo',
+            name='placa_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=7),
+        ),
+        migrations.RunPython(preencher_chaves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['despachante', 'documento_busca'], name='cliente_documento_busca_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['despachante', 'telefone_busca'], name='cliente_telefone_busca_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['despachante', 'placa_busca'], name='veiculo_placa_busca_idx', opclasses=['int8_ops', 'varchar_pattern_ops']),
+        ),
+    ]
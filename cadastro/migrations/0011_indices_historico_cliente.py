@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0010_chaves_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='atendimento',
+            index=models.Index(fields=['cliente', 'data_solicitacao'], name='cadastro_at_cliente_c315bf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logatividade',
+            index=models.Index(fields=['cliente', 'data'], name='cadastro_lo_cliente_452675_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orcamento',
+            index=models.Index(fields=['cliente', 'data_criacao'], name='cadastro_or_cliente_4756a1_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 6.0 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0011_indices_historico_cliente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtendimentoArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('numero_atendimento', models.CharField(blank=True, max_length=50, null=True)),
+                ('token_rastreio', models.UUIDField(editable=False, unique=True)),
+                ('servico', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('SOLICITADO', 'Solicitado'), ('EM_ANALISE', 'Em Análise'), ('PENDENTE', 'Pendente (Com Pendência)'), ('APROVADO', 'Aprovado/Concluído'), ('CANCELADO', 'Cancelado')], max_length=20)),
+                ('observacoes_internas', models.TextField(blank=True, null=True)),
+                ('motivo_pendencia', models.TextField(blank=True, null=True)),
+                ('valor_taxas_detran', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('valor_honorarios', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('quem_pagou_detran', models.CharField(choices=[('DESPACHANTE', 'Escritório Pagou (Reembolsável)'), ('CLIENTE', 'Cliente Pagou por Fora')], default='DESPACHANTE', max_length=20)),
+                ('custo_impostos', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('custo_taxa_bancaria', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('custo_taxa_sindego', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('status_financeiro', models.CharField(choices=[('ABERTO', 'Aguardando Pagamento'), ('PAGO', 'Totalmente Pago')], max_length=15)),
+                ('data_pagamento', models.DateField(blank=True, null=True)),
+                ('asaas_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('data_solicitacao', models.DateField()),
+                ('data_entrega', models.DateField(blank=True, null=True)),
+                ('data_arquivamento', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cadastro.cliente')),
+                ('despachante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cadastro.despachante')),
+                ('responsavel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('tipo_servico', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cadastro.tiposervico')),
+                ('veiculo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='cadastro.veiculo')),
+            ],
+            options={
+                'verbose_name': 'Atendimento Arquivado',
+                'verbose_name_plural': 'Atendimentos Arquivados',
+                'ordering': ['-data_solicitacao'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LogAtividadeArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('acao', models.CharField(choices=[('CRIACAO', 'Criação'), ('EDICAO', 'Edição'), ('EXCLUSAO', 'Exclusão'), ('LOGIN', 'Login'), ('FINANCEIRO', 'Financeiro'), ('STATUS', 'Mudança de Status')], max_length=20)),
+                ('descricao', models.TextField()),
+                ('data', models.DateTimeField()),
+                ('atendimento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='logs', to='cadastro.atendimentoarquivado')),
+                ('cliente', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='cadastro.cliente')),
+                ('despachante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cadastro.despachante')),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Log Arquivado',
+                'verbose_name_plural': 'Logs Arquivados',
+                'ordering': ['-data'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='atendimentoarquivado',
+            index=models.Index(fields=['despachante', 'data_solicitacao'], name='cadastro_at_despach_c594a4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atendimentoarquivado',
+            index=models.Index(fields=['cliente', 'data_solicitacao'], name='cadastro_at_cliente_b99ed1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logatividadearquivado',
+            index=models.Index(fields=['cliente', 'data'], name='cadastro_lo_cliente_45c74c_idx'),
+        ),
+    ]
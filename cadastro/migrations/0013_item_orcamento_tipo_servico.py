@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 15:29
+
+from collections import defaultdict
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def vincular_catalogo(apps, schema_editor):
+    # Itens antigos só têm o nome: liga ao serviço do catálogo do mesmo escritório com o mesmo nome
+    TipoServico = apps.get_model('cadastro', 'TipoServico')
+    ItemOrcamento = apps.get_model('cadastro', 'ItemOrcamento')
+
+    catalogo = {}
+    for servico_id, despachante_id, nome in TipoServico.objects.order_by('-id').values_list('id', 'despachante_id', 'nome'):
+        catalogo[(despachante_id, nome.strip().casefold())] = servico_id  # Nomes repetidos: fica o mais antigo
+
+    por_servico = defaultdict(list)
+    itens = ItemOrcamento.objects.values_list('id', 'orcamento__despachante_id', 'servico_nome')
+    for item_id, despachante_id, nome in itens.iterator(chunk_size=2000):
+        servico_id = catalogo.get((despachante_id, (nome or '').strip().casefold()))
+        if servico_id:
+            por_servico[servico_id].append(item_id)
+
+    for servico_id, ids in por_servico.items():
+        for inicio in range(0, len(ids), 2000):
+            ItemOrcamento.objects.filter(id__in=ids[inicio:inicio + 2000]).update(tipo_servico_id=servico_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0012_arquivo_processos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemorcamento',
+            name='tipo_servico',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='itens_orcamento', to='cadastro.tiposervico'),
+        ),
+        migrations.RunPython(vincular_catalogo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 15:33
+
+from collections import defaultdict
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def preencher_resumo(apps, schema_editor):
+    # Mesma conta de cadastro/resumo.py:reconstruir, com os modelos históricos
+    ResumoDiario = apps.get_model('cadastro', 'ResumoDiario')
+    origem = {
+        'soma_taxas': 'valor_taxas_detran',
+        'soma_honorarios': 'valor_honorarios',
+        'soma_impostos': 'custo_impostos',
+        'soma_bancario': 'custo_taxa_bancaria',
+        'soma_sindego': 'custo_taxa_sindego',
+    }
+
+    linhas = defaultdict(lambda: dict(quantidade=0, **{campo: 0 for campo in origem}))
+    for nome_modelo in ('Atendimento', 'AtendimentoArquivado'):
+        grupos = (
+            apps.get_model('cadastro', nome_modelo).objects
+            .values('despachante_id', 'data_solicitacao', 'status', 'status_financeiro')
+            .annotate(quantidade=Count('id'), **{campo: Sum(coluna) for campo, coluna in origem.items()})
+            .order_by()
+        )
+        for grupo in grupos:
+            linha = linhas[(grupo['despachante_id'], grupo['data_solicitacao'], grupo['status'], grupo['status_financeiro'])]
+            for campo in linha:
+                linha[campo] += grupo[campo] or 0
+
+    ResumoDiario.objects.bulk_create([
+        ResumoDiario(despachante_id=despachante_id, data=data, status=status, status_financeiro=status_financeiro, **valores)
+        for (despachante_id, data, status, status_financeiro), valores in linhas.items()
+        if data
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cadastro', '0013_item_orcamento_tipo_servico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('status_financeiro', models.CharField(max_length=15)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('soma_taxas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('soma_honorarios', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('soma_impostos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('soma_bancario', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('soma_sindego', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('despachante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_diarios', to='cadastro.despachante')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário',
+                'verbose_name_plural': 'Resumos Diários',
+                'unique_together': {('despachante', 'data', 'status', 'status_financeiro')},
+            },
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
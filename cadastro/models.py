@@ -3,6 +3,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import FileExtensionValidator
+from .normalizacao import so_digitos, chave_placa
+from . import precificacao
 
 # ==============================================================================
 # 1. CADASTRO DO ESCRITÓRIO (SaaS)
@@ -74,6 +76,22 @@ class Despachante(models.Model):
         help_text="Valor cobrado em processos específicos."
     )
 
+    # --- PRAZOS DA FILA (SLA) ---
+    # Processo SEM prazo de entrega: conta os dias desde a solicitação
+    sla_dias_alerta = models.PositiveSmallIntegerField(
+        default=15, verbose_name="Alerta após (dias na fila)",
+        help_text="Processo sem prazo de entrega entra em ALERTA após estes dias."
+    )
+    sla_dias_atraso = models.PositiveSmallIntegerField(
+        default=30, verbose_name="Atrasado após (dias na fila)",
+        help_text="Processo sem prazo de entrega fica ATRASADO após estes dias."
+    )
+    # Processo COM prazo de entrega: conta os dias que faltam
+    sla_dias_aviso_prazo = models.PositiveSmallIntegerField(
+        default=2, verbose_name="Aviso antes do prazo (dias)",
+        help_text="Processo com prazo de entrega entra em ALERTA quando faltarem estes dias ou menos."
+    )
+
     # --- CAMPOS DO SISTEMA (SUA COBRANÇA DE MENSALIDADE) ---
     email_fatura = models.EmailField(
         blank=True, null=True,
@@ -193,6 +211,12 @@ class Cliente(models.Model):
     telefone = models.CharField(max_length=20)
     email = models.EmailField(blank=True, null=True)
 
+    # Chaves de busca só com dígitos (ver cadastro/normalizacao.py), mantidas pelo save()
+    documento_busca = models.CharField(max_length=18, blank=True, default='', editable=False)
+    telefone_busca = models.CharField(max_length=20, blank=True, default='', editable=False)
+
+    CAMPOS_BUSCA = ('documento_busca', 'telefone_busca')
+
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
@@ -200,11 +224,32 @@ class Cliente(models.Model):
         indexes = [
             models.Index(fields=['despachante', 'nome']),
             models.Index(fields=['despachante', 'cpf_cnpj']),
+            # varchar_pattern_ops: no PostgreSQL o "LIKE 'x%'" só usa o índice com essa opclass
+            models.Index(
+                fields=['despachante', 'documento_busca'], name='cliente_documento_busca_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+            ),
+            models.Index(
+                fields=['despachante', 'telefone_busca'], name='cliente_telefone_busca_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+            ),
         ]
 
     def __str__(self):
         return self.nome
 
+    def atualizar_chaves_busca(self):
+        """Recalcula as chaves normalizadas. Quem grava com bulk_create/bulk_update chama direto."""
+        self.documento_busca = so_digitos(self.cpf_cnpj)
+        self.telefone_busca = so_digitos(self.telefone)
+
+    def save(self, *args, **kwargs):
+        self.atualizar_chaves_busca()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.CAMPOS_BUSCA}
+        super().save(*args, **kwargs)
+
 
 class Veiculo(models.Model):
     despachante = models.ForeignKey(Despachante, on_delete=models.CASCADE)
@@ -248,6 +293,11 @@ class Veiculo(models.Model):
         verbose_name="Telefone do Proprietário"
     )
 
+    # Placa só com letras e números, em maiúsculas (ver cadastro/normalizacao.py), mantida pelo save()
+    placa_busca = models.CharField(max_length=7, blank=True, default='', editable=False)
+
+    CAMPOS_BUSCA = ('placa_busca',)
+
     class Meta:
         unique_together = ('despachante', 'placa')
         verbose_name = "Veículo"
@@ -255,11 +305,26 @@ class Veiculo(models.Model):
         indexes = [
             models.Index(fields=['despachante', 'placa']),
             models.Index(fields=['cliente']),
+            models.Index(
+                fields=['despachante', 'placa_busca'], name='veiculo_placa_busca_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+            ),
         ]
 
     def __str__(self):
         return f"{self.placa} - {self.modelo}"
 
+    def atualizar_chaves_busca(self):
+        """Recalcula a placa normalizada. Quem grava com bulk_create/bulk_update chama direto."""
+        self.placa_busca = chave_placa(self.placa)
+
+    def save(self, *args, **kwargs):
+        self.atualizar_chaves_busca()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.CAMPOS_BUSCA}
+        super().save(*args, **kwargs)
+
 
 class TipoServico(models.Model):
     despachante = models.ForeignKey(Despachante, on_delete=models.CASCADE)
@@ -398,37 +463,21 @@ class Atendimento(models.Model):
         indexes = [
             models.Index(fields=['despachante', 'status']),
             models.Index(fields=['despachante', 'data_solicitacao']),
+            models.Index(fields=['despachante', 'data_entrega']),
             models.Index(fields=['despachante', 'status_financeiro']),
             models.Index(fields=['tipo_servico']),
             models.Index(fields=['veiculo']),
             models.Index(fields=['token_rastreio']), 
+            models.Index(fields=['cliente', 'data_solicitacao']),
         ]
 
     def __str__(self):
         return f"{self.numero_atendimento or 'S/N'} - {self.cliente}"
 
     def save(self, *args, **kwargs):
+        # Nome, valores e taxa sindical do catálogo quando vieram vazios (cadastro/precificacao.py)
         if self.tipo_servico:
-            # Preenche o nome do serviço se estiver vazio
-            if not self.servico:
-                self.servico = self.tipo_servico.nome
-            
-            # Preenche honorários se estiver vazio
-            if self.pk is None or self.valor_honorarios == 0:
-                self.valor_honorarios = self.tipo_servico.honorarios
-            
-            # Preenche valor base se estiver vazio
-            if self.pk is None or self.valor_taxas_detran == 0:
-                self.valor_taxas_detran = self.tipo_servico.valor_base
-            
-            # Calcula taxa sindical se ainda for 0
-            if self.custo_taxa_sindego == 0:
-                if self.tipo_servico.isenta_taxa_sindego:
-                    self.custo_taxa_sindego = 0.00
-                elif self.tipo_servico.usa_taxa_sindego_reduzida:
-                    self.custo_taxa_sindego = self.despachante.valor_taxa_sindego_reduzida
-                else:
-                    self.custo_taxa_sindego = self.despachante.valor_taxa_sindego_padrao
+            precificacao.preencher_do_catalogo(self, self.despachante)
 
         super().save(*args, **kwargs)
 
@@ -442,6 +491,53 @@ class Atendimento(models.Model):
         return self.valor_honorarios - custos
 
 
+class ContadorDespachante(models.Model):
+    """
+    Contadores do dashboard (processos em aberto, processos do mês).
+    Mantidos pelos signals do Atendimento, para o dashboard ler em O(1).
+    Também guarda a sequência dos eventos da fila ('fila_eventos', cadastro/eventos.py).
+    """
+    despachante = models.ForeignKey(Despachante, on_delete=models.CASCADE, related_name='contadores')
+    chave = models.CharField(max_length=30)  # Ex: 'abertos', 'mes_2026_01'
+    valor = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Contador do Dashboard"
+        verbose_name_plural = "Contadores do Dashboard"
+        unique_together = ('despachante', 'chave')
+
+    def __str__(self):
+        return f"{self.despachante} - {self.chave}: {self.valor}"
+
+
+class ResumoDiario(models.Model):
+    """
+    Totais dos processos por dia de solicitação, status e situação financeira.
+    Mantido pelos signals do Atendimento (cadastro/resumo.py), para os relatórios
+    financeiros somarem poucas linhas em vez de varrer os processos.
+    Inclui os processos já arquivados.
+    """
+    despachante = models.ForeignKey(Despachante, on_delete=models.CASCADE, related_name='resumos_diarios')
+    data = models.DateField()
+    status = models.CharField(max_length=20)
+    status_financeiro = models.CharField(max_length=15)
+
+    quantidade = models.IntegerField(default=0)
+    soma_taxas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    soma_honorarios = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    soma_impostos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    soma_bancario = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    soma_sindego = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário"
+        verbose_name_plural = "Resumos Diários"
+        unique_together = ('despachante', 'data', 'status', 'status_financeiro')
+
+    def __str__(self):
+        return f"{self.despachante} - {self.data} {self.status}/{self.status_financeiro}: {self.quantidade}"
+
+
 # ==============================================================================
 # 5. COMERCIAL (ORÇAMENTOS)
 # ==============================================================================
@@ -477,6 +573,7 @@ class Orcamento(models.Model):
         ordering = ['-data_criacao']
         indexes = [
             models.Index(fields=['despachante', 'status']),
+            models.Index(fields=['cliente', 'data_criacao']),
         ]
 
     def __str__(self):
@@ -491,6 +588,17 @@ class Orcamento(models.Model):
 
 class ItemOrcamento(models.Model):
     orcamento = models.ForeignKey(Orcamento, related_name='itens', on_delete=models.CASCADE)
+
+    # --- VÍNCULO COM O CATÁLOGO (taxa sindical na aprovação) ---
+    tipo_servico = models.ForeignKey(
+        TipoServico,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='itens_orcamento'
+    )
+
+    # Snapshot: nome do serviço quando o orçamento foi feito (não muda se o catálogo mudar)
     servico_nome = models.CharField(max_length=200)
     
     valor = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor da Taxa")
@@ -528,6 +636,7 @@ class LogAtividade(models.Model):
         indexes = [
             models.Index(fields=['despachante', 'data']),
             models.Index(fields=['atendimento']),
+            models.Index(fields=['cliente', 'data']),
         ]
 
     def __str__(self):
@@ -560,4 +669,91 @@ class BaseConhecimento(models.Model):
 
     class Meta:
         verbose_name = "Manual do Detran (IA)"
-        verbose_name_plural = "Manual do Detran (IA)"
\ No newline at end of file
+        verbose_name_plural = "Manual do Detran (IA)"
+
+# ==============================================================================
+# 8. ARQUIVO (PROCESSOS FINALIZADOS ANTIGOS)
+# ==============================================================================
+# Cópia fiel dos processos finalizados (aprovados e pagos, ou cancelados) e dos
+# logs deles, movidos pelo cadastro/arquivo.py para fora das tabelas do dia a dia.
+# Guardam o mesmo id do original. Não têm signals: nada aqui entra em contador,
+# fila ou versão de página.
+
+class AtendimentoArquivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # Mesmo id que tinha em Atendimento
+
+    despachante = models.ForeignKey(Despachante, on_delete=models.CASCADE)
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
+    veiculo = models.ForeignKey(Veiculo, on_delete=models.SET_NULL, null=True, blank=True)
+    responsavel = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    tipo_servico = models.ForeignKey(TipoServico, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    numero_atendimento = models.CharField(max_length=50, blank=True, null=True)
+    token_rastreio = models.UUIDField(unique=True, editable=False)
+    servico = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=Atendimento.STATUS_CHOICES)
+
+    observacoes_internas = models.TextField(blank=True, null=True)
+    motivo_pendencia = models.TextField(blank=True, null=True)
+
+    valor_taxas_detran = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    valor_honorarios = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    quem_pagou_detran = models.CharField(max_length=20, choices=Atendimento.PAGADOR_DETRAN_CHOICES, default='DESPACHANTE')
+    custo_impostos = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    custo_taxa_bancaria = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    custo_taxa_sindego = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    status_financeiro = models.CharField(max_length=15, choices=Atendimento.STATUS_FINANCEIRO)
+    data_pagamento = models.DateField(null=True, blank=True)
+    asaas_id = models.CharField(max_length=255, blank=True, null=True)
+
+    data_solicitacao = models.DateField()
+    data_entrega = models.DateField(null=True, blank=True)
+    data_arquivamento = models.DateTimeField(auto_now_add=True)
+
+    # Os templates usam para esconder as ações que só valem para processos ativos (editar, baixa...)
+    arquivado = True
+
+    class Meta:
+        verbose_name = "Atendimento Arquivado"
+        verbose_name_plural = "Atendimentos Arquivados"
+        ordering = ['-data_solicitacao']
+        indexes = [
+            models.Index(fields=['despachante', 'data_solicitacao']),
+            models.Index(fields=['cliente', 'data_solicitacao']),
+        ]
+
+    def __str__(self):
+        return f"{self.numero_atendimento or 'S/N'} - {self.cliente} (arquivado)"
+
+    @property
+    def valor_total_cliente(self):
+        return self.valor_taxas_detran + self.valor_honorarios
+
+    @property
+    def lucro_liquido_real(self):
+        custos = self.custo_impostos + self.custo_taxa_bancaria + self.custo_taxa_sindego
+        return self.valor_honorarios - custos
+
+
+class LogAtividadeArquivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # Mesmo id que tinha em LogAtividade
+
+    despachante = models.ForeignKey(Despachante, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    atendimento = models.ForeignKey(AtendimentoArquivado, on_delete=models.CASCADE, related_name='logs')
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, null=True, blank=True)
+
+    acao = models.CharField(max_length=20, choices=LogAtividade.ACAO_CHOICES)
+    descricao = models.TextField()
+    data = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Log Arquivado"
+        verbose_name_plural = "Logs Arquivados"
+        ordering = ['-data']
+        indexes = [
+            models.Index(fields=['cliente', 'data']),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario} - {self.acao} - {self.data} (arquivado)"
@@ -0,0 +1,92 @@
+# cadastro/normalizacao.py
+
+import re
+from django.db.models import Q
+
+# ==============================================================================
+# CHAVES NORMALIZADAS DE BUSCA (CPF/CNPJ, TELEFONE, PLACA)
+# ==============================================================================
+# Os campos digitados guardam a formatação do usuário ("123.456.789-00",
+# "(62) 99999-8888", "abc-1d23"). Cliente e Veículo mantêm uma cópia normalizada
+# (documento_busca, telefone_busca, placa_busca) atualizada no save(), com índice
+# (despachante, chave). Quando o termo parece documento/telefone ou placa, a busca
+# vira um prefixo na chave normalizada ("LIKE 'x%'" usa o índice) em vez de um
+# icontains que varre a tabela e não acha o valor se a pontuação for diferente.
+
+_NAO_DIGITO = re.compile(r'\D')
+_NAO_ALFANUMERICO = re.compile(r'[^0-9A-Za-z]')
+
+# Só dígitos e a pontuação de máscaras de CPF/CNPJ/telefone
+_PARECE_DOCUMENTO = re.compile(r'^[\d\s.\-/()+]+$')
+MIN_DIGITOS_DOCUMENTO = 3
+
+# Placa antiga (ABC1234) ou Mercosul (ABC1D23), completa ou só o começo: pelo menos "ABC1"
+_PARECE_PLACA = re.compile(r'^[A-Z]{3}[0-9]([A-Z0-9][0-9]{0,2})?$')
+
+
+def so_digitos(valor):
+    """'123.456.789-00' -> '12345678900'"""
+    return _NAO_DIGITO.sub('', valor or '')
+
+
+def chave_placa(valor):
+    """'abc-1d23' -> 'ABC1D23'"""
+    return _NAO_ALFANUMERICO.sub('', valor or '').upper()
+
+
+def parece_documento(termo):
+    """CPF, CNPJ ou telefone (inteiro ou parcial, com ou sem máscara)."""
+    termo = (termo or '').strip()
+    return bool(_PARECE_DOCUMENTO.match(termo)) and len(so_digitos(termo)) >= MIN_DIGITOS_DOCUMENTO
+
+
+def parece_placa(termo):
+    return bool(_PARECE_PLACA.match(chave_placa(termo)))
+
+
+# Placa completa: antiga (ABC1234) ou Mercosul (ABC1D23)
+_PLACA_COMPLETA = re.compile(r'^[A-Z]{3}[0-9][A-Z0-9][0-9]{2}$')
+
+
+def placa_valida(chave):
+    """Recebe a placa já normalizada (chave_placa)."""
+    return bool(_PLACA_COMPLETA.match(chave or ''))
+
+
+def filtro_busca(termo, texto=(), documento=(), placa=(), sempre=()):
+    """
+    Monta o Q de uma caixa de busca.
+      texto:     campos comparados com icontains quando o termo não tem atalho (nome, modelo...)
+      documento: chaves só-dígitos (documento_busca, telefone_busca) comparadas por prefixo
+      placa:     chaves de placa (placa_busca) comparadas por prefixo
+      sempre:    campos comparados com icontains em qualquer caso (nº do atendimento...)
+    """
+    termo = (termo or '').strip()
+    filtro = Q()
+    if documento and parece_documento(termo):
+        digitos = so_digitos(termo)
+        for campo in documento:
+            filtro |= Q(**{f'{campo}__startswith': digitos})
+    elif placa and parece_placa(termo):
+        chave = chave_placa(termo)
+        for campo in placa:
+            filtro |= Q(**{f'{campo}__startswith': chave})
+    else:
+        for campo in texto:
+            filtro |= Q(**{f'{campo}__icontains': termo})
+
+    for campo in sempre:
+        filtro |= Q(**{f'{campo}__icontains': termo})
+    return filtro
+
+
+def filtro_veiculo(termo):
+    """Busca dentro da frota de um cliente: começo da placa, renavam (só dígitos) ou parte do modelo."""
+    termo = (termo or '').strip()
+    filtro = Q(modelo__icontains=termo)
+    chave = chave_placa(termo)
+    if chave:
+        filtro |= Q(placa_busca__startswith=chave)
+    if chave.isdigit():
+        filtro |= Q(renavam__startswith=chave)
+    return filtro
@@ -0,0 +1,193 @@
+# cadastro/paginacao.py
+
+import json
+import base64
+from datetime import date, datetime
+from django.core.paginator import Paginator
+from django.db.models import Q, Value
+
+# ==============================================================================
+# PAGINAÇÃO POR CURSOR (KEYSET)
+# ==============================================================================
+# Em vez de "OFFSET 5000 LIMIT 50" (que lê e descarta 5000 linhas) e de um
+# COUNT(*) sobre a busca inteira, a próxima página é pedida a partir da última
+# linha vista: WHERE (data, id) > (ultima_data, ultimo_id) LIMIT 51.
+# O custo de cada página é o mesmo, seja a página 1 ou a 200.
+#
+# Os campos da ordenação precisam ser NOT NULL e terminar em um campo único
+# (normalmente o 'id'), senão linhas podem ser puladas.
+
+
+def _codificar(direcao, valores):
+    valores = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in valores]
+    bruto = json.dumps({'d': direcao, 'v': valores}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor, qtd_campos):
+    """Retorna (direcao, valores) ou None se o cursor for inválido/adulterado."""
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+        direcao, valores = dados['d'], dados['v']
+    except (ValueError, TypeError, KeyError):
+        return None
+    if direcao not in ('a', 'b') or not isinstance(valores, list) or len(valores) != qtd_campos:
+        return None
+    return direcao, valores
+
+
+def _condicao_apos(campos, valores):
+    """
+    Monta a comparação lexicográfica (f1, f2, ...) > (v1, v2, ...)
+    respeitando a direção de cada campo ('-campo' = decrescente).
+    """
+    condicao = Q()
+    igualdades = {}
+    for campo, valor in zip(campos, valores):
+        nome = campo.lstrip('-')
+        lookup = 'lt' if campo.startswith('-') else 'gt'
+        condicao |= Q(**igualdades, **{f"{nome}__{lookup}": valor})
+        igualdades[nome] = valor
+    return condicao
+
+
+def _inverter(campos):
+    return [c[1:] if c.startswith('-') else f"-{c}" for c in campos]
+
+
+def _valor(obj, nome):
+    # Aceita instâncias e também as linhas de um .values() (dict)
+    return obj[nome] if isinstance(obj, dict) else getattr(obj, nome)
+
+
+def _ordem_no_banco(consulta, ordenacao):
+    """
+    Campos anotados com um valor fixo na consulta (ex: o nível de cada faixa de
+    urgência, cadastro/sla.py) não mudam a ordem dentro dela: ficam de fora do
+    ORDER BY, que assim pode seguir um índice. Só contam ao juntar as consultas.
+    """
+    anotacoes = consulta.query.annotations
+    return [campo for campo in ordenacao if not isinstance(anotacoes.get(campo.lstrip('-')), Value)]
+
+
+def _primeiros(consultas, condicao, ordenacao, limite):
+    """
+    As 'limite' primeiras linhas na ordenação. Com mais de uma consulta (ex:
+    processos + arquivo), busca 'limite' de cada e junta em memória.
+    """
+    itens = []
+    for consulta in consultas:
+        if condicao is not None:
+            consulta = consulta.filter(condicao)
+        itens.extend(consulta.order_by(*_ordem_no_banco(consulta, ordenacao))[:limite])
+    if len(consultas) > 1:
+        # Ordenação estável, do último campo para o primeiro
+        for campo in reversed(ordenacao):
+            itens.sort(key=lambda obj: _valor(obj, campo.lstrip('-')), reverse=campo.startswith('-'))
+    return itens[:limite]
+
+
+class PaginaCursor:
+    """Página de resultados navegada por cursor. Não tem número nem total de páginas."""
+    modo_cursor = True
+
+    def __init__(self, object_list, ordenacao, tem_proxima, tem_anterior, parametros=None):
+        self.object_list = object_list
+        self.ordenacao = ordenacao
+        self.tem_proxima = tem_proxima
+        self.tem_anterior = tem_anterior
+        self.parametros = parametros
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    def has_next(self):
+        return self.tem_proxima
+
+    def has_previous(self):
+        return self.tem_anterior
+
+    def has_other_pages(self):
+        return self.tem_proxima or self.tem_anterior
+
+    def _valores(self, obj):
+        return [_valor(obj, campo.lstrip('-')) for campo in self.ordenacao]
+
+    @property
+    def next_cursor(self):
+        if not self.tem_proxima:
+            return None
+        return _codificar('a', self._valores(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.tem_anterior:
+            return None
+        return _codificar('b', self._valores(self.object_list[0]))
+
+    def _querystring(self, cursor):
+        parametros = self.parametros.copy() if self.parametros is not None else None
+        if parametros is None:
+            return f"cursor={cursor}"
+        parametros.pop('page', None)
+        parametros['cursor'] = cursor
+        return parametros.urlencode()
+
+    @property
+    def querystring_proxima(self):
+        """Query string da próxima página (mantém os filtros atuais)."""
+        return self._querystring(self.next_cursor)
+
+    @property
+    def querystring_anterior(self):
+        return self._querystring(self.previous_cursor)
+
+
+def paginar_por_cursor(queryset, cursor, por_pagina, ordenacao, parametros=None):
+    """
+    Retorna uma PaginaCursor com até 'por_pagina' itens.
+    ordenacao: lista de campos no formato do order_by, ex: ['-data_solicitacao', '-id'].
+    queryset pode ser uma lista de querysets com os mesmos campos de ordenação.
+    """
+    consultas = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+    decodificado = _decodificar(cursor, len(ordenacao)) if cursor else None
+
+    if decodificado is None:
+        itens = _primeiros(consultas, None, ordenacao, por_pagina + 1)
+        return PaginaCursor(itens[:por_pagina], ordenacao, len(itens) > por_pagina, False, parametros)
+
+    direcao, valores = decodificado
+
+    if direcao == 'a':
+        itens = _primeiros(consultas, _condicao_apos(ordenacao, valores), ordenacao, por_pagina + 1)
+        return PaginaCursor(itens[:por_pagina], ordenacao, len(itens) > por_pagina, True, parametros)
+
+    # Página anterior: anda na ordem inversa e desvira o resultado
+    invertida = _inverter(ordenacao)
+    itens = _primeiros(consultas, _condicao_apos(invertida, valores), invertida, por_pagina + 1)
+    tem_anterior = len(itens) > por_pagina
+    itens = itens[:por_pagina]
+    itens.reverse()
+    return PaginaCursor(itens, ordenacao, True, tem_anterior, parametros)
+
+
+def paginar(request, queryset, por_pagina, ordenacao):
+    """
+    Paginação padrão das listagens grandes: por cursor.
+    Links antigos com '?page=N' continuam funcionando com o Paginator clássico
+    (só com um queryset; uma lista de vários, como processos + arquivo, é sempre por cursor).
+    """
+    if isinstance(queryset, (list, tuple)) and len(queryset) == 1:
+        queryset = queryset[0]
+    numero_pagina = request.GET.get('page')
+    if numero_pagina and 'cursor' not in request.GET and not isinstance(queryset, (list, tuple)):
+        return Paginator(queryset.order_by(*ordenacao), por_pagina).get_page(numero_pagina)
+
+    return paginar_por_cursor(queryset, request.GET.get('cursor'), por_pagina, ordenacao, request.GET)
@@ -0,0 +1,113 @@
+# cadastro/precificacao.py
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Round
+
+# ==============================================================================
+# PRECIFICAÇÃO DOS PROCESSOS (CUSTOS SOBRE CADA ATENDIMENTO)
+# ==============================================================================
+# Regra única, usada por todo caminho que grava valores num Atendimento
+# (novo/editar processo, cadastro rápido, aprovação de orçamento, Atendimento.save):
+#   imposto        = honorários x alíquota do escritório
+#   taxa bancária  = (taxas DETRAN + honorários) x taxa bancária do escritório
+#                    (o cliente paga tudo pelo banco/maquininha)
+#   taxa sindical  = fixa por serviço: isento, reduzida ou padrão (serviço avulso: padrão)
+# Valores em centavos, arredondados meio para cima (mesmo resultado do Round do banco).
+#
+# Quando o escritório muda a alíquota ou a taxa bancária, recalcular_em_aberto()
+# reaplica a regra a todos os processos ainda não pagos e não cancelados num
+# UPDATE só (e refaz o resumo diário dos relatórios, cadastro/resumo.py).
+# Pagos e cancelados ficam com os custos da época.
+
+CENTAVO = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def dinheiro(valor):
+    """Decimal com 2 casas: aceita Decimal, float, str ou None."""
+    return Decimal(str(valor or 0)).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def _percentual(valor):
+    return Decimal(str(valor or 0)) / 100
+
+
+def taxa_sindego(despachante, tipo_servico=None):
+    """Taxa sindical de um serviço do catálogo (None = serviço avulso, cobra a padrão)."""
+    if tipo_servico is not None:
+        if tipo_servico.isenta_taxa_sindego:
+            return ZERO
+        if tipo_servico.usa_taxa_sindego_reduzida:
+            return dinheiro(despachante.valor_taxa_sindego_reduzida)
+    return dinheiro(despachante.valor_taxa_sindego_padrao)
+
+
+def custo_impostos(despachante, honorarios):
+    return dinheiro(Decimal(str(honorarios or 0)) * _percentual(despachante.aliquota_imposto))
+
+
+def custo_bancario(despachante, taxas, honorarios):
+    total_transacao = Decimal(str(taxas or 0)) + Decimal(str(honorarios or 0))
+    return dinheiro(total_transacao * _percentual(despachante.taxa_bancaria_padrao))
+
+
+def preencher_do_catalogo(atendimento, despachante):
+    """
+    Completa com o serviço do catálogo o que veio vazio (nome, taxas, honorários)
+    e a taxa sindical, se ainda estiver zerada. Valores digitados são mantidos.
+    """
+    tipo = atendimento.tipo_servico
+    if tipo is None:
+        return
+    if not atendimento.servico:
+        atendimento.servico = tipo.nome
+    if not atendimento.valor_taxas_detran:
+        atendimento.valor_taxas_detran = tipo.valor_base
+    if not atendimento.valor_honorarios:
+        atendimento.valor_honorarios = tipo.honorarios
+    if not atendimento.custo_taxa_sindego:
+        atendimento.custo_taxa_sindego = taxa_sindego(despachante, tipo)
+
+
+def aplicar_custos(atendimento, despachante):
+    """Recalcula imposto e taxa bancária a partir das taxas e honorários atuais do processo."""
+    atendimento.custo_impostos = custo_impostos(despachante, atendimento.valor_honorarios)
+    atendimento.custo_taxa_bancaria = custo_bancario(
+        despachante, atendimento.valor_taxas_detran, atendimento.valor_honorarios
+    )
+
+
+def precificar(atendimento, despachante):
+    """Catálogo + custos: o caminho completo para um processo novo ou editado."""
+    preencher_do_catalogo(atendimento, despachante)
+    aplicar_custos(atendimento, despachante)
+
+
+def recalcular_em_aberto(despachante):
+    """
+    Reaplica imposto e taxa bancária a todos os processos do escritório ainda
+    não pagos (e não cancelados), num UPDATE ... SET com a conta feita no banco.
+    Retorna quantos mudaram.
+    """
+    from .models import Atendimento  # models usa este módulo no save()
+    from . import versoes, resumo
+
+    dinheiro_db = DecimalField(max_digits=10, decimal_places=2)
+    aliquota = Value(_percentual(despachante.aliquota_imposto), output_field=DecimalField())
+    taxa_bancaria = Value(_percentual(despachante.taxa_bancaria_padrao), output_field=DecimalField())
+
+    em_aberto = Atendimento.objects.filter(despachante=despachante, status_financeiro='ABERTO').exclude(status='CANCELADO')
+    alterados = em_aberto.update(
+        custo_impostos=Round(
+            ExpressionWrapper(F('valor_honorarios') * aliquota, output_field=dinheiro_db), 2
+        ),
+        custo_taxa_bancaria=Round(
+            ExpressionWrapper((F('valor_taxas_detran') + F('valor_honorarios')) * taxa_bancaria, output_field=dinheiro_db), 2
+        ),
+    )
+    # UPDATE em massa não dispara signals
+    if alterados:
+        resumo.reconstruir(despachante.id)
+    versoes.tocar(despachante.id)
+    return alterados
@@ -0,0 +1,252 @@
+# cadastro/resumo.py
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from .models import Atendimento, AtendimentoArquivado, ResumoDiario
+from .contadores import como_data
+from . import versoes
+
+# ==============================================================================
+# RESUMO DIÁRIO DOS PROCESSOS (TABELA DE FATOS DOS RELATÓRIOS FINANCEIROS)
+# ==============================================================================
+# Uma linha por (escritório, dia de solicitação, status, situação financeira)
+# com a quantidade de processos e as somas de taxas, honorários, impostos,
+# taxa bancária e sindicato. Um ano de um escritório são no máximo algumas
+# centenas de linhas; os relatórios somam essas linhas em vez dos processos.
+#
+# Manutenção incremental, como os contadores do dashboard: o post_init guarda
+# a contribuição original do processo e o post_save/post_delete aplicam a
+# diferença (UPDATE ... SET soma = soma + delta). Gravações em massa chamam
+# ajustar() direto; reconstruir() refaz tudo a partir dos processos (comando
+# reconstruir_resumo). Os processos arquivados continuam contando aqui.
+
+CAMPOS_SOMA = ('soma_taxas', 'soma_honorarios', 'soma_impostos', 'soma_bancario', 'soma_sindego')
+CAMPOS = ('quantidade',) + CAMPOS_SOMA
+
+# Campo do Atendimento -> campo somado no resumo
+ORIGEM = {
+    'soma_taxas': 'valor_taxas_detran',
+    'soma_honorarios': 'valor_honorarios',
+    'soma_impostos': 'custo_impostos',
+    'soma_bancario': 'custo_taxa_bancaria',
+    'soma_sindego': 'custo_taxa_sindego',
+}
+CAMPOS_PROCESSO = ('data_solicitacao', 'status', 'status_financeiro') + tuple(ORIGEM.values())
+
+
+def _decimal(valor):
+    return Decimal(str(valor or 0))
+
+
+def estado(dados):
+    """
+    Contribuição de um processo: ((data, status, status_financeiro), (1, taxas, ...)).
+    'dados' é o __dict__ da instância ou uma linha de .values(). None se faltar algum campo (.only/.defer).
+    """
+    if any(campo not in dados for campo in CAMPOS_PROCESSO):
+        return None
+    chave = (como_data(dados['data_solicitacao']), dados['status'], dados['status_financeiro'])
+    return chave, (1,) + tuple(_decimal(dados[ORIGEM[campo]]) for campo in CAMPOS_SOMA)
+
+
+def estado_no_banco(atendimento_id):
+    linha = Atendimento.objects.filter(id=atendimento_id).values(*CAMPOS_PROCESSO).first()
+    return estado(linha) if linha else None
+
+
+def diferenca(antes, depois):
+    """Deltas {chave: vetor} para sair do estado 'antes' e chegar em 'depois' (qualquer um pode ser None)."""
+    deltas = defaultdict(lambda: [0] * len(CAMPOS))
+    for contribuicao, sinal in ((antes, -1), (depois, 1)):
+        if contribuicao:
+            chave, vetor = contribuicao
+            deltas[chave] = [atual + sinal * valor for atual, valor in zip(deltas[chave], vetor)]
+    return {chave: vetor for chave, vetor in deltas.items() if any(vetor)}
+
+
+def somar(contribuicoes, sinal=1):
+    """Deltas de várias contribuições de uma vez (bulk_create, exclusão em massa)."""
+    deltas = defaultdict(lambda: [0] * len(CAMPOS))
+    for chave, vetor in contribuicoes:
+        deltas[chave] = [atual + sinal * valor for atual, valor in zip(deltas[chave], vetor)]
+    return deltas
+
+
+def ajustar(despachante_id, deltas):
+    """Aplica {(data, status, status_financeiro): [qtd, taxas, ...]} nas linhas do resumo."""
+    for (data, status, status_financeiro), vetor in deltas.items():
+        if not data or not any(vetor):
+            continue
+        filtro = dict(despachante_id=despachante_id, data=data, status=status, status_financeiro=status_financeiro)
+        incrementos = {campo: F(campo) + valor for campo, valor in zip(CAMPOS, vetor) if valor}
+        if ResumoDiario.objects.filter(**filtro).update(**incrementos):
+            continue
+        try:
+            with transaction.atomic():
+                ResumoDiario.objects.create(**filtro, **dict(zip(CAMPOS, vetor)))
+        except IntegrityError:
+            # Outro processo criou a linha entre o UPDATE e o INSERT
+            ResumoDiario.objects.filter(**filtro).update(**incrementos)
+
+
+def _agrupar(consulta):
+    """Contribuições [(chave, vetor)] de um queryset de processos, agrupado no banco."""
+    agregacoes = {campo: Sum(ORIGEM[campo]) for campo in CAMPOS_SOMA}
+    grupos = (
+        consulta.values('data_solicitacao', 'status', 'status_financeiro')
+        .annotate(quantidade=Count('id'), **agregacoes)
+        .order_by()
+    )
+    return [
+        (
+            (grupo['data_solicitacao'], grupo['status'], grupo['status_financeiro']),
+            [grupo['quantidade']] + [_decimal(grupo[campo]) for campo in CAMPOS_SOMA],
+        )
+        for grupo in grupos
+    ]
+
+
+def retirar_arquivados_do_cliente(cliente):
+    """
+    A exclusão do cliente apaga os processos arquivados dele sem signals
+    (a tabela do arquivo não tem): tira a contribuição deles antes.
+    """
+    contribuicoes = _agrupar(AtendimentoArquivado.objects.filter(cliente_id=cliente.id))
+    if contribuicoes:
+        ajustar(cliente.despachante_id, somar(contribuicoes, sinal=-1))
+
+
+def reconstruir(despachante_id):
+    """Refaz o resumo do escritório a partir dos processos (ativos e arquivados). Retorna o nº de linhas."""
+    deltas = somar(
+        contribuicao
+        for modelo in (Atendimento, AtendimentoArquivado)
+        for contribuicao in _agrupar(modelo.objects.filter(despachante_id=despachante_id))
+    )
+
+    with transaction.atomic():
+        ResumoDiario.objects.filter(despachante_id=despachante_id).delete()
+        ResumoDiario.objects.bulk_create([
+            ResumoDiario(
+                despachante_id=despachante_id, data=data, status=status, status_financeiro=status_financeiro,
+                **dict(zip(CAMPOS, vetor))
+            )
+            for (data, status, status_financeiro), vetor in deltas.items()
+            if vetor[0]
+        ], batch_size=1000)
+    return len(deltas)
+
+
+# ------------------------------------------------------------------------------
+# LEITURA (RELATÓRIOS)
+# ------------------------------------------------------------------------------
+
+def linhas(despachante_id, inicio=None, fim=None, **filtros):
+    """Linhas do resumo do escritório no período (datas inclusivas) com filtros extras do ORM."""
+    consulta = ResumoDiario.objects.filter(despachante_id=despachante_id, **filtros)
+    if inicio:
+        consulta = consulta.filter(data__gte=inicio)
+    if fim:
+        consulta = consulta.filter(data__lte=fim)
+    return consulta
+
+
+def totais(consulta):
+    """Quantidade, somas e quantos estão aguardando pagamento, numa consulta só."""
+    zero = Value(Decimal('0.00'))
+    # O aggregate não aceita apelido igual ao nome do campo: soma como 'total_*' e devolve sem o prefixo
+    resultado = consulta.aggregate(
+        total_quantidade=Coalesce(Sum('quantidade'), 0),
+        total_quantidade_aberto=Coalesce(Sum('quantidade', filter=Q(status_financeiro='ABERTO')), 0),
+        **{f'total_{campo}': Coalesce(Sum(campo), zero) for campo in CAMPOS_SOMA},
+    )
+    return {chave.removeprefix('total_'): valor for chave, valor in resultado.items()}
+
+
+def contagem_por_status(consulta):
+    """[{'status': ..., 'total': n}] como o values('status').annotate(Count) sobre os processos."""
+    return list(
+        consulta.values('status').annotate(total=Sum('quantidade')).filter(total__gt=0).order_by('status')
+    )
+
+
+# ------------------------------------------------------------------------------
+# SÉRIE DO DASHBOARD FINANCEIRO (MÊS A MÊS OU SEMANA A SEMANA)
+# ------------------------------------------------------------------------------
+# Um GROUP BY só sobre o resumo, com as somas condicionais de cada período;
+# os períodos sem processo entram zerados aqui no Python. Vale para qualquer
+# intervalo, inclusive de vários anos (jan/2025 e jan/2026 são barras diferentes).
+# Fica no cache até a próxima alteração de dados do escritório.
+
+VALIDADE_SERIE = 60 * 60 * 24
+TRUNCAR = {'mes': TruncMonth, 'semana': TruncWeek}
+MESES = ('Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez')
+CAMPOS_SERIE = ('taxas', 'honorarios', 'impostos', 'bancario', 'sindego', 'receita', 'custos', 'lucro', 'pendentes')
+
+
+def inicio_do_periodo(dia, periodo):
+    if periodo == 'semana':
+        return dia - timedelta(days=dia.weekday())  # TruncWeek: segunda-feira
+    return dia.replace(day=1)
+
+
+def proximo_periodo(inicio, periodo):
+    if periodo == 'semana':
+        return inicio + timedelta(days=7)
+    return (inicio + timedelta(days=32)).replace(day=1)
+
+
+def rotulo_periodo(inicio, periodo):
+    if periodo == 'semana':
+        return inicio.strftime('%d/%m/%y')
+    return f"{MESES[inicio.month - 1]}/{inicio:%y}"
+
+
+def _montar_serie(despachante_id, inicio, fim, periodo):
+    custos = F('soma_impostos') + F('soma_bancario') + F('soma_sindego')
+    grupos = (
+        linhas(despachante_id, inicio, fim, status='APROVADO')
+        .annotate(periodo=TRUNCAR[periodo]('data'))
+        .values('periodo')
+        .annotate(
+            taxas=Sum('soma_taxas'),
+            honorarios=Sum('soma_honorarios'),
+            impostos=Sum('soma_impostos'),
+            bancario=Sum('soma_bancario'),
+            sindego=Sum('soma_sindego'),
+            receita=Sum(F('soma_taxas') + F('soma_honorarios')),
+            custos=Sum(custos),
+            lucro=Sum(F('soma_honorarios') - custos),
+            pendentes=Coalesce(Sum('quantidade', filter=Q(status_financeiro='ABERTO')), 0),
+        )
+        .order_by('periodo')
+    )
+    por_periodo = {como_data(grupo.pop('periodo')): grupo for grupo in grupos}
+
+    pontos, atual = [], inicio_do_periodo(inicio, periodo)
+    while atual <= fim:
+        grupo = por_periodo.get(atual, {})
+        ponto = {campo: grupo.get(campo) or (0 if campo == 'pendentes' else Decimal('0.00')) for campo in CAMPOS_SERIE}
+        pontos.append({'inicio': atual, 'rotulo': rotulo_periodo(atual, periodo), **ponto})
+        atual = proximo_periodo(atual, periodo)
+
+    totais_serie = {campo: sum((ponto[campo] for ponto in pontos), 0) for campo in CAMPOS_SERIE}
+    return {'periodo': periodo, 'pontos': pontos, 'totais': totais_serie}
+
+
+def serie_financeira(despachante_id, inicio, fim, periodo='mes'):
+    """
+    Pontos do gráfico (processos APROVADOS entre inicio e fim, datas inclusivas)
+    e os totais do intervalo: {'periodo', 'pontos': [{inicio, rotulo, receita, ...}], 'totais'}.
+    """
+    chave = f"serie_financeira_{despachante_id}_{periodo}_{inicio}_{fim}_{versoes.carimbo(despachante_id)}"
+    serie = cache.get(chave)
+    if serie is None:
+        serie = _montar_serie(despachante_id, inicio, fim, periodo)
+        cache.set(chave, serie, VALIDADE_SERIE)
+    return serie
@@ -0,0 +1,60 @@
+# cadastro/sessoes.py
+
+import secrets
+from config.cache import cache_estado
+from .models import PerfilUsuario
+
+# ==============================================================================
+# SESSÃO ÚNICA POR USUÁRIO (SEM TABELA DE SESSÕES)
+# ==============================================================================
+# Cada login gera um token novo, que vai para a sessão do navegador e para o
+# cache de estado ("token ativo" do usuário; config/cache.py: não é descartado
+# quando o cache lota). O SessaoUnicaMiddleware derruba qualquer sessão cujo
+# token não seja mais o ativo, ou seja, o login anterior. O token também fica
+# em PerfilUsuario.ultimo_session_key, para o caso de o cache ser limpo.
+
+CHAVE_SESSAO = 'sessao_token'
+
+
+def _chave_cache(user_id):
+    return f"sessao_ativa_{user_id}"
+
+
+def _gravar_token(user_id, token):
+    cache_estado.set(_chave_cache(user_id), token, None)
+    # Uma escrita só no login/logout, nunca por request
+    PerfilUsuario.objects.filter(user_id=user_id).update(ultimo_session_key=token)
+
+
+def iniciar_sessao_unica(request, user):
+    """Chamado no login (signal user_logged_in): este passa a ser o único acesso válido do usuário."""
+    token = secrets.token_hex(16)
+    request.session[CHAVE_SESSAO] = token
+    _gravar_token(user.id, token)
+
+
+def encerrar_sessoes(user):
+    """Invalida todas as sessões do usuário (usado no logout)."""
+    _gravar_token(user.id, secrets.token_hex(16))
+
+
+def token_ativo(user, perfil=None):
+    """
+    Token da sessão válida do usuário. Se o cache perdeu a chave, usa o
+    valor do perfil (já carregado pelo TenantMiddleware) e reaquece o cache.
+    """
+    token = cache_estado.get(_chave_cache(user.id))
+    if token is None and perfil is not None and perfil.ultimo_session_key:
+        token = perfil.ultimo_session_key
+        cache_estado.set(_chave_cache(user.id), token, None)
+    return token
+
+
+def sessao_valida(request):
+    """False se outro login mais recente desse usuário derrubou esta sessão."""
+    tenant = getattr(request, 'tenant', None)
+    ativo = token_ativo(request.user, tenant.perfil if tenant else None)
+    if not ativo:
+        # Usuário sem login registrado por este fluxo (ex: superusuário antigo)
+        return True
+    return request.session.get(CHAVE_SESSAO) == ativo
@@ -1,20 +1,278 @@
 # cadastro/signals.py
 
-from django.db.models.signals import post_save, post_delete
+from collections import Counter
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
-from django.core.cache import cache
-from .models import Atendimento
+from .models import Atendimento, Cliente, Veiculo, Orcamento, ItemOrcamento, Despachante, LogAtividade
+from . import contadores, versoes, eventos, autocompletar, resumo
+from .tenant import invalidar_acesso
+from .sessoes import iniciar_sessao_unica, encerrar_sessoes
+
+CAMPOS_CONTADOR = ('status', 'data_solicitacao')
+
+
+def _estado_contador(instance):
+    """Chaves de contador do processo, ou None se os campos não foram carregados (.only/.defer)."""
+    if any(campo not in instance.__dict__ for campo in CAMPOS_CONTADOR):
+        return None
+    return contadores.chaves_do_atendimento(instance.status, instance.data_solicitacao)
+
+
+@receiver(post_init, sender=Atendimento)
+def guardar_estado_original(sender, instance, **kwargs):
+    """
+    Guarda o estado do processo como veio do banco, para que o post_save
+    saiba qual foi a transição de status/mês sem precisar consultar de novo.
+    """
+    instance._contador_original = _estado_contador(instance) if instance.pk else []
+    instance._status_original = instance.__dict__.get('status') if instance.pk else None
+    instance._resumo_original = resumo.estado(instance.__dict__) if instance.pk else None
+
+
+@receiver(post_save, sender=Atendimento)
+def atualizar_contadores_ao_salvar(sender, instance, created, **kwargs):
+    """
+    Atualiza os contadores do dashboard pela transição de status
+    (ex: SOLICITADO -> APROVADO tira 1 de 'abertos').
+    """
+    if not instance.despachante_id:
+        return
+
+    antes = [] if created else getattr(instance, '_contador_original', None)
+    depois = _estado_contador(instance)
+
+    if antes is None or depois is None:
+        # Não sabemos o estado anterior: recontamos na próxima leitura
+        contadores.zerar(instance.despachante_id)
+    else:
+        deltas = Counter(depois)
+        deltas.subtract(antes)
+        contadores.ajustar(instance.despachante_id, deltas)
+
+    instance._contador_original = depois
+
+
+@receiver(post_delete, sender=Atendimento)
+def atualizar_contadores_ao_excluir(sender, instance, **kwargs):
+    if not instance.despachante_id:
+        return
+
+    antes = getattr(instance, '_contador_original', None)
+    if antes is None:
+        contadores.zerar(instance.despachante_id)
+        return
+
+    contadores.ajustar(instance.despachante_id, {chave: -1 for chave in antes})
+
+
+# ==============================================================================
+# RESUMO DIÁRIO (RELATÓRIOS FINANCEIROS)
+# ==============================================================================
+
+@receiver([pre_save, pre_delete], sender=Atendimento)
+def carregar_resumo_original(sender, instance, **kwargs):
+    # Instância carregada com .only()/.defer(): busca no banco como o processo estava
+    if instance.pk and not instance._state.adding and getattr(instance, '_resumo_original', None) is None:
+        instance._resumo_original = resumo.estado_no_banco(instance.pk)
+
+
+@receiver(post_save, sender=Atendimento)
+def atualizar_resumo_ao_salvar(sender, instance, created, **kwargs):
+    if not instance.despachante_id:
+        return
+    antes = None if created else instance._resumo_original
+    depois = resumo.estado(instance.__dict__) or resumo.estado_no_banco(instance.pk)
+    resumo.ajustar(instance.despachante_id, resumo.diferenca(antes, depois))
+    instance._resumo_original = depois
+
+
+@receiver(post_delete, sender=Atendimento)
+def atualizar_resumo_ao_excluir(sender, instance, **kwargs):
+    if not instance.despachante_id:
+        return
+    antes = getattr(instance, '_resumo_original', None)
+    resumo.ajustar(instance.despachante_id, resumo.diferenca(antes, None))
+
+
+@receiver(pre_delete, sender=Cliente)
+def atualizar_resumo_ao_excluir_cliente(sender, instance, **kwargs):
+    resumo.retirar_arquivados_do_cliente(instance)
+
+
+# ==============================================================================
+# EVENTOS DA FILA (DASHBOARD AO VIVO)
+# ==============================================================================
+
+def _dados_evento(instance):
+    return {
+        'id': instance.id,
+        'numero': instance.numero_atendimento,
+        'status': instance.status,
+        'status_display': instance.get_status_display(),
+        'finalizado': instance.status in contadores.STATUS_FINALIZADOS,
+    }
+
+
+@receiver(post_save, sender=Atendimento)
+def publicar_evento_ao_salvar(sender, instance, created, **kwargs):
+    """Publica 'criado' ou 'status' (só quando o status realmente mudou)."""
+    if not instance.despachante_id or 'status' not in instance.__dict__:
+        return
+
+    if created:
+        tipo = 'criado'
+    elif instance._status_original != instance.status:
+        tipo = 'status'
+    else:
+        return
+
+    instance._status_original = instance.status
+    despachante_id, dados = instance.despachante_id, _dados_evento(instance)
+    # Só avisa os outros usuários depois que a transação gravou de fato
+    transaction.on_commit(lambda: eventos.publicar(despachante_id, tipo, **dados))
+
+
+@receiver(post_delete, sender=Atendimento)
+def publicar_evento_ao_excluir(sender, instance, **kwargs):
+    if not instance.despachante_id:
+        return
+    despachante_id, processo_id = instance.despachante_id, instance.id
+    transaction.on_commit(lambda: eventos.publicar(despachante_id, 'excluido', id=processo_id))
+
+
+def atendimentos_criados_em_lote(despachante_id, atendimentos):
+    """
+    O bulk_create não dispara post_init/post_save: aplica de uma vez o que os
+    receivers acima fariam para cada processo novo (contadores e eventos).
+    """
+    deltas = Counter()
+    contribuicoes = []
+    for atendimento in atendimentos:
+        chaves = _estado_contador(atendimento)
+        deltas.update(chaves)
+        atendimento._contador_original = chaves
+        atendimento._status_original = atendimento.status
+        atendimento._resumo_original = resumo.estado(atendimento.__dict__)
+        contribuicoes.append(atendimento._resumo_original)
+    contadores.ajustar(despachante_id, deltas)
+    resumo.ajustar(despachante_id, resumo.somar(contribuicoes))
+    versoes.tocar(despachante_id)
+    for cliente_id in {atendimento.cliente_id for atendimento in atendimentos}:
+        versoes.tocar_cliente(cliente_id)
+
+    dados = [_dados_evento(atendimento) for atendimento in atendimentos]
+
+    def publicar():
+        for item in dados:
+            eventos.publicar(despachante_id, 'criado', **item)
+    transaction.on_commit(publicar)
+
+
+def atendimentos_arquivados(despachante_id, processos):
+    """
+    O arquivamento apaga os processos sem signals (cadastro/arquivo.py): tira
+    dos contadores e renova as versões como o post_delete faria. Não publica
+    'excluido' na fila: processo finalizado não aparece nela, e não mexe no
+    resumo diário: os relatórios continuam contando os arquivados.
+    processos: [(cliente_id, status, data_solicitacao), ...]
+    """
+    deltas = Counter()
+    for _, status, data_solicitacao in processos:
+        deltas.subtract(contadores.chaves_do_atendimento(status, data_solicitacao))
+    contadores.ajustar(despachante_id, deltas)
+    versoes.tocar(despachante_id)
+    for cliente_id in {cliente_id for cliente_id, _, _ in processos}:
+        versoes.tocar_cliente(cliente_id)
+
+
+# ==============================================================================
+# VERSÃO DOS DADOS (ETag das listagens e cache de fragmentos)
+# ==============================================================================
 
 @receiver([post_save, post_delete], sender=Atendimento)
-def limpar_cache_dashboard(sender, instance, **kwargs):
-    """
-    Sempre que um processo é salvo ou excluído, limpa o cache 
-    do escritório dono desse processo para recalcular os totais.
-    """
-    if instance.despachante:
-        despachante_id = instance.despachante.id
-        cache_key = f"dashboard_stats_{despachante_id}"
-        
-        # Apaga a memória antiga
-        cache.delete(cache_key)
-        # print(f"Cache limpo para despachante {despachante_id}")
\ No newline at end of file
+@receiver([post_save, post_delete], sender=Cliente)
+@receiver([post_save, post_delete], sender=Veiculo)
+@receiver([post_save, post_delete], sender=Orcamento)
+def renovar_versao_dados(sender, instance, **kwargs):
+    versoes.tocar(instance.despachante_id)
+
+
+@receiver([post_save, post_delete], sender=Atendimento)
+@receiver([post_save, post_delete], sender=Orcamento)
+def renovar_versao_cliente(sender, instance, **kwargs):
+    # Histórico da ficha do cliente (cadastro/historico.py)
+    versoes.tocar_cliente(instance.cliente_id)
+
+
+@receiver(post_save, sender=LogAtividade)
+def renovar_versao_cliente_log(sender, instance, created, **kwargs):
+    # Só os registros ligados a um cliente aparecem em alguma página (o histórico da ficha)
+    if created and instance.cliente_id:
+        versoes.tocar_cliente(instance.cliente_id)
+        versoes.tocar(instance.despachante_id)
+
+
+@receiver([post_save, post_delete], sender=ItemOrcamento)
+def renovar_versao_dados_item(sender, instance, **kwargs):
+    # O orçamento já vem em cache na maioria dos casos (criado junto com o item)
+    try:
+        versoes.tocar(instance.orcamento.despachante_id)
+    except Orcamento.DoesNotExist:
+        pass  # Exclusão em cascata: o próprio orçamento já renova a versão
+
+
+# ==============================================================================
+# ÍNDICE DO AUTOCOMPLETE DE CLIENTES
+# ==============================================================================
+
+@receiver(post_save, sender=Cliente)
+def autocompletar_cliente_salvo(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocompletar.cliente_salvo(instance))
+
+
+@receiver(post_delete, sender=Cliente)
+def autocompletar_cliente_excluido(sender, instance, **kwargs):
+    # O delete() zera o id da instância: guarda antes do commit
+    despachante_id, cliente_id = instance.despachante_id, instance.id
+    transaction.on_commit(lambda: autocompletar.cliente_excluido(despachante_id, cliente_id))
+
+
+@receiver(post_save, sender=Veiculo)
+def autocompletar_veiculo_salvo(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocompletar.veiculo_salvo(instance))
+
+
+@receiver(post_delete, sender=Veiculo)
+def autocompletar_veiculo_excluido(sender, instance, **kwargs):
+    despachante_id, veiculo_id = instance.despachante_id, instance.id
+    transaction.on_commit(lambda: autocompletar.veiculo_excluido(despachante_id, veiculo_id))
+
+
+@receiver(post_save, sender=Despachante)
+def invalidar_cache_acesso(sender, instance, **kwargs):
+    """
+    Renovações (webhook do Asaas, ações do admin, acao_liberar_acesso) salvam o
+    Despachante: descarta a situação da assinatura guardada no cache.
+    Os prazos da fila (sla_dias_*) e os avisos mudam as páginas: renova a versão.
+    """
+    invalidar_acesso(instance.id)
+    versoes.tocar(instance.id)
+
+
+@receiver(user_logged_in)
+def iniciar_sessao_ao_entrar(sender, request, user, **kwargs):
+    """Vale para qualquer login (tela própria, admin, troca de usuário): derruba o acesso anterior."""
+    if request is not None and hasattr(request, 'session'):
+        iniciar_sessao_unica(request, user)
+
+
+@receiver(user_logged_out)
+def encerrar_sessoes_ao_sair(sender, request, user, **kwargs):
+    """
+    Com a sessão guardada no cookie, um cookie copiado continuaria valendo
+    depois do logout: trocar o token ativo invalida qualquer cópia.
+    """
+    if user is not None:
+        encerrar_sessoes(user)
@@ -0,0 +1,89 @@
+# cadastro/sla.py
+
+from datetime import timedelta
+from django.db.models import Case, When, Value, IntegerField, Q
+from django.utils import timezone
+
+# ==============================================================================
+# URGÊNCIA DOS PROCESSOS (CALCULADA NO BANCO)
+# ==============================================================================
+# Com prazo de entrega: ATRASADO se o prazo passou, ALERTA se faltam
+# 'sla_dias_aviso_prazo' dias ou menos.
+# Sem prazo de entrega: ATRASADO/ALERTA conforme os dias desde a solicitação
+# ('sla_dias_atraso' / 'sla_dias_alerta' do escritório).
+#
+# As condições são faixas de data_entrega/data_solicitacao, então os filtros
+# usam os índices (despachante, data_entrega) e (despachante, data_solicitacao).
+# A ordenação por urgência também: em vez de ordenar pelo Case (sem índice),
+# consultas_por_urgencia() faz uma consulta por faixa, ordenada só por
+# data_solicitacao/id, e a paginação por cursor junta as três.
+
+URGENCIA_OK = 0
+URGENCIA_ALERTA = 1
+URGENCIA_ATRASADO = 2
+
+# Valor do filtro na URL (?urgencia=...) -> nível
+FILTROS_URGENCIA = {
+    'atrasado': URGENCIA_ATRASADO,
+    'vence_logo': URGENCIA_ALERTA,
+    'ok': URGENCIA_OK,
+}
+
+# Mais urgentes primeiro; entre iguais, o mais antigo na fila
+ORDENACAO_URGENCIA = ['-urgencia', 'data_solicitacao', 'id']
+NIVEIS = (URGENCIA_ATRASADO, URGENCIA_ALERTA, URGENCIA_OK)
+
+
+def _condicoes(despachante, hoje):
+    """Q de cada nível. As três faixas não se sobrepõem."""
+    limite_aviso = hoje + timedelta(days=despachante.sla_dias_aviso_prazo)
+    limite_atraso = hoje - timedelta(days=despachante.sla_dias_atraso)
+    limite_alerta = hoje - timedelta(days=despachante.sla_dias_alerta)
+
+    sem_prazo = Q(data_entrega__isnull=True)
+    return {
+        URGENCIA_ATRASADO: (
+            Q(data_entrega__lt=hoje)
+            | sem_prazo & Q(data_solicitacao__lte=limite_atraso)
+        ),
+        URGENCIA_ALERTA: (
+            Q(data_entrega__gte=hoje, data_entrega__lte=limite_aviso)
+            | sem_prazo & Q(data_solicitacao__gt=limite_atraso, data_solicitacao__lte=limite_alerta)
+        ),
+        URGENCIA_OK: (
+            Q(data_entrega__gt=limite_aviso)
+            | sem_prazo & Q(data_solicitacao__gt=max(limite_alerta, limite_atraso))
+        ),
+    }
+
+
+def anotar_urgencia(queryset, despachante, hoje=None):
+    """Adiciona 'urgencia' (0 = ok, 1 = alerta, 2 = atrasado) a cada processo."""
+    condicoes = _condicoes(despachante, hoje or timezone.now().date())
+    return queryset.annotate(urgencia=Case(
+        When(condicoes[URGENCIA_ATRASADO], then=Value(URGENCIA_ATRASADO)),
+        When(condicoes[URGENCIA_ALERTA], then=Value(URGENCIA_ALERTA)),
+        default=Value(URGENCIA_OK),
+        output_field=IntegerField(),
+    ))
+
+
+def filtrar_urgencia(queryset, despachante, filtro, hoje=None):
+    """Aplica o filtro da URL ('atrasado', 'vence_logo', 'ok'). Valor desconhecido é ignorado."""
+    nivel = FILTROS_URGENCIA.get(filtro)
+    if nivel is None:
+        return queryset
+    return queryset.filter(_condicoes(despachante, hoje or timezone.now().date())[nivel])
+
+
+def consultas_por_urgencia(queryset, despachante, hoje=None):
+    """
+    Uma consulta por nível, com 'urgencia' fixa em cada uma, para paginar com
+    ORDENACAO_URGENCIA (paginacao.paginar aceita a lista). Dentro de cada faixa
+    o banco ordena só por data_solicitacao/id, pelo índice.
+    """
+    condicoes = _condicoes(despachante, hoje or timezone.now().date())
+    return [
+        queryset.filter(condicoes[nivel]).annotate(urgencia=Value(nivel, output_field=IntegerField()))
+        for nivel in NIVEIS
+    ]
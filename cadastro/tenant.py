@@ -0,0 +1,99 @@
+# cadastro/tenant.py
+
+from datetime import datetime, time, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from .models import PerfilUsuario
+
+# Hierarquia dos planos: BASICO (1) < MEDIO (2) < PREMIUM (3)
+NIVEIS_PLANO = {
+    'BASICO': 1,
+    'MEDIO': 2,
+    'PREMIUM': 3
+}
+
+
+class Tenant:
+    """
+    Contexto do escritório do usuário logado (request.tenant).
+    Carregado uma única vez por request pelo TenantMiddleware, já com
+    plano, papel e situação da assinatura calculados.
+    """
+
+    def __init__(self, user, perfil):
+        self.user = user
+        self.perfil = perfil
+        self.despachante = perfil.despachante if perfil else None
+
+        self.is_superuser = user.is_superuser
+        self.tipo_usuario = perfil.tipo_usuario if perfil else None
+        self.is_admin = self.is_superuser or self.tipo_usuario == 'ADMIN'
+
+        self.plano = self.despachante.plano if self.despachante else None
+        self.nivel_plano = NIVEIS_PLANO.get(self.plano, 1)
+
+        acesso = estado_acesso(self.despachante) if self.despachante else {}
+        self.ativo = acesso.get('ativo', False)
+        self.dias_restantes = acesso.get('dias_restantes')
+        self.assinatura_vencida = acesso.get('vencida', False)
+
+    def tem_plano(self, plano_exigido):
+        """True se o plano do escritório for igual ou superior ao exigido."""
+        return self.nivel_plano >= NIVEIS_PLANO.get(plano_exigido, 1)
+
+
+# ==============================================================================
+# SITUAÇÃO DA ASSINATURA (CACHE ATÉ A PRÓXIMA MEIA-NOITE)
+# ==============================================================================
+
+def _chave_acesso(despachante_id):
+    return f"acesso_despachante_{despachante_id}"
+
+
+def _segundos_ate_meia_noite():
+    # Mesma referência de data do Despachante.get_dias_restantes (timezone.now().date())
+    agora = timezone.now()
+    meia_noite = datetime.combine(agora.date() + timedelta(days=1), time.min, tzinfo=agora.tzinfo)
+    return max(1, int((meia_noite - agora).total_seconds()))
+
+
+def estado_acesso(despachante):
+    """
+    Situação da assinatura do escritório: {'ativo', 'dias_restantes', 'vencida'}.
+    Fica em cache até a virada do dia, quando 'dias_restantes' muda sozinho.
+    """
+    chave = _chave_acesso(despachante.id)
+    estado = cache.get(chave)
+    if estado is None:
+        dias_restantes = despachante.get_dias_restantes()
+        estado = {
+            'ativo': despachante.ativo,
+            'dias_restantes': dias_restantes,
+            # Vitalício (None) nunca vence
+            'vencida': dias_restantes is not None and dias_restantes < 0,
+        }
+        cache.set(chave, estado, _segundos_ate_meia_noite())
+    return estado
+
+
+def invalidar_acesso(despachante_id):
+    """Chamar sempre que 'ativo' ou 'data_validade_sistema' mudarem."""
+    cache.delete(_chave_acesso(despachante_id))
+
+
+def carregar_tenant(user):
+    """
+    Busca PerfilUsuario + Despachante em uma única query (select_related)
+    e preenche o cache de 'user.perfilusuario', para que views, forms e
+    templates que ainda usam esse caminho não disparem novas consultas.
+    """
+    perfil = PerfilUsuario.objects.select_related('despachante').filter(user_id=user.pk).first()
+
+    if perfil:
+        user.perfilusuario = perfil
+    else:
+        # Superusuário sem perfil: evita que cada hasattr() consulte o banco de novo
+        User.perfilusuario.related.set_cached_value(user, None)
+
+    return Tenant(user, perfil)
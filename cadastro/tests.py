@@ -1,3 +1,1476 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import io
+import json
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, Sum
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from config.cache import ArquivoCache, ArquivoCachePermanente, cache_estado
+from config.middleware import BloqueioSaaSMiddleware
+from .models import (
+    Despachante, PerfilUsuario, Cliente, Veiculo, Atendimento, ContadorDespachante, Orcamento, LogAtividade,
+    AtendimentoArquivado, LogAtividadeArquivado, ResumoDiario, TipoServico,
+)
+from .lote import criar_processos_em_lote
+from .paginacao import paginar, paginar_por_cursor
+from .normalizacao import so_digitos, chave_placa, parece_documento, parece_placa, placa_valida, filtro_busca, filtro_veiculo
+from .tenant import Tenant, carregar_tenant, estado_acesso
+from . import tenant as tenant_modulo
+from . import contadores, sla, versoes, eventos, importacao, autocompletar, carteira, arquivo, historico, deduplicacao, precificacao, resumo
 
-# Create your tests here.
+# ==============================================================================
+# ESTADO DERIVADO x RECONTAGEM NA ORIGEM
+# ==============================================================================
+# Contadores, resumo diário, índices e arquivo são mantidos incrementalmente:
+# cada teste mexe nos dados pelos caminhos normais e confere o valor mantido
+# contra uma contagem feita do zero nas tabelas de origem.
+
+CACHES_TESTE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'},
+    'estado': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes_estado'},
+}
+
+
+def criar_despachante(cnpj='00.000.000/0001-00', **campos):
+    dados = dict(
+        nome_fantasia='Despachante Teste', razao_social='Despachante Teste LTDA', cnpj=cnpj,
+        codigo_sindego='1', telefone='62999990000', email='teste@teste.com',
+        endereco_completo='Rua 1', plano='PREMIUM',
+    )
+    dados.update(campos)
+    return Despachante.objects.create(**dados)
+
+
+def criar_cliente(despachante, nome='CARLOS SILVA', cpf_cnpj='123.456.789-09', **campos):
+    dados = dict(rua='Rua 1', numero='1', bairro='Centro', cep='74000-000', telefone='(62) 99999-0000')
+    dados.update(campos)
+    return Cliente.objects.create(despachante=despachante, nome=nome, cpf_cnpj=cpf_cnpj, **dados)
+
+
+def criar_processo(despachante, cliente, **campos):
+    dados = dict(servico='Transferência', status='SOLICITADO')
+    dados.update(campos)
+    return Atendimento.objects.create(despachante=despachante, cliente=cliente, **dados)
+
+
+@override_settings(CACHES=CACHES_TESTE)
+class TesteEscritorio(TestCase):
+    """Um escritório com um cliente e um usuário administrador."""
+
+    def setUp(self):
+        cache.clear()
+        cache_estado.clear()
+        self.despachante = criar_despachante()
+        self.cliente = criar_cliente(self.despachante)
+        self.usuario = User.objects.create_user('operador', 'op@teste.com', 'senha')
+        PerfilUsuario.objects.create(
+            user=self.usuario, despachante=self.despachante, tipo_usuario='ADMIN', precisa_mudar_senha=False
+        )
+
+    def logar(self):
+        self.client.force_login(self.usuario)
+        return self.client
+
+
+# ------------------------------------------------------------------------------
+# CONTADORES DO DASHBOARD
+# ------------------------------------------------------------------------------
+
+class ContadoresTest(TesteEscritorio):
+
+    def recontar(self, chave):
+        return contadores._contar_no_banco(self.despachante.id, chave)
+
+    def conferir(self, *chaves):
+        # ler() só conta no banco se o contador não existir (ex: depois de um zerar())
+        for chave in chaves:
+            self.assertEqual(contadores.ler(self.despachante.id, chave), self.recontar(chave), chave)
+
+    def test_contadores_acompanham_criacao_status_e_exclusao(self):
+        mes = contadores.chave_mes(date(2026, 3, 10))
+        contadores.ler(self.despachante.id, contadores.CHAVE_ABERTOS)
+        contadores.ler(self.despachante.id, mes)
+
+        processos = [criar_processo(self.despachante, self.cliente, data_solicitacao=date(2026, 3, dia)) for dia in (1, 2, 3)]
+        self.conferir(contadores.CHAVE_ABERTOS, mes)
+
+        processos[0].status = 'APROVADO'
+        processos[0].save()
+        self.assertTrue(ContadorDespachante.objects.filter(despachante=self.despachante, chave=mes).exists())
+        self.conferir(contadores.CHAVE_ABERTOS, mes)
+
+        parcial = Atendimento.objects.only('id', 'status').get(pk=processos[1].pk)
+        parcial.status = 'CANCELADO'
+        parcial.save()
+        self.conferir(contadores.CHAVE_ABERTOS, mes)
+
+        processos[2].data_solicitacao = date(2026, 4, 1)
+        processos[2].save()
+        processos[0].delete()
+        self.conferir(contadores.CHAVE_ABERTOS, mes)
+        self.assertEqual(contadores.ler(self.despachante.id, mes), 1)
+
+    def test_mes_do_dashboard_usa_a_data_local(self):
+        # 31/10 às 22h em São Paulo já é 01/11 em UTC
+        agora = datetime(2026, 11, 1, 1, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=agora):
+            criar_processo(self.despachante, self.cliente)
+            self.assertEqual(contadores.total_mes(self.despachante), 1)
+        self.assertEqual(contadores.ler(self.despachante.id, 'mes_2026_10'), 1)
+
+
+# ------------------------------------------------------------------------------
+# PAGINAÇÃO POR CURSOR
+# ------------------------------------------------------------------------------
+
+class PaginacaoTest(TesteEscritorio):
+
+    ORDENACAO = ['-data_solicitacao', '-id']
+
+    def setUp(self):
+        super().setUp()
+        # Datas repetidas: o 'id' é que desempata na fronteira das páginas
+        for numero in range(9):
+            criar_processo(self.despachante, self.cliente, data_solicitacao=date(2026, 3, 1 + numero // 4))
+        self.fila = Atendimento.objects.filter(despachante=self.despachante)
+        self.esperados = list(self.fila.order_by(*self.ORDENACAO).values_list('id', flat=True))
+
+    def paginas(self, consultas, por_pagina):
+        paginas, cursor = [], None
+        while True:
+            pagina = paginar_por_cursor(consultas, cursor, por_pagina, self.ORDENACAO)
+            paginas.append(pagina)
+            if not pagina.has_next():
+                return paginas
+            cursor = pagina.next_cursor
+
+    def test_percorre_tudo_sem_pular_nem_repetir(self):
+        for por_pagina in (2, 3, 4, 9, 10):
+            paginas = self.paginas(self.fila, por_pagina)
+            self.assertEqual([processo.id for pagina in paginas for processo in pagina], self.esperados, por_pagina)
+            # Total múltiplo do tamanho da página: a última cheia não oferece uma próxima vazia
+            self.assertEqual(len(paginas), -(-len(self.esperados) // por_pagina), por_pagina)
+            self.assertFalse(paginas[0].has_previous())
+            self.assertEqual(paginas[0].has_other_pages(), len(paginas) > 1)
+
+    def test_voltar_devolve_a_pagina_anterior(self):
+        paginas = self.paginas(self.fila, 3)
+        for indice in range(len(paginas) - 1, 0, -1):
+            anterior = paginar_por_cursor(self.fila, paginas[indice].previous_cursor, 3, self.ORDENACAO)
+            self.assertEqual(list(anterior), list(paginas[indice - 1]))
+            self.assertTrue(anterior.has_next())
+            self.assertEqual(anterior.has_previous(), indice > 1)
+
+    def test_cursor_invalido_volta_ao_inicio(self):
+        for cursor in ('lixo', 'eyJkIjoiYSJ9', paginar_por_cursor(self.fila, None, 3, ['id']).next_cursor):
+            pagina = paginar_por_cursor(self.fila, cursor, 3, self.ORDENACAO)
+            self.assertEqual([processo.id for processo in pagina], self.esperados[:3], cursor)
+            self.assertFalse(pagina.has_previous())
+
+    def test_processos_e_arquivo_numa_lista_so(self):
+        for processo in self.fila.filter(data_solicitacao=date(2026, 3, 2)):
+            processo.status = 'CANCELADO'
+            processo.save()
+        with mock.patch.object(arquivo.timezone, 'localdate', return_value=date(2027, 6, 1)):
+            self.assertEqual(arquivo.arquivar(self.despachante.id), 4)
+
+        consultas = [self.fila, AtendimentoArquivado.objects.filter(despachante=self.despachante)]
+        paginas = self.paginas(consultas, 3)
+        self.assertEqual([processo.id for pagina in paginas for processo in pagina], self.esperados)
+        # As duas primeiras páginas misturam processos ativos e arquivados
+        self.assertEqual(
+            [isinstance(processo, AtendimentoArquivado) for pagina in paginas for processo in pagina],
+            [False, True, True, True, True, False, False, False, False],
+        )
+
+    def test_links_mantem_os_filtros_da_fila(self):
+        cliente_http = self.logar()
+        resposta = cliente_http.get(reverse('dashboard'), {'busca': 'CARLOS', 'page': '1'})
+        self.assertFalse(getattr(resposta.context['fila_processos'], 'modo_cursor', False))  # Link antigo ?page=N
+
+        with mock.patch('cadastro.views.paginar', wraps=lambda request, consultas, por_pagina, ordenacao: paginar(
+            request, consultas, 4, ordenacao
+        )):
+            pagina = cliente_http.get(reverse('dashboard'), {'busca': 'CARLOS'}).context['fila_processos']
+            proxima = pagina.querystring_proxima
+            self.assertIn('busca=CARLOS', proxima)
+            seguinte = cliente_http.get(reverse('dashboard') + '?' + proxima).context['fila_processos']
+        self.assertTrue(seguinte.modo_cursor and seguinte.has_previous())
+        self.assertEqual(len(seguinte), 4)
+
+
+# ------------------------------------------------------------------------------
+# CONTEXTO DO ESCRITÓRIO (request.tenant)
+# ------------------------------------------------------------------------------
+
+class TenantTest(TesteEscritorio):
+
+    def test_perfil_e_escritorio_numa_consulta(self):
+        estado_acesso(self.despachante)  # Situação da assinatura já no cache
+        usuario = User.objects.get(pk=self.usuario.pk)
+        with self.assertNumQueries(1):
+            tenant = carregar_tenant(usuario)
+            # Os caminhos antigos (user.perfilusuario) usam o que já foi carregado
+            self.assertEqual(usuario.perfilusuario.despachante.nome_fantasia, 'Despachante Teste')
+        self.assertEqual(
+            (tenant.despachante, tenant.tipo_usuario, tenant.is_admin, tenant.plano, tenant.ativo),
+            (self.despachante, 'ADMIN', True, 'PREMIUM', True),
+        )
+
+    def test_superusuario_sem_perfil(self):
+        chefe = User.objects.create_superuser('chefe', 'chefe@teste.com', 'senha')
+        with self.assertNumQueries(1):
+            tenant = carregar_tenant(chefe)
+            self.assertFalse(hasattr(chefe, 'perfilusuario'))
+        self.assertEqual((tenant.despachante, tenant.is_admin, tenant.ativo), (None, True, False))
+
+    def test_hierarquia_dos_planos(self):
+        perfil = PerfilUsuario.objects.select_related('despachante').get(user=self.usuario)
+        perfil.despachante.plano = 'MEDIO'
+        tenant = Tenant(self.usuario, perfil)
+        self.assertEqual(
+            [tenant.tem_plano(plano) for plano in ('BASICO', 'MEDIO', 'PREMIUM')], [True, True, False],
+        )
+
+    def test_middleware_carrega_uma_vez_por_request(self):
+        cliente_http = self.logar()
+        with mock.patch('config.middleware.carregar_tenant', wraps=carregar_tenant) as carregar:
+            resposta = cliente_http.get(reverse('lista_clientes'))
+        self.assertEqual(carregar.call_count, 1)
+        self.assertEqual(resposta.wsgi_request.tenant.despachante, self.despachante)
+
+        self.client.logout()
+        self.assertIsNone(self.client.get(reverse('login')).wsgi_request.tenant)
+
+
+# ------------------------------------------------------------------------------
+# BLOQUEIO DA ASSINATURA (BloqueioSaaSMiddleware)
+# ------------------------------------------------------------------------------
+
+class BloqueioAssinaturaTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        self.bloqueio = BloqueioSaaSMiddleware(lambda request: HttpResponse('liberado'))
+        self.fabrica = RequestFactory()
+
+    def vencer(self):
+        self.despachante.data_validade_sistema = timezone.now().date() - timedelta(days=1)
+        self.despachante.save()
+
+    def acessar(self, caminho, usuario=None):
+        request = self.fabrica.get(caminho)
+        request.user = User.objects.get(pk=(usuario or self.usuario).pk)
+        request.tenant = carregar_tenant(request.user)
+        return self.bloqueio(request)
+
+    def test_rotas_livres_passam_mesmo_vencido(self):
+        self.vencer()
+        livres = [
+            reverse('logout'), reverse('pagar_mensalidade'), reverse('bloqueio_financeiro_admin'),
+            reverse('password_change'), reverse('password_change_done'),
+            '/admin/cadastro/cliente/', reverse('webhook_asaas'),
+        ]
+        for caminho in livres:
+            self.assertEqual(self.acessar(caminho).content, b'liberado', caminho)
+
+        resposta = self.acessar(reverse('dashboard'))
+        self.assertEqual((resposta.status_code, resposta.url), (302, reverse('bloqueio_financeiro_admin')))
+
+    def test_funcionario_e_escritorio_desativado_veem_o_aviso(self):
+        funcionario = User.objects.create_user('balcao', 'balcao@teste.com', 'senha')
+        PerfilUsuario.objects.create(
+            user=funcionario, despachante=self.despachante, tipo_usuario='OPERAR', precisa_mudar_senha=False,
+        )
+        self.vencer()
+        self.assertIn('Avise seu Administrador', self.acessar(reverse('dashboard'), funcionario).content.decode())
+
+        self.despachante.data_validade_sistema = None
+        self.despachante.ativo = False
+        self.despachante.save()
+        self.assertIn('Suspensão Administrativa', self.acessar(reverse('dashboard')).content.decode())
+
+    def test_situacao_em_cache_ate_a_meia_noite(self):
+        self.despachante.data_validade_sistema = timezone.now().date() + timedelta(days=5)
+        self.despachante.save()
+        self.assertEqual(estado_acesso(self.despachante)['dias_restantes'], 5)
+
+        # Mudança sem signal (update) não aparece; save() invalida o cache
+        Despachante.objects.filter(pk=self.despachante.pk).update(ativo=False)
+        self.despachante.ativo = False
+        self.assertTrue(estado_acesso(self.despachante)['ativo'])
+        self.despachante.save()
+        self.assertFalse(estado_acesso(self.despachante)['ativo'])
+
+        agora = datetime(2026, 5, 10, 23, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=agora):
+            self.assertEqual(tenant_modulo._segundos_ate_meia_noite(), 3600)
+
+
+# ------------------------------------------------------------------------------
+# CACHE COMPARTILHADO
+# ------------------------------------------------------------------------------
+
+class CacheEstadoTest(TestCase):
+
+    def test_cache_de_estado_nao_descarta_por_lotacao(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            comum = ArquivoCache(pasta + '/comum', {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+            estado = ArquivoCachePermanente(pasta + '/estado', {'OPTIONS': {'MAX_ENTRIES': 10}})
+            for numero in range(30):
+                comum.set(f'chave_{numero}', numero, None)
+                estado.set(f'chave_{numero}', numero, None)
+
+            self.assertLess(len(comum.get_many([f'chave_{numero}' for numero in range(30)])), 30)
+            self.assertEqual(len(estado.get_many([f'chave_{numero}' for numero in range(30)])), 30)
+
+
+# ------------------------------------------------------------------------------
+# LIMPEZA DE SESSÕES (SÓ COM SESSÃO NO BANCO)
+# ------------------------------------------------------------------------------
+
+class LimparSessoesTest(TestCase):
+
+    def setUp(self):
+        agora = timezone.now()
+        Session.objects.create(session_key='expirada', session_data='', expire_date=agora - timedelta(days=1))
+        Session.objects.create(session_key='valida', session_data='', expire_date=agora + timedelta(days=1))
+
+    def _rodar(self):
+        saida = io.StringIO()
+        call_command('limpar_sessoes', pausa=0, stdout=saida)
+        return saida.getvalue()
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_sessao_no_cookie_nao_mexe_na_tabela(self):
+        self.assertIn('nada a limpar', self._rodar())
+        self.assertEqual(Session.objects.count(), 2)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_sessao_no_banco_apaga_so_as_expiradas(self):
+        self._rodar()
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['valida'])
+
+
+# ------------------------------------------------------------------------------
+# URGÊNCIA DA FILA (SLA)
+# ------------------------------------------------------------------------------
+
+class UrgenciaTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        hoje = timezone.localdate()
+        # (dias desde a solicitação, dias até o prazo ou None) na ordem esperada:
+        # atrasados, em alerta e no prazo; em cada faixa, o mais antigo primeiro
+        faixas = [
+            (40, None), (40, None), (5, -1),
+            (20, None), (3, 1),
+            (2, 10), (1, None),
+        ]
+        self.esperados = [
+            criar_processo(
+                self.despachante, self.cliente, data_solicitacao=hoje - timedelta(days=dias),
+                data_entrega=None if prazo is None else hoje + timedelta(days=prazo),
+            ).id
+            for dias, prazo in faixas
+        ]
+        self.niveis = [sla.URGENCIA_ATRASADO] * 3 + [sla.URGENCIA_ALERTA] * 2 + [sla.URGENCIA_OK] * 2
+        self.fila = Atendimento.objects.filter(despachante=self.despachante)
+
+    def test_paginas_por_urgencia_nas_duas_direcoes(self):
+        consultas = sla.consultas_por_urgencia(self.fila, self.despachante)
+        paginas, cursor = [], None
+        while True:
+            pagina = paginar_por_cursor(consultas, cursor, 2, sla.ORDENACAO_URGENCIA)
+            paginas.append([(processo.id, processo.urgencia) for processo in pagina])
+            if not pagina.has_next():
+                break
+            cursor = pagina.next_cursor
+
+        self.assertEqual(sum(paginas, []), list(zip(self.esperados, self.niveis)))
+        # Mesmo nível do Case que pinta as linhas da fila
+        anotados = dict(sla.anotar_urgencia(self.fila, self.despachante).values_list('id', 'urgencia'))
+        self.assertEqual([anotados[id_processo] for id_processo in self.esperados], self.niveis)
+
+        anterior = paginar_por_cursor(consultas, pagina.previous_cursor, 2, sla.ORDENACAO_URGENCIA)
+        self.assertEqual([(processo.id, processo.urgencia) for processo in anterior], paginas[-2])
+        self.assertTrue(anterior.has_previous())
+
+    def test_fila_ordenada_sem_case_no_order_by(self):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.logar().get(reverse('dashboard'), {'ordem': 'urgencia'})
+        self.assertEqual([processo.id for processo in resposta.context['fila_processos']], self.esperados)
+
+        ordens = [
+            consulta['sql'].split('ORDER BY')[1] for consulta in contexto.captured_queries
+            if 'FROM "cadastro_atendimento"' in consulta['sql'] and 'ORDER BY' in consulta['sql']
+        ]
+        self.assertEqual(len(ordens), len(sla.NIVEIS))
+        for ordem in ordens:
+            self.assertNotIn('CASE', ordem)
+            self.assertIn('"data_solicitacao" ASC', ordem.split(',')[0])
+
+
+# ------------------------------------------------------------------------------
+# VERSÃO DOS DADOS (ETag / CACHE DE FRAGMENTOS)
+# ------------------------------------------------------------------------------
+
+class VersoesTest(TesteEscritorio):
+
+    def test_novos_prazos_da_fila_renovam_a_versao(self):
+        cache_estado.set(versoes._chave(self.despachante.id), 0, None)
+
+        resposta = self.logar().post(reverse('configuracoes_despachante'), {
+            'sla_dias_alerta': '2', 'sla_dias_atraso': '4', 'sla_dias_aviso_prazo': '1',
+        })
+
+        self.assertEqual(resposta.status_code, 302)
+        self.despachante.refresh_from_db()
+        self.assertEqual(self.despachante.sla_dias_atraso, 4)
+        self.assertNotEqual(versoes.carimbo(self.despachante.id), 0)
+
+
+# ------------------------------------------------------------------------------
+# EVENTOS DA FILA (SSE)
+# ------------------------------------------------------------------------------
+
+class EventosFilaTest(TesteEscritorio):
+
+    def test_cada_evento_recebe_um_numero_proprio(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            processos = [criar_processo(self.despachante, self.cliente) for _ in range(3)]
+        processos[0].status = 'APROVADO'
+        with self.captureOnCommitCallbacks(execute=True):
+            processos[0].save()
+
+        self.assertEqual(eventos.ultimo_id(self.despachante.id), 4)
+        publicados = async_to_sync(eventos.aeventos_desde)(self.despachante.id, 0, 4)
+        self.assertEqual([seq for seq, _ in publicados], [1, 2, 3, 4])
+        self.assertEqual([evento['tipo'] for _, evento in publicados], ['criado'] * 3 + ['status'])
+
+    def test_sequencia_sobrevive_ao_cache_e_a_recontagem(self):
+        eventos.publicar(self.despachante.id, 'criado', id=1)
+        cache.clear()
+        contadores.zerar(self.despachante.id)
+
+        self.assertEqual(eventos.ultimo_id(self.despachante.id), 1)
+        self.assertEqual(eventos.publicar(self.despachante.id, 'criado', id=2), 2)
+
+    def test_uma_leitura_por_escritorio_para_todas_as_conexoes(self):
+        leituras = []
+
+        async def ler_sequencia(despachante_id):
+            leituras.append(despachante_id)
+            return 7 if len(leituras) >= 4 else 5
+
+        async def abrir_conexoes(quantidade):
+            async with contextlib.AsyncExitStack() as pilha:
+                observadores = [
+                    await pilha.enter_async_context(eventos.observar(self.despachante.id)) for _ in range(quantidade)
+                ]
+                self.assertEqual(len({id(observador) for observador in observadores}), 1)
+                return await asyncio.gather(*(observador.esperar(5, 5) for observador in observadores))
+
+        with mock.patch.object(eventos, 'aultimo_id', ler_sequencia), mock.patch.object(eventos, 'INTERVALO_LEITURA', 0.01):
+            atuais = async_to_sync(abrir_conexoes)(20)
+
+        self.assertEqual(atuais, [7] * 20)
+        self.assertLessEqual(len(leituras), 5)  # A primeira e as do laço, não uma por conexão
+        self.assertEqual(eventos._observadores, {})
+
+
+# ------------------------------------------------------------------------------
+# IMPORTAÇÃO DE PLANILHAS
+# ------------------------------------------------------------------------------
+
+def planilha(*linhas):
+    conteudo = '\n'.join(['nome;cpf_cnpj;telefone;placa;modelo;ano_fabricacao;ano_modelo', *linhas])
+    return io.BytesIO(conteudo.encode('utf-8'))
+
+
+class ImportacaoTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def importar(self, *linhas):
+        return importacao.importar(self.despachante, planilha(*linhas), 'clientes.csv')
+
+    def test_documento_com_e_sem_pontuacao_e_o_mesmo_cliente(self):
+        resultado = self.importar(
+            'CARLOS SILVA;12345678909;(62) 98888-0000;ABC1D23;GOL;2010;2011',
+            'MARIA SOUZA;987.654.321-00;;;;;',
+            'MARIA SOUZA;98765432100;(62) 97777-0000;XYZ9876;UNO;2005;2005',
+        )
+
+        self.assertEqual(resultado['erros'], 0)
+        self.assertEqual(resultado['clientes_criados'], 1)
+        self.assertEqual(resultado['clientes_atualizados'], 1)
+        self.assertEqual(Cliente.objects.filter(despachante=self.despachante).count(), 2)
+
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.cpf_cnpj, '123.456.789-09')  # Pontuação do cadastro mantida
+        self.assertEqual(self.cliente.telefone, '(62) 98888-0000')
+        self.assertEqual(list(self.cliente.veiculos.values_list('placa', flat=True)), ['ABC1D23'])
+
+        # Chaves de busca gravadas pelo bulk_create/bulk_update iguais às do save()
+        for cliente in Cliente.objects.filter(despachante=self.despachante):
+            self.assertEqual(cliente.documento_busca, so_digitos(cliente.cpf_cnpj))
+
+    def test_reimportar_o_mesmo_arquivo_nao_duplica(self):
+        linha = 'MARIA SOUZA;987.654.321-00;(62) 97777-0000;XYZ9876;UNO;2005;2005'
+        self.importar(linha)
+        resultado = self.importar(linha.replace('987.654.321-00', '98765432100'))
+
+        self.assertEqual((resultado['clientes_criados'], resultado['clientes_atualizados']), (0, 0))
+        self.assertEqual((resultado['veiculos_criados'], resultado['veiculos_atualizados']), (0, 0))
+        self.assertEqual(Cliente.objects.filter(documento_busca='98765432100').count(), 1)
+
+    def test_planilha_nao_troca_o_dono_do_veiculo(self):
+        veiculo = Veiculo.objects.create(
+            despachante=self.despachante, cliente=self.cliente, placa='ABC-1D23', modelo='GOL',
+            ano_fabricacao=2010, ano_modelo=2011,
+        )
+        resultado = self.importar(
+            'MARIA SOUZA;987.654.321-00;;abc1d23;UNO;2005;2005',
+            'JOAO PEREIRA;111.222.333-96;;XYZ9876;PALIO;2008;2008',
+            'MARIA SOUZA;987.654.321-00;;XYZ-9876;PALIO;2008;2008',
+        )
+
+        self.assertEqual((resultado['erros'], resultado['veiculos_criados'], resultado['veiculos_atualizados']), (2, 1, 0))
+        veiculo.refresh_from_db()
+        self.assertEqual((veiculo.cliente_id, veiculo.modelo), (self.cliente.id, 'GOL'))
+        self.assertEqual(Veiculo.objects.get(placa='XYZ9876').cliente.nome, 'JOAO PEREIRA')
+        with open(importacao.pasta_relatorios(self.despachante.id) / resultado['relatorio'], encoding='utf-8-sig') as arquivo:
+            erros = arquivo.read()
+        self.assertIn('placa já cadastrada para outro cliente (CARLOS SILVA)', erros)
+        self.assertIn('placa repetida no arquivo para outro cliente', erros)
+
+        # O próprio dono atualiza o veículo, com a placa digitada de outro jeito
+        resultado = self.importar('CARLOS SILVA;12345678909;;ABC 1D23;GOL G5;2010;2011')
+        self.assertEqual((resultado['erros'], resultado['veiculos_atualizados']), (0, 1))
+        veiculo.refresh_from_db()
+        self.assertEqual((veiculo.cliente_id, veiculo.placa, veiculo.modelo), (self.cliente.id, 'ABC-1D23', 'GOL G5'))
+
+    def test_importacao_pela_tela_em_etapas(self):
+        linhas = [f'CLIENTE {numero};000.000.001-{numero:02d};;;;;' for numero in range(5)] + ['SEM DOCUMENTO;;;;;;']
+        arquivo = planilha(*linhas)
+        arquivo.name = 'clientes.csv'
+        cliente_http = self.logar()
+
+        resposta = cliente_http.post(reverse('importar_clientes'), {'arquivo': arquivo})
+        token = resposta.url.split('importacao=')[1]
+        pasta = importacao.pasta_relatorios(self.despachante.id)
+        self.assertEqual(len(list(pasta.glob('pendente_*'))), 1)
+
+        etapas = []
+        with mock.patch.object(importacao, 'LINHAS_POR_ETAPA', 2), mock.patch.object(importacao, 'TAMANHO_LOTE', 1):
+            while not etapas or not etapas[-1]['concluida']:
+                etapas.append(cliente_http.post(reverse('importar_clientes_etapa', args=[token])).json())
+        self.assertEqual([etapa['linhas'] for etapa in etapas], [2, 4, 6])
+        self.assertEqual((etapas[-1]['clientes_criados'], etapas[-1]['erros']), (5, 1))
+        self.assertEqual(Cliente.objects.filter(despachante=self.despachante).count(), 6)
+        self.assertEqual(list(pasta.glob('pendente_*')), [])
+
+        resultado = cliente_http.get(reverse('importar_clientes'), {'importacao': token}).context['resultado']
+        self.assertEqual(resultado['clientes_criados'], 5)
+        self.assertEqual(LogAtividade.objects.filter(descricao__startswith='Importou a planilha').count(), 1)
+
+    def test_etapas_leem_cada_linha_uma_vez(self):
+        linhas = [f'CLIENTE {numero};000.000.{numero:03d}-00;;;;;' for numero in range(25)]
+        with mock.patch.object(importacao, 'ler_linhas', wraps=importacao.ler_linhas) as leitura:
+            token = importacao.iniciar(self.despachante, planilha(*linhas), 'clientes.csv')
+        self.assertEqual(leitura.call_count, 1)
+
+        estado = None
+        with mock.patch.object(importacao, '_decodificar', wraps=importacao._decodificar) as decodificar:
+            while estado is None or not estado['concluida']:
+                estado = importacao.continuar(self.despachante, token, linhas_por_etapa=10, tamanho_lote=4)
+        # Cada etapa lê a partir do byte onde a anterior parou; a linha a mais da
+        # 1ª e da 2ª etapa (a que encerra a etapa) é lida de novo na seguinte
+        self.assertEqual(decodificar.call_count, 25 + 2)
+        self.assertEqual((estado['resultado']['linhas'], estado['resultado']['clientes_criados']), (25, 25))
+        self.assertEqual(estado['ultima_linha'], 26)
+
+
+# ------------------------------------------------------------------------------
+# CHAVES NORMALIZADAS DE BUSCA
+# ------------------------------------------------------------------------------
+
+class BuscaNormalizadaTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        self.veiculo = Veiculo.objects.create(
+            despachante=self.despachante, cliente=self.cliente, placa='abc-1d23', modelo='GOL',
+            renavam='00123456789', ano_fabricacao=2010, ano_modelo=2011,
+        )
+        self.maria = criar_cliente(self.despachante, nome='MARIA SOUZA', cpf_cnpj='98765432100', telefone='62 3333-4444')
+        # Mesmo documento em outro escritório: nunca aparece
+        criar_cliente(criar_despachante(cnpj='00.000.000/0002-00'), nome='CARLOS DE FORA')
+
+    def test_chaves_acompanham_o_save(self):
+        self.assertEqual((self.cliente.documento_busca, self.cliente.telefone_busca), ('12345678909', '62999990000'))
+        self.assertEqual(self.veiculo.placa_busca, 'ABC1D23')
+
+        self.cliente.cpf_cnpj = '111.222.333-96'
+        self.cliente.save(update_fields=['cpf_cnpj'])
+        self.veiculo.placa = 'XYZ 9876'
+        self.veiculo.save(update_fields=['placa'])
+        self.assertEqual(Cliente.objects.get(pk=self.cliente.pk).documento_busca, '11122233396')
+        self.assertEqual(Veiculo.objects.get(pk=self.veiculo.pk).placa_busca, 'XYZ9876')
+
+    def test_tipo_do_termo(self):
+        self.assertTrue(parece_documento('123.456.789-09'))
+        self.assertTrue(parece_documento('(62) 9'))
+        self.assertFalse(parece_documento('12'))  # Curto demais: vira busca por texto
+        self.assertFalse(parece_documento('CARLOS 123'))
+        self.assertTrue(parece_placa('abc-1d'))
+        self.assertTrue(parece_placa('ABC1234'))
+        self.assertFalse(parece_placa('ABC'))
+        self.assertEqual(
+            [placa_valida(chave_placa(placa)) for placa in ('abc-1d23', 'ABC1234', 'ABC1D2', 'A1C1D23')],
+            [True, True, False, False],
+        )
+
+    def busca_clientes(self, termo):
+        resposta = self.logar().get(reverse('lista_clientes'), {'q': termo})
+        return sorted(cliente.nome for cliente in resposta.context['clientes'])
+
+    def test_lista_de_clientes_acha_com_qualquer_pontuacao(self):
+        for termo in ('123.456.789-09', '12345678909', '123456', ' 123.456 '):
+            self.assertEqual(self.busca_clientes(termo), ['CARLOS SILVA'], termo)
+        self.assertEqual(self.busca_clientes('(62) 3333'), ['MARIA SOUZA'])
+        self.assertEqual(self.busca_clientes('62'), [])  # Curto: procura no nome
+        self.assertEqual(self.busca_clientes('souza'), ['MARIA SOUZA'])
+
+        filtro = filtro_busca('987.654', texto=['nome'], documento=['documento_busca'])
+        self.assertEqual(str(filtro), "(AND: ('documento_busca__startswith', '987654'))")
+
+    def test_orcamentos_e_frota_pela_placa_normalizada(self):
+        Orcamento.objects.create(despachante=self.despachante, cliente=self.cliente, veiculo=self.veiculo)
+        Orcamento.objects.create(despachante=self.despachante, cliente=self.maria)
+        resposta = self.logar().get(reverse('listar_orcamentos'), {'termo': 'abc 1d2'})
+        self.assertEqual([orcamento.veiculo_id for orcamento in resposta.context['orcamentos']], [self.veiculo.id])
+
+        frota = Veiculo.objects.filter(cliente=self.cliente)
+        for termo in ('abc1', 'ABC-1D23', '00123', 'gol'):
+            self.assertEqual(list(frota.filter(filtro_veiculo(termo))), [self.veiculo], termo)
+        self.assertFalse(frota.filter(filtro_veiculo('123456')).exists())
+
+
+# ------------------------------------------------------------------------------
+# FROTA DO CLIENTE (API DE VEÍCULOS)
+# ------------------------------------------------------------------------------
+
+class FrotaClienteTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        for numero in range(5):
+            Veiculo.objects.create(
+                despachante=self.despachante, cliente=self.cliente, placa=f'ABC{numero}D23',
+                modelo='GOL' if numero % 2 else 'UNO', renavam=f'0099{numero}', ano_fabricacao=2010, ano_modelo=2011,
+            )
+        # Veículo com o mesmo cliente_id em outro escritório nunca vaza
+        fora = criar_despachante(cnpj='00.000.000/0002-00')
+        Veiculo.objects.create(
+            despachante=fora, cliente=self.cliente, placa='ABC9D99', modelo='GOL', ano_fabricacao=2010, ano_modelo=2011,
+        )
+        self.url = reverse('api_veiculos_cliente', args=[self.cliente.id])
+
+    def placas(self, **parametros):
+        dados = self.client.get(self.url, parametros).json()
+        return [veiculo['placa'] for veiculo in dados['results']], dados['proximo']
+
+    def test_paginas_por_cursor_cobrem_a_frota(self):
+        self.logar()
+        vistas, cursor = [], None
+        while True:
+            placas, cursor = self.placas(limite=2, **({'cursor': cursor} if cursor else {}))
+            vistas += placas
+            if not cursor:
+                break
+        self.assertEqual(vistas, [f'ABC{numero}D23' for numero in range(5)])
+
+    def test_filtro_por_placa_renavam_e_modelo(self):
+        self.logar()
+        self.assertEqual(self.placas(q='abc-2')[0], ['ABC2D23'])
+        self.assertEqual(self.placas(q='00993')[0], ['ABC3D23'])
+        self.assertEqual(self.placas(q='gol')[0], ['ABC1D23', 'ABC3D23'])
+        self.assertEqual(self.placas(q='xyz')[0], [])
+
+    def test_limite_fica_entre_um_e_o_maximo(self):
+        self.logar()
+        with mock.patch('cadastro.views.MAX_VEICULOS_POR_PAGINA', 3), mock.patch('cadastro.views.VEICULOS_POR_PAGINA', 2):
+            self.assertEqual(len(self.placas(limite=0)[0]), 1)
+            self.assertEqual(len(self.placas(limite=9999)[0]), 3)
+            self.assertEqual(len(self.placas(limite='muitos')[0]), 2)
+            self.assertEqual(len(self.placas()[0]), 2)
+
+    def test_revalidacao_responde_304_ate_a_frota_mudar(self):
+        self.logar()
+        primeira = self.client.get(self.url)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertIn('no-cache', primeira['Cache-Control'])
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=primeira['ETag']).status_code, 304)
+        # Filtro diferente é outra página
+        self.assertEqual(self.client.get(self.url, {'q': 'gol'}, HTTP_IF_NONE_MATCH=primeira['ETag']).status_code, 200)
+
+        Veiculo.objects.create(
+            despachante=self.despachante, cliente=self.cliente, placa='ZZZ0A00', ano_fabricacao=2010, ano_modelo=2011,
+        )
+        nova = self.client.get(self.url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(nova.status_code, 200)
+        self.assertIn('ZZZ0A00', [veiculo['placa'] for veiculo in nova.json()['results']])
+
+    def test_detalhe_do_cliente_pagina_e_filtra(self):
+        cliente = self.logar()
+        with mock.patch('cadastro.views.VEICULOS_POR_PAGINA', 2):
+            resposta = cliente.get(reverse('detalhe_cliente', args=[self.cliente.id]))
+            filtrada = cliente.get(reverse('detalhe_cliente', args=[self.cliente.id]), {'q': 'gol'})
+
+        self.assertEqual([veiculo.placa for veiculo in resposta.context['veiculos']], ['ABC0D23', 'ABC1D23'])
+        self.assertTrue(resposta.context['veiculos'].next_cursor)
+        self.assertEqual(resposta.context['total_veiculos'], 5)
+        self.assertEqual([veiculo.placa for veiculo in filtrada.context['veiculos']], ['ABC1D23', 'ABC3D23'])
+
+
+# ------------------------------------------------------------------------------
+# ÍNDICE DO AUTOCOMPLETE
+# ------------------------------------------------------------------------------
+
+class AutocompletarTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        autocompletar._locais.clear()
+
+    def conferir_indice(self):
+        """A cópia deste processo e a de um worker novo (só cache) iguais ao índice montado do banco."""
+        do_banco = autocompletar.montar_indice(self.despachante.id)
+        self.assertEqual(autocompletar.obter_indice(self.despachante.id), do_banco)
+        autocompletar._locais.clear()
+        self.assertEqual(autocompletar.obter_indice(self.despachante.id), do_banco)
+
+    def test_alteracoes_chegam_ao_indice_sem_remontar(self):
+        autocompletar.obter_indice(self.despachante.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            maria = criar_cliente(self.despachante, nome='MARIA SOUZA', cpf_cnpj='987.654.321-00')
+            Veiculo.objects.create(
+                despachante=self.despachante, cliente=maria, placa='ABC1D23', modelo='GOL',
+                ano_fabricacao=2010, ano_modelo=2011,
+            )
+            self.cliente.nome = 'CARLOS ALBERTO SILVA'
+            self.cliente.save()
+        with mock.patch.object(autocompletar, 'montar_indice', side_effect=AssertionError('remontou')):
+            self.assertEqual([item[0] for item in autocompletar.buscar(self.despachante.id, 'ABC1')], [maria.id])
+        self.conferir_indice()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            maria.delete()
+        self.conferir_indice()
+
+    def test_lista_de_alteracoes_e_incorporada_ao_indice(self):
+        autocompletar.obter_indice(self.despachante.id)
+        with mock.patch.object(autocompletar, 'MAX_ALTERACOES', 3):
+            for numero in range(7):
+                with self.captureOnCommitCallbacks(execute=True):
+                    criar_cliente(self.despachante, nome=f'CLIENTE {numero}', cpf_cnpj=f'000.000.000-0{numero}')
+        base, alteracoes = cache.get(autocompletar._chave_alteracoes(self.despachante.id))
+        self.assertEqual(len(alteracoes), 1)
+        self.conferir_indice()
+
+    def test_copias_locais_tem_limite(self):
+        with mock.patch.object(autocompletar, 'MAX_INDICES_LOCAIS', 2):
+            outros = [criar_despachante(cnpj=f'00.000.000/0001-0{numero}') for numero in (1, 2)]
+            for despachante in [self.despachante, *outros]:
+                autocompletar.obter_indice(despachante.id)
+        self.assertEqual(list(autocompletar._locais), [outro.id for outro in outros])
+
+
+# ------------------------------------------------------------------------------
+# CARTEIRA DE CLIENTES (COLUNAS CALCULADAS DA LISTA)
+# ------------------------------------------------------------------------------
+
+class CarteiraTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        hoje = timezone.localdate()
+        self.ana = criar_cliente(self.despachante, nome='ANA COSTA', cpf_cnpj='111.111.111-11')
+        self.bruno = criar_cliente(self.despachante, nome='BRUNO LIMA', cpf_cnpj='222.222.222-22')
+        for cliente, placas in ((self.ana, ('AAA1111', 'AAA2222')), (self.bruno, ('BBB1111',))):
+            for placa in placas:
+                Veiculo.objects.create(
+                    despachante=self.despachante, cliente=cliente, placa=placa, modelo='GOL',
+                    ano_fabricacao=2010, ano_modelo=2011,
+                )
+        antigo = hoje - timedelta(days=30)
+        # Ana: 2 em aberto; devido = 150 (em andamento) + 50 (aprovado, não pago); cancelado e pago não contam
+        for status, financeiro, taxas, honorarios in (
+            ('SOLICITADO', 'ABERTO', '100.00', '50.00'),
+            ('APROVADO', 'ABERTO', '30.00', '20.00'),
+            ('CANCELADO', 'ABERTO', '999.00', '0.00'),
+            ('SOLICITADO', 'PAGO', '70.00', '0.00'),
+        ):
+            criar_processo(
+                self.despachante, self.ana, status=status, status_financeiro=financeiro,
+                valor_taxas_detran=Decimal(taxas), valor_honorarios=Decimal(honorarios), data_solicitacao=antigo,
+            )
+        # Bruno: 3 em aberto, tudo pago, serviço mais recente
+        for _ in range(3):
+            criar_processo(self.despachante, self.bruno, status_financeiro='PAGO', valor_honorarios=Decimal('80.00'))
+        self.hoje, self.antigo = hoje, antigo
+
+    def test_colunas_calculadas(self):
+        clientes = {
+            cliente.nome: cliente
+            for cliente in carteira.anotar_resumo(Cliente.objects.filter(despachante=self.despachante), self.despachante.id)
+        }
+        resumo_por_cliente = {
+            nome: (cliente.qtd_veiculos, cliente.processos_abertos, cliente.valor_devido, cliente.ultimo_servico)
+            for nome, cliente in clientes.items()
+        }
+        self.assertEqual(resumo_por_cliente, {
+            'ANA COSTA': (2, 2, Decimal('200.00'), self.antigo),
+            'BRUNO LIMA': (1, 3, Decimal('0.00'), self.hoje),
+            'CARLOS SILVA': (0, 0, Decimal('0.00'), None),
+        })
+
+    def test_ultimo_servico_inclui_os_arquivados(self):
+        velho = timezone.localdate() - timedelta(days=400)
+        mais_velho = velho - timedelta(days=30)
+        for cliente, data in ((self.cliente, velho), (self.ana, mais_velho), (self.ana, velho)):
+            criar_processo(self.despachante, cliente, status='CANCELADO', data_solicitacao=data)
+        self.assertEqual(arquivo.arquivar(self.despachante.id), 3)
+
+        clientes = carteira.anotar_resumo(Cliente.objects.filter(despachante=self.despachante), self.despachante.id)
+        ultimos = {cliente.nome: cliente.ultimo_servico for cliente in clientes}
+        # Carlos só tem processo arquivado; Ana tem arquivados e um mais recente ainda ativo
+        self.assertEqual(ultimos, {'ANA COSTA': self.antigo, 'BRUNO LIMA': self.hoje, 'CARLOS SILVA': velho})
+        self.assertEqual(
+            [cliente.nome for cliente in carteira.ordenar(clientes, 'ultimo_servico')],
+            ['BRUNO LIMA', 'ANA COSTA', 'CARLOS SILVA'],
+        )
+        # Sem serviço nenhum vai para o fim, depois de quem só tem arquivados
+        criar_cliente(self.despachante, nome='ALICE ROCHA', cpf_cnpj='333.333.333-33')
+        clientes = carteira.anotar_resumo(Cliente.objects.filter(despachante=self.despachante), self.despachante.id)
+        self.assertEqual(
+            [cliente.nome for cliente in carteira.ordenar(clientes, 'ultimo_servico')][-2:],
+            ['CARLOS SILVA', 'ALICE ROCHA'],
+        )
+
+    def test_ordenacoes_da_lista(self):
+        esperado = {
+            'nome': ['ANA COSTA', 'BRUNO LIMA', 'CARLOS SILVA'],
+            'veiculos': ['ANA COSTA', 'BRUNO LIMA', 'CARLOS SILVA'],
+            'abertos': ['BRUNO LIMA', 'ANA COSTA', 'CARLOS SILVA'],
+            'devido': ['ANA COSTA', 'BRUNO LIMA', 'CARLOS SILVA'],
+            'ultimo_servico': ['BRUNO LIMA', 'ANA COSTA', 'CARLOS SILVA'],
+            'invalida': ['ANA COSTA', 'BRUNO LIMA', 'CARLOS SILVA'],
+        }
+        self.assertEqual(set(esperado) - {'invalida'}, set(carteira.ORDENACOES))
+        cliente_http = self.logar()
+        for ordem, nomes in esperado.items():
+            resposta = cliente_http.get(reverse('lista_clientes'), {'ordem': ordem})
+            self.assertEqual([cliente.nome for cliente in resposta.context['clientes']], nomes, ordem)
+            self.assertEqual(resposta.context['ordem'], ordem if ordem in carteira.ORDENACOES else 'nome')
+
+
+# ------------------------------------------------------------------------------
+# HISTÓRICO DO CLIENTE
+# ------------------------------------------------------------------------------
+
+class HistoricoTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        hoje = timezone.localdate()
+        # Vários processos no mesmo dia (empates) e os mais antigos cancelados vão para o arquivo
+        for numero in range(150):
+            criar_processo(
+                self.despachante, self.cliente, data_solicitacao=hoje - timedelta(days=numero // 3 * 10),
+                status='CANCELADO' if numero >= 120 else 'SOLICITADO',
+            )
+        Orcamento.objects.bulk_create(
+            Orcamento(despachante=self.despachante, cliente=self.cliente) for _ in range(30)
+        )
+        LogAtividade.objects.bulk_create(
+            LogAtividade(despachante=self.despachante, cliente=self.cliente, acao='EDICAO', descricao=f'Log {numero}')
+            for numero in range(60)
+        )
+        # Mesmo horário para orçamentos e registros: só o tipo e o id desempatam
+        mesmo_horario = timezone.now() - timedelta(days=10)
+        Orcamento.objects.filter(cliente=self.cliente).update(data_criacao=mesmo_horario)
+        LogAtividade.objects.filter(cliente=self.cliente).update(data=mesmo_horario)
+        arquivo.arquivar(self.despachante.id)
+
+    def esperado(self):
+        """Todos os itens do cliente, contados direto nas 5 tabelas."""
+        filtro = {'cliente': self.cliente}
+        return (
+            [('processo', pk) for pk in Atendimento.objects.filter(**filtro).values_list('id', flat=True)]
+            + [('processo', pk) for pk in AtendimentoArquivado.objects.filter(**filtro).values_list('id', flat=True)]
+            + [('orcamento', pk) for pk in Orcamento.objects.filter(**filtro).values_list('id', flat=True)]
+            + [('log', pk) for pk in LogAtividade.objects.filter(**filtro).values_list('id', flat=True)]
+            + [('log', pk) for pk in LogAtividadeArquivado.objects.filter(**filtro).values_list('id', flat=True)]
+        )
+
+    def test_paginas_cobrem_todo_o_historico_sem_repetir(self):
+        self.assertTrue(AtendimentoArquivado.objects.filter(cliente=self.cliente).exists())
+        esperado = self.esperado()
+        self.assertGreater(len(esperado), 200)
+
+        paginas = [historico.pagina_historico(self.cliente.id)]
+        while paginas[-1].has_next():
+            paginas.append(historico.pagina_historico(self.cliente.id, paginas[-1].next_cursor))
+        vistos = [(item['tipo'], item['id']) for pagina in paginas for item in pagina]
+        self.assertEqual(len(vistos), len(set(vistos)))
+        self.assertCountEqual(vistos, esperado)
+
+        momentos = [item['momento'] for pagina in paginas for item in pagina]
+        self.assertEqual(momentos, sorted(momentos, reverse=True))
+
+        # Voltando pelo cursor anterior chega-se às mesmas páginas
+        anterior = historico.pagina_historico(self.cliente.id, paginas[-1].previous_cursor)
+        self.assertEqual([item['id'] for item in anterior], [item['id'] for item in paginas[-2]])
+
+    def test_pagina_do_detalhe_do_cliente(self):
+        resposta = self.logar().get(reverse('detalhe_cliente', args=[self.cliente.id]))
+        self.assertEqual(resposta.status_code, 200)
+        pagina = resposta.context['linha_do_tempo']
+        self.assertEqual(len(pagina), historico.ITENS_POR_PAGINA)
+        resposta = self.client.get(
+            reverse('detalhe_cliente', args=[self.cliente.id]), {'historico': pagina.next_cursor}
+        )
+        self.assertTrue(resposta.context['linha_do_tempo'].has_previous())
+
+
+# ------------------------------------------------------------------------------
+# DEDUPLICAÇÃO DE CLIENTES
+# ------------------------------------------------------------------------------
+
+class DeduplicacaoTest(TesteEscritorio):
+
+    def test_mesclar_leva_o_historico_arquivado(self):
+        duplicado = criar_cliente(self.despachante, nome='CARLOS DA SILVA', cpf_cnpj='12345678909')
+        processo = criar_processo(
+            self.despachante, duplicado, status='CANCELADO', data_solicitacao=timezone.localdate() - timedelta(days=400),
+        )
+        LogAtividade.objects.create(
+            despachante=self.despachante, atendimento=processo, cliente=duplicado, acao='STATUS', descricao='Cancelado',
+        )
+        arquivo.arquivar(self.despachante.id)
+        self.assertEqual(AtendimentoArquivado.objects.filter(cliente=duplicado).count(), 1)
+        self.assertEqual(LogAtividadeArquivado.objects.filter(cliente=duplicado).count(), 1)
+
+        resultado = deduplicacao.deduplicar(self.despachante.id)
+
+        self.assertEqual(resultado['mesclados'], 1)
+        self.assertFalse(Cliente.objects.filter(id=duplicado.id).exists())
+        self.assertEqual(list(AtendimentoArquivado.objects.values_list('cliente_id', flat=True)), [self.cliente.id])
+        self.assertEqual(list(LogAtividadeArquivado.objects.values_list('cliente_id', flat=True)), [self.cliente.id])
+
+    def ficha(self, cliente_id=1, nome='MARIA SOUZA', documento='', telefone='', email=''):
+        return deduplicacao._Ficha(cliente_id, nome, documento, telefone, email)
+
+    def test_nota_do_par(self):
+        limiar = deduplicacao.LIMIAR_PADRAO
+        nota = lambda a, b: deduplicacao.pontuar(self.ficha(1, **a), self.ficha(2, **b))
+
+        self.assertGreaterEqual(nota({'documento': '98765432100'}, {'nome': 'MARIA DE SOUZA', 'documento': '98765432100'}), limiar)
+        self.assertEqual(nota({'documento': '98765432100'}, {'documento': '12345678909'}), 0.0)
+        # Mesmo nome sem documento: só com telefone ou e-mail em comum
+        self.assertLess(nota({}, {}), limiar)
+        self.assertGreaterEqual(nota({'telefone': '62977770000'}, {'telefone': '62977770000'}), limiar)
+        self.assertGreaterEqual(nota({'email': 'maria@x.com'}, {'email': ' MARIA@x.com'}), limiar)
+        self.assertLess(nota({'telefone': '00000000000'}, {'telefone': '00000000000'}), limiar)
+        # Um com documento e outro sem: abaixo do limiar mesmo com contato em comum
+        contato = {'telefone': '62977770000', 'email': 'maria@x.com'}
+        self.assertLess(nota({'documento': '98765432100', **contato}, contato), limiar)
+
+    def test_chaves_de_bloco(self):
+        self.assertEqual(
+            self.ficha(nome='José da Silva Santos', documento='12345678909').chaves_bloco(),
+            ['doc:12345678909', 'nome:jose:santos'],
+        )
+        self.assertEqual(self.ficha(documento='00000000000').chaves_bloco(), ['nome:maria:souza'])
+
+        fichas = [
+            self.ficha(1, 'CARLOS SILVA', '12345678909'),
+            self.ficha(2, 'CARLOS DA SILVA', '12345678909'),
+            self.ficha(3, 'JOAO PEREIRA', telefone='62977770000'),
+            self.ficha(4, 'ANA LIMA', telefone='62977770000'),
+        ]
+        with mock.patch.object(deduplicacao, 'pontuar', wraps=deduplicacao.pontuar) as pontuar:
+            pares = deduplicacao.encontrar_pares(fichas)
+        self.assertEqual(pontuar.call_count, 1)  # Só o par que divide chaves, uma vez
+        self.assertEqual([par[:2] for par in pares], [(1, 2)])
+
+        homonimos = [self.ficha(numero, telefone='62977770000') for numero in range(3)]
+        self.assertEqual(len(deduplicacao.encontrar_pares(homonimos)), 3)
+        with mock.patch.object(deduplicacao, 'MAX_POR_BLOCO', 2):
+            self.assertEqual(deduplicacao.encontrar_pares(homonimos), [])
+
+    def test_mesclar_muda_o_dono_em_todas_as_tabelas(self):
+        duplicado = criar_cliente(self.despachante, nome='CARLOS DA SILVA', cpf_cnpj='12345678909')
+        Veiculo.objects.create(
+            despachante=self.despachante, cliente=duplicado, placa='ABC1D23', modelo='GOL',
+            ano_fabricacao=2010, ano_modelo=2011,
+        )
+        criar_processo(self.despachante, duplicado)
+        antigo = criar_processo(
+            self.despachante, duplicado, status='CANCELADO', data_solicitacao=timezone.localdate() - timedelta(days=400),
+        )
+        LogAtividade.objects.create(
+            despachante=self.despachante, atendimento=antigo, cliente=duplicado, acao='STATUS', descricao='Cancelado',
+        )
+        LogAtividade.objects.create(despachante=self.despachante, cliente=duplicado, acao='EDICAO', descricao='Editado')
+        Orcamento.objects.create(despachante=self.despachante, cliente=duplicado)
+        arquivo.arquivar(self.despachante.id)
+
+        linhas = {}
+        for modelo in deduplicacao.TABELAS_DO_CLIENTE:
+            linhas[modelo] = set(modelo.objects.filter(cliente=duplicado).values_list('id', flat=True))
+            self.assertTrue(linhas[modelo], modelo.__name__)
+
+        deduplicacao.deduplicar(self.despachante.id)
+
+        self.assertFalse(Cliente.objects.filter(id=duplicado.id).exists())
+        for modelo, ids in linhas.items():
+            self.assertEqual(
+                set(modelo.objects.filter(id__in=ids, cliente=self.cliente).values_list('id', flat=True)), ids,
+                modelo.__name__,
+            )
+
+    def test_limiar_e_simulacao(self):
+        # Telefone de criar_cliente em comum: nota 0.95
+        primeira = criar_cliente(self.despachante, nome='MARIA SOUZA', cpf_cnpj='')
+        segunda = criar_cliente(self.despachante, nome='MARIA SOUZA', cpf_cnpj='')
+        # Homônimos sem nada em comum além do nome ficam
+        criar_cliente(self.despachante, nome='JOAO PEREIRA', cpf_cnpj='', telefone='(62) 97777-0001')
+        criar_cliente(self.despachante, nome='JOAO PEREIRA', cpf_cnpj='', telefone='(62) 97777-0002')
+        criar_cliente(self.despachante, nome='CARLOS SILVA', cpf_cnpj='')
+
+        self.assertEqual(deduplicacao.deduplicar(self.despachante.id, limiar=0.99)['grupos'], [])
+
+        simulado = deduplicacao.deduplicar(self.despachante.id, simular=True)
+        self.assertEqual((simulado['grupos'], simulado['mesclados']), ([[primeira.id, segunda.id]], 0))
+        self.assertEqual(Cliente.objects.filter(despachante=self.despachante).count(), 6)
+
+        self.assertEqual(deduplicacao.deduplicar(self.despachante.id)['mesclados'], 1)
+        self.assertFalse(Cliente.objects.filter(id=segunda.id).exists())
+        self.assertEqual(Cliente.objects.filter(despachante=self.despachante).count(), 5)
+
+
+# ------------------------------------------------------------------------------
+# ARQUIVO FRIO
+# ------------------------------------------------------------------------------
+
+class ArquivoTest(TesteEscritorio):
+
+    def test_so_os_logs_apontam_para_o_processo(self):
+        # arquivo._arquivar_lote apaga os processos com _raw_delete, sem cascata:
+        # uma FK nova para Atendimento precisa ser tratada lá antes de passar aqui
+        relacoes = {(relacao.related_model, relacao.field.name) for relacao in Atendimento._meta.related_objects}
+        self.assertEqual(relacoes, {(LogAtividade, 'atendimento')})
+        self.assertEqual(Atendimento._meta.many_to_many, ())
+
+    def test_arquivar_move_so_os_finalizados_antigos(self):
+        velho = timezone.localdate() - timedelta(days=400)
+        pago = criar_processo(self.despachante, self.cliente, status='APROVADO', status_financeiro='PAGO', data_solicitacao=velho)
+        cancelado = criar_processo(self.despachante, self.cliente, status='CANCELADO', data_solicitacao=velho)
+        em_aberto = criar_processo(self.despachante, self.cliente, status='APROVADO', data_solicitacao=velho)
+        recente = criar_processo(self.despachante, self.cliente, status='CANCELADO')
+        for processo in (pago, em_aberto):
+            LogAtividade.objects.create(
+                despachante=self.despachante, atendimento=processo, cliente=self.cliente, acao='STATUS', descricao='Aprovado',
+            )
+        contadores.ler(self.despachante.id, contadores.CHAVE_ABERTOS)
+
+        self.assertEqual(arquivo.arquivar(self.despachante.id, lote=1), 2)
+
+        self.assertEqual(set(AtendimentoArquivado.objects.values_list('id', flat=True)), {pago.id, cancelado.id})
+        self.assertEqual(set(Atendimento.objects.values_list('id', flat=True)), {em_aberto.id, recente.id})
+        self.assertEqual(list(LogAtividadeArquivado.objects.values_list('atendimento_id', flat=True)), [pago.id])
+        self.assertEqual(list(LogAtividade.objects.values_list('atendimento_id', flat=True)), [em_aberto.id])
+        self.assertEqual(arquivo.arquivado_ate(self.despachante.id), velho)
+        self.assertEqual(arquivo.buscar_processo(token_rastreio=pago.token_rastreio).id, pago.id)
+        for chave in (contadores.CHAVE_ABERTOS, contadores.chave_mes(velho)):
+            self.assertEqual(
+                contadores.ler(self.despachante.id, chave), contadores._contar_no_banco(self.despachante.id, chave), chave,
+            )
+
+
+# ------------------------------------------------------------------------------
+# ORÇAMENTOS
+# ------------------------------------------------------------------------------
+
+class OrcamentoTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        self.servicos = [
+            TipoServico.objects.create(despachante=self.despachante, nome=f'Serviço {numero}', valor_base='10.00')
+            for numero in range(10)
+        ]
+
+    def criar(self, servicos, **campos):
+        dados = {
+            'cliente_id': self.cliente.id, 'honorarios_total': '100,00', 'desconto': '10,00',
+            'servicos[]': [servico.id for servico in servicos], 'taxas_item[]': ['1.234,50'] * len(servicos),
+        }
+        dados.update(campos)
+        return self.logar().post(reverse('novo_orcamento'), dados)
+
+    def test_numero_de_queries_nao_depende_dos_itens(self):
+        consultas = []
+        for quantidade in (1, 10):
+            with CaptureQueriesContext(connection) as contexto:
+                self.criar(self.servicos[:quantidade])
+            consultas.append(len(contexto))
+        self.assertEqual(consultas[0], consultas[1])
+
+        orcamento = Orcamento.objects.latest('id')
+        self.assertEqual(orcamento.itens.count(), 10)
+        self.assertEqual(orcamento.valor_taxas, Decimal('12345.00'))
+        self.assertEqual(orcamento.valor_total, Decimal('12435.00'))
+        self.assertEqual(
+            set(orcamento.itens.values_list('tipo_servico__nome', 'servico_nome')),
+            {(servico.nome, servico.nome) for servico in self.servicos},
+        )
+
+    def test_servico_de_outro_escritorio_e_recusado(self):
+        outro = criar_despachante(cnpj='00.000.000/0002-00')
+        alheio = TipoServico.objects.create(despachante=outro, nome='Serviço de Outro', valor_base='10.00')
+
+        self.assertRedirects(self.criar([self.servicos[0], alheio]), reverse('novo_orcamento'), fetch_redirect_response=False)
+        self.assertFalse(Orcamento.objects.exists())
+
+    def aprovar(self, orcamento):
+        return self.logar().get(reverse('aprovar_orcamento', args=[orcamento.id]))
+
+    def test_aprovar_duas_vezes_gera_um_processo(self):
+        orcamento = Orcamento.objects.create(
+            despachante=self.despachante, cliente=self.cliente, valor_honorarios=Decimal('100.00'),
+        )
+        self.assertRedirects(self.aprovar(orcamento), reverse('dashboard'), fetch_redirect_response=False)
+        self.assertRedirects(self.aprovar(orcamento), reverse('listar_orcamentos'), fetch_redirect_response=False)
+
+        self.assertEqual(Atendimento.objects.filter(cliente=self.cliente).count(), 1)
+        orcamento.refresh_from_db()
+        self.assertEqual(orcamento.status, 'APROVADO')
+
+    def test_so_orcamento_pendente_com_cliente_e_aprovado(self):
+        cancelado = Orcamento.objects.create(despachante=self.despachante, cliente=self.cliente, status='CANCELADO')
+        sem_cliente = Orcamento.objects.create(despachante=self.despachante)
+        self.aprovar(cancelado)
+        self.aprovar(sem_cliente)
+
+        self.assertFalse(Atendimento.objects.exists())
+        self.assertEqual(
+            list(Orcamento.objects.order_by('id').values_list('status', flat=True)), ['CANCELADO', 'PENDENTE'],
+        )
+
+        avulso = Orcamento.objects.create(despachante=self.despachante, nome_cliente_avulso='joana lima')
+        self.aprovar(avulso)
+        avulso.refresh_from_db()
+        self.assertEqual((avulso.status, avulso.cliente.nome), ('APROVADO', 'JOANA LIMA'))
+        self.assertEqual(Atendimento.objects.get().cliente_id, avulso.cliente_id)
+
+
+# ------------------------------------------------------------------------------
+# PRECIFICAÇÃO
+# ------------------------------------------------------------------------------
+
+class PrecificacaoTest(TesteEscritorio):
+
+    def test_recalcular_em_aberto(self):
+        valores = [('0.00', '10.25'), ('123.45', '333.33'), ('100.10', '35.15')]
+        abertos = [
+            criar_processo(self.despachante, self.cliente, status=status, valor_taxas_detran=taxas, valor_honorarios=honorarios)
+            for status, (taxas, honorarios) in zip(('SOLICITADO', 'APROVADO', 'PENDENTE'), valores)
+        ]
+        pago = criar_processo(self.despachante, self.cliente, status_financeiro='PAGO', valor_honorarios='500.00')
+        cancelado = criar_processo(self.despachante, self.cliente, status='CANCELADO', valor_honorarios='500.00')
+        Atendimento.objects.update(custo_impostos='99.99', custo_taxa_bancaria='99.99')
+
+        self.despachante.aliquota_imposto = Decimal('6.00')
+        self.despachante.taxa_bancaria_padrao = Decimal('3.50')
+        self.despachante.save()
+
+        self.assertEqual(precificacao.recalcular_em_aberto(self.despachante), 3)
+
+        custos = lambda processo: Atendimento.objects.values_list('custo_impostos', 'custo_taxa_bancaria').get(pk=processo.pk)
+        # Meio centavo arredonda para cima (10,25 x 6% = 0,615), igual ao cálculo em Python
+        self.assertEqual(
+            [custos(processo) for processo in abertos],
+            [(Decimal('0.62'), Decimal('0.36')), (Decimal('20.00'), Decimal('15.99')), (Decimal('2.11'), Decimal('4.73'))],
+        )
+        for processo, (taxas, honorarios) in zip(abertos, valores):
+            self.assertEqual(custos(processo), (
+                precificacao.custo_impostos(self.despachante, honorarios),
+                precificacao.custo_bancario(self.despachante, taxas, honorarios),
+            ))
+        for processo in (pago, cancelado):
+            self.assertEqual(custos(processo), (Decimal('99.99'), Decimal('99.99')))
+
+
+# ------------------------------------------------------------------------------
+# RESUMO DIÁRIO
+# ------------------------------------------------------------------------------
+
+class ResumoDiarioTest(TesteEscritorio):
+
+    def recontar(self):
+        """Agregado feito do zero nos processos ativos e arquivados."""
+        totais = {}
+        for modelo in (Atendimento, AtendimentoArquivado):
+            grupos = modelo.objects.filter(despachante=self.despachante).values(
+                'data_solicitacao', 'status', 'status_financeiro'
+            ).annotate(
+                quantidade=Count('id'), taxas=Sum('valor_taxas_detran'), honorarios=Sum('valor_honorarios'),
+                impostos=Sum('custo_impostos'), bancario=Sum('custo_taxa_bancaria'), sindego=Sum('custo_taxa_sindego'),
+            ).order_by()
+            for grupo in grupos:
+                chave = (grupo.pop('data_solicitacao'), grupo.pop('status'), grupo.pop('status_financeiro'))
+                anterior = totais.get(chave, (0,) + (Decimal('0.00'),) * 5)
+                totais[chave] = tuple(a + b for a, b in zip(anterior, grupo.values()))
+        return totais
+
+    def conferir(self):
+        mantido = {}
+        for linha in ResumoDiario.objects.filter(despachante=self.despachante):
+            vetor = tuple(getattr(linha, campo) for campo in resumo.CAMPOS)
+            if linha.quantidade:
+                mantido[(linha.data, linha.status, linha.status_financeiro)] = vetor
+            else:
+                self.assertFalse(any(vetor), linha)  # Linha esvaziada não pode guardar valores
+        self.assertEqual(mantido, self.recontar())
+
+    def test_resumo_acompanha_os_processos(self):
+        antigo = timezone.localdate() - timedelta(days=400)
+        processos = [
+            criar_processo(
+                self.despachante, self.cliente, data_solicitacao=data, valor_taxas_detran='100.10',
+                valor_honorarios='250.00', custo_impostos='15.00', custo_taxa_bancaria='8.76', custo_taxa_sindego='13.00',
+            )
+            for data in (antigo, antigo, date(2026, 3, 10), date(2026, 3, 10), date(2026, 3, 11))
+        ]
+        self.conferir()
+
+        # Edição: valor, status, situação financeira e data
+        processos[2].valor_honorarios = Decimal('300.55')
+        processos[2].save()
+        processos[3].status = 'APROVADO'
+        processos[3].status_financeiro = 'PAGO'
+        processos[3].save()
+        parcial = Atendimento.objects.only('id', 'data_solicitacao').get(pk=processos[4].pk)
+        parcial.data_solicitacao = date(2026, 4, 1)
+        parcial.save()
+        self.conferir()
+
+        processos[2].delete()
+        self.conferir()
+
+        # Arquivamento: os arquivados continuam contando
+        processos[0].status = 'CANCELADO'
+        processos[0].save()
+        processos[1].status, processos[1].status_financeiro = 'APROVADO', 'PAGO'
+        processos[1].save()
+        self.assertEqual(arquivo.arquivar(self.despachante.id), 2)
+        self.conferir()
+
+        # Recálculo em massa dos custos em aberto
+        self.despachante.aliquota_imposto = Decimal('6.00')
+        self.despachante.taxa_bancaria_padrao = Decimal('3.50')
+        self.despachante.save()
+        self.assertEqual(precificacao.recalcular_em_aberto(self.despachante), 1)
+        self.conferir()
+
+        # Exclusão do cliente leva também os arquivados
+        self.cliente.delete()
+        self.conferir()
+        self.assertFalse(ResumoDiario.objects.filter(despachante=self.despachante, quantidade__gt=0).exists())
+
+
+# ------------------------------------------------------------------------------
+# SÉRIE DO DASHBOARD FINANCEIRO
+# ------------------------------------------------------------------------------
+
+class SerieFinanceiraTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        custos = dict(custo_impostos='10.00', custo_taxa_bancaria='5.00', custo_taxa_sindego='1.00')
+        self.jan_25 = criar_processo(
+            self.despachante, self.cliente, status='APROVADO', data_solicitacao=date(2025, 1, 15),
+            valor_taxas_detran='100.00', valor_honorarios='200.00', **custos,
+        )
+        criar_processo(
+            self.despachante, self.cliente, status='APROVADO', status_financeiro='PAGO', data_solicitacao=date(2026, 1, 10),
+            valor_taxas_detran='50.00', valor_honorarios='300.00', **custos,
+        )
+        # Fora da série: não aprovado
+        criar_processo(self.despachante, self.cliente, data_solicitacao=date(2026, 1, 20), valor_honorarios='999.00')
+
+    def test_meses_de_anos_diferentes_sao_barras_diferentes(self):
+        serie = resumo.serie_financeira(self.despachante.id, date(2025, 1, 1), date(2026, 1, 31))
+        pontos = serie['pontos']
+
+        self.assertEqual(len(pontos), 13)
+        self.assertEqual((pontos[0]['rotulo'], pontos[-1]['rotulo']), ('Jan/25', 'Jan/26'))
+        self.assertEqual(
+            [(ponto['honorarios'], ponto['receita'], ponto['lucro'], ponto['pendentes']) for ponto in (pontos[0], pontos[-1])],
+            [(Decimal('200.00'), Decimal('300.00'), Decimal('184.00'), 1), (Decimal('300.00'), Decimal('350.00'), Decimal('284.00'), 0)],
+        )
+        # Meses sem movimento entram zerados
+        self.assertFalse(any(ponto[campo] for ponto in pontos[1:-1] for campo in resumo.CAMPOS_SERIE))
+        self.assertEqual(
+            (serie['totais']['receita'], serie['totais']['custos'], serie['totais']['pendentes']),
+            (Decimal('650.00'), Decimal('32.00'), 1),
+        )
+
+    def test_semanas_comecam_na_segunda(self):
+        serie = resumo.serie_financeira(self.despachante.id, date(2026, 1, 7), date(2026, 1, 25), 'semana')
+        self.assertEqual(
+            [(ponto['rotulo'], ponto['honorarios']) for ponto in serie['pontos']],
+            [('05/01/26', Decimal('300.00')), ('12/01/26', Decimal('0.00')), ('19/01/26', Decimal('0.00'))],
+        )
+
+    def test_cache_vale_ate_a_proxima_alteracao(self):
+        argumentos = (self.despachante.id, date(2025, 1, 1), date(2025, 1, 31))
+        self.assertEqual(resumo.serie_financeira(*argumentos)['totais']['honorarios'], Decimal('200.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(resumo.serie_financeira(*argumentos)['totais']['honorarios'], Decimal('200.00'))
+
+        self.jan_25.valor_honorarios = Decimal('250.00')
+        self.jan_25.save()
+        self.assertEqual(resumo.serie_financeira(*argumentos)['totais']['honorarios'], Decimal('250.00'))
+
+    def test_tela_agrupa_no_automatico(self):
+        cliente = self.logar()
+        anual = cliente.get(reverse('dashboard_financeiro'), {'data_inicio': '2025-01-01', 'data_fim': '2026-01-31'})
+        trimestre = cliente.get(reverse('dashboard_financeiro'), {'data_inicio': '2026-01-01', 'data_fim': '2026-03-31'})
+
+        self.assertEqual(len(json.loads(anual.context['labels_periodos'])), 13)
+        self.assertEqual(anual.context['resumo']['lucro'], Decimal('468.00'))
+        self.assertEqual(json.loads(trimestre.context['labels_periodos'])[0], '29/12/25')
+
+
+# ------------------------------------------------------------------------------
+# FLUXO DE CAIXA (RESUMO DO FILTRO)
+# ------------------------------------------------------------------------------
+
+class FluxoCaixaTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        maria = criar_cliente(self.despachante, nome='MARIA SOUZA', cpf_cnpj='98765432100')
+        custos = dict(custo_impostos='10.00', custo_taxa_bancaria='5.00', custo_taxa_sindego='1.00')
+        for cliente, financeiro, honorarios in (
+            (self.cliente, 'ABERTO', '200.00'), (self.cliente, 'PAGO', '300.00'), (maria, 'ABERTO', '100.00'),
+        ):
+            self.ultimo = criar_processo(
+                self.despachante, cliente, status='APROVADO', status_financeiro=financeiro, data_solicitacao=date(2026, 3, 10),
+                valor_taxas_detran='50.00', valor_honorarios=honorarios, **custos,
+            )
+        self.filtros = {'data_inicio': '2026-03-01', 'data_fim': '2026-03-31'}
+
+    def resumo(self, **filtros):
+        return self.logar().get(reverse('fluxo_caixa'), {**self.filtros, **filtros}).context['resumo']
+
+    def test_busca_soma_e_conta_pendentes_numa_consulta(self):
+        with mock.patch('cadastro.arquivo.agregar', wraps=arquivo.agregar) as agregar:
+            carlos = self.resumo(cliente='carlos')
+        self.assertEqual(agregar.call_count, 1)
+        self.assertEqual(
+            (carlos['total_pendentes'], carlos['valor_honorarios_bruto'], carlos['faturamento_total'], carlos['lucro_liquido_total']),
+            (1, Decimal('500.00'), Decimal('600.00'), Decimal('468.00')),
+        )
+
+        # Sem busca, o resumo diário chega aos mesmos números
+        todos = self.resumo()
+        self.assertEqual((todos['total_pendentes'], todos['valor_honorarios_bruto']), (2, Decimal('600.00')))
+        self.assertEqual(self.resumo(status_financeiro='PAGO')['total_custos_operacionais'], Decimal('16.00'))
+
+    def test_resumo_em_cache_por_filtro_ate_a_proxima_alteracao(self):
+        with mock.patch('cadastro.arquivo.agregar', wraps=arquivo.agregar) as agregar:
+            self.resumo(cliente='carlos')
+            # Mesma busca com outra caixa/espaços e em outra página: mesmo resumo
+            self.assertEqual(self.resumo(cliente=' CARLOS ', cursor='qualquer')['valor_honorarios_bruto'], Decimal('500.00'))
+            self.assertEqual(agregar.call_count, 1)
+
+            self.assertEqual(self.resumo(cliente='maria')['valor_honorarios_bruto'], Decimal('100.00'))
+            self.assertEqual(agregar.call_count, 2)
+
+            self.ultimo.valor_honorarios = Decimal('150.00')
+            self.ultimo.save()
+            self.assertEqual(self.resumo(cliente='maria')['valor_honorarios_bruto'], Decimal('150.00'))
+            self.assertEqual(agregar.call_count, 3)
+
+
+# ------------------------------------------------------------------------------
+# CADASTRO EM LOTE
+# ------------------------------------------------------------------------------
+
+class CadastroEmLoteTest(TesteEscritorio):
+
+    def setUp(self):
+        super().setUp()
+        for nome in ('Transferência', 'Licenciamento'):
+            TipoServico.objects.create(despachante=self.despachante, nome=nome, valor_base='100.00', honorarios='80.00')
+
+    def veiculo(self, placa):
+        return Veiculo.objects.create(
+            despachante=self.despachante, cliente=self.cliente, placa=placa, modelo='GOL',
+            ano_fabricacao=2010, ano_modelo=2011,
+        )
+
+    def lancar(self, *placas, servico='Transferência + Licenciamento'):
+        with transaction.atomic():
+            return criar_processos_em_lote(
+                self.despachante, self.cliente, self.usuario,
+                [{'placa': placa, 'modelo': 'gol', 'servico': servico, 'numero': ''} for placa in placas],
+            )
+
+    def test_placa_digitada_com_mascara_usa_o_veiculo_cadastrado(self):
+        existentes = [self.veiculo('ABC1D23'), self.veiculo('XYZ-9876')]
+
+        processos = self.lancar('abc-1d23', ' xyz9876 ', 'Abc.1D23')
+
+        self.assertEqual(
+            [processo.veiculo_id for processo in processos], [existentes[0].id, existentes[1].id, existentes[0].id]
+        )
+        self.assertEqual(Veiculo.objects.filter(despachante=self.despachante).count(), 2)
+
+    def test_numero_de_queries_nao_depende_do_tamanho_do_lote(self):
+        veiculos = [self.veiculo(f'ABC{numero:04d}') for numero in range(30)]
+        self.lancar('ABC0000')  # Cria as linhas de contador/resumo do dia
+        for tamanho in (1, 5, 30):
+            placas = [veiculo.placa.lower() for veiculo in veiculos[:tamanho]]
+            # Savepoint, serviços, veículos, processos, 2 contadores, resumo, release
+            with self.assertNumQueries(8):
+                self.assertEqual(len(self.lancar(*placas)), tamanho)
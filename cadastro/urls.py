@@ -22,6 +22,7 @@ urlpatterns = [
     # 2. DASHBOARD E OPERACIONAL
     # ==========================================================================
     path('', views.dashboard, name='dashboard'),
+    path('api/eventos/fila/', views.eventos_fila, name='eventos_fila'),  # SSE (servido via ASGI)
     
     # Processos / Atendimentos
     path('atendimento/novo/', views.novo_atendimento, name='novo_atendimento'),
@@ -41,6 +42,9 @@ urlpatterns = [
     # ==========================================================================
     path('clientes/', views.lista_clientes, name='lista_clientes'),
     path('cliente/novo/', views.novo_cliente, name='novo_cliente'),
+    path('clientes/importar/', views.importar_clientes, name='importar_clientes'),
+    path('clientes/importar/<str:token>/etapa/', views.importar_clientes_etapa, name='importar_clientes_etapa'),
+    path('clientes/importar/relatorio/<str:nome>/', views.baixar_relatorio_importacao, name='baixar_relatorio_importacao'),
     path('cliente/editar/<int:id>/', views.editar_cliente, name='editar_cliente'),
     path('cliente/excluir/<int:id>/', views.excluir_cliente, name='excluir_cliente'),
     path('cliente/<int:id>/detalhes/', views.detalhe_cliente, name='detalhe_cliente'),
@@ -68,6 +72,7 @@ urlpatterns = [
     # ==========================================================================
     path('api/buscar-clientes/', views.buscar_clientes, name='buscar_clientes'),
     path('api/veiculos-cliente/<int:cliente_id>/', views.api_veiculos_cliente, name='api_veiculos_cliente'),
+    path('api/consultar-placas/', views.api_consultar_placas, name='api_consultar_placas'),
     
     path('documentos/gerar/', views.selecao_documento, name='selecao_documento'),
     path('documentos/imprimir/', views.imprimir_documento, name='imprimir_documento'),
@@ -104,6 +109,8 @@ urlpatterns = [
     path('financeiro/bloqueado/', views.bloqueio_financeiro_admin, name='bloqueio_financeiro_admin'),
     path('financeiro/pagar/', views.pagar_mensalidade, name='pagar_mensalidade'),
 
+    path('master/cache/metricas/', views.master_metricas_cache, name='master_metricas_cache'),
+
     # Gestão de Despachantes (Empresas)
     path('master/despachantes/', views.master_listar_despachantes, name='master_listar_despachantes'),
     path('master/despachantes/novo/', views.master_editar_despachante, name='master_criar_despachante'),
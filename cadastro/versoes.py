@@ -0,0 +1,103 @@
+# cadastro/versoes.py
+
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from django.contrib import messages
+from config.cache import cache_estado
+from django.utils import timezone
+from .sessoes import CHAVE_SESSAO
+
+# ==============================================================================
+# VERSÃO DOS DADOS DO ESCRITÓRIO (ETag / Last-Modified / cache de fragmentos)
+# ==============================================================================
+# Cada escritório tem um carimbo "última alteração" no cache de estado, renovado pelos
+# signals quando um Atendimento, Cliente, Orçamento (ou o que aparece nas
+# listagens) é salvo/excluído. Enquanto o carimbo não muda, a mesma página
+# para o mesmo usuário é idêntica: o navegador recebe 304 e o miolo das
+# tabelas sai do cache de fragmentos.
+
+
+def _chave(despachante_id):
+    return f"versao_dados_{despachante_id}"
+
+
+def tocar(despachante_id):
+    """Marca que os dados do escritório mudaram agora."""
+    if despachante_id:
+        cache_estado.set(_chave(despachante_id), timezone.now().timestamp(), None)
+
+
+def _ler_carimbo(chave):
+    valor = cache_estado.get(chave)
+    if valor is None:
+        cache_estado.add(chave, timezone.now().timestamp(), None)
+        valor = cache_estado.get(chave)
+    return valor
+
+
+def carimbo(despachante_id):
+    """
+    Momento da última alteração (timestamp). Se o cache perdeu o valor,
+    assume "agora": na dúvida a página é gerada de novo, nunca fica velha.
+    """
+    return _ler_carimbo(_chave(despachante_id))
+
+
+# --- Versão de um cliente (histórico da ficha: processos, orçamentos e logs dele) ---
+
+def _chave_cliente(cliente_id):
+    return f"versao_cliente_{cliente_id}"
+
+
+def tocar_cliente(cliente_id):
+    if cliente_id:
+        cache_estado.set(_chave_cliente(cliente_id), timezone.now().timestamp(), None)
+
+
+def carimbo_cliente(cliente_id):
+    return _ler_carimbo(_chave_cliente(cliente_id))
+
+
+def ultima_alteracao(request):
+    """Last-Modified da página: última alteração dos dados, nunca antes da virada do dia."""
+    tenant = getattr(request, 'tenant', None)
+    if not tenant or not tenant.despachante:
+        return None
+    alterado = datetime.fromtimestamp(carimbo(tenant.despachante.id), tz=dt_timezone.utc)
+    inicio_do_dia = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(alterado, inicio_do_dia)
+
+
+def chave_pagina(request):
+    """
+    Identifica o conteúdo da página: dados do escritório + quem vê + o quê.
+    Entram o usuário/sessão (menus por papel, token CSRF nos formulários),
+    a data (alertas de prazo e de assinatura) e a URL completa (filtros/cursor).
+    """
+    tenant = getattr(request, 'tenant', None)
+    if not tenant or not tenant.despachante:
+        return None
+    partes = [
+        carimbo(tenant.despachante.id),
+        request.user.pk,
+        tenant.tipo_usuario,
+        tenant.plano,
+        tenant.dias_restantes,
+        request.session.get(CHAVE_SESSAO),
+        timezone.localdate().isoformat(),
+        request.get_full_path(),
+    ]
+    return hashlib.md5(repr(partes).encode()).hexdigest()
+
+
+def etag_pagina(request, *args, **kwargs):
+    """ETag para @condition. Sem ETag quando há mensagens pendentes (o 304 as esconderia)."""
+    if len(messages.get_messages(request)):
+        return None
+    return chave_pagina(request)
+
+
+def data_pagina(request, *args, **kwargs):
+    if len(messages.get_messages(request)):
+        return None
+    return ultima_alteracao(request)
@@ -1,23 +1,25 @@
 import os
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from django.db.models import Q, Sum, Count, Value, DecimalField
 from django.db import transaction
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse, FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
-from django.contrib.sessions.models import Session
 from django.core.cache import cache
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 from django.urls import reverse
-from django.db.models.functions import ExtractMonth, Coalesce
 import re
 import json
+import hashlib
+import asyncio
 import base64
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
 from django.core.paginator import Paginator
 from dotenv import load_dotenv
 import requests 
@@ -30,7 +32,7 @@ from .models import BaseConhecimento
 from .forms import BaseConhecimentoForm
 from groq import Groq
 from pathlib import Path
-from .decorators import plano_minimo
+from .decorators import plano_minimo, admin_obrigatorio, pagina_condicional
 from django.contrib.auth.views import PasswordChangeView
 from django.urls import reverse_lazy
 
@@ -39,9 +41,18 @@ from django.urls import reverse_lazy
 
 # Importação dos Modelos e Forms
 from .models import Atendimento, Cliente, Veiculo, TipoServico, PerfilUsuario, Despachante, Orcamento, ItemOrcamento, LogAtividade
-from .forms import AtendimentoForm, ClienteForm, VeiculoForm, DespachanteForm, UsuarioMasterForm, UsuarioMasterEditForm, CompressaoPDFForm
+from .forms import AtendimentoForm, ClienteForm, VeiculoForm, DespachanteForm, UsuarioMasterForm, UsuarioMasterEditForm, CompressaoPDFForm, ImportacaoClientesForm
 from .asaas import gerar_boleto_asaas
 from .utils import comprimir_pdf_memoria, registrar_log
+from . import contadores, sla, versoes, eventos, autocompletar, carteira, historico, arquivo, precificacao
+from . import resumo as resumo_diario
+from .normalizacao import filtro_busca, filtro_veiculo
+from .paginacao import paginar, paginar_por_cursor
+from .lote import criar_processos_em_lote, consultar_placas, MAX_PLACAS_CONSULTA
+from .importacao import ArquivoInvalido, pasta_relatorios
+from . import importacao
+
+logger = logging.getLogger(__name__)
 
 # --- VIEW PERSONALIZADA DE TROCA DE SENHA ---
 class CustomPasswordChangeView(PasswordChangeView):
@@ -114,30 +125,10 @@ def minha_view_de_login(request):
             # Motivo: Deixamos o usuário entrar para que o Middleware (middleware.py)
             # decida se ele vai para o Dashboard ou para a tela de Bloqueio/Pagamento.
             
+            # Single Session (Derruba login anterior): o signal user_logged_in
+            # gera um token novo, que invalida a sessão antiga (cadastro/sessoes.py)
             login(request, user)
 
-            if not request.session.session_key:
-                request.session.create()
-
-            nova_chave = request.session.session_key
-
-            # Single Session (Derruba login anterior)
-            try:
-                perfil, created = PerfilUsuario.objects.get_or_create(user=user)
-                chave_antiga = perfil.ultimo_session_key
-
-                if chave_antiga and chave_antiga != nova_chave:
-                    try:
-                        from django.contrib.sessions.models import Session
-                        Session.objects.get(session_key=chave_antiga).delete()
-                    except Session.DoesNotExist:
-                        pass
-
-                perfil.ultimo_session_key = nova_chave
-                perfil.save()
-            except:
-                pass # Se for superuser sem perfil, ignora
-
             return redirect('dashboard')
         
         else:
@@ -171,6 +162,7 @@ def pagar_mensalidade(request):
 # DASHBOARD
 # ==============================================================================
 @login_required
+@pagina_condicional
 def dashboard(request):
     try:
         perfil = request.user.perfilusuario
@@ -183,8 +175,8 @@ def dashboard(request):
     aviso_assinatura = None
     cor_aviso = 'warning'
     
-    # Verifica quantos dias faltam
-    dias = perfil.get_dias_restantes()
+    # Verifica quantos dias faltam (já calculado pelo TenantMiddleware)
+    dias = request.tenant.dias_restantes
     
     # Se dias for None (Vitalício), não mostra nada.
     if dias is not None:
@@ -200,18 +192,12 @@ def dashboard(request):
     # --- FILTROS E CONTAGENS ---
     data_filtro = request.GET.get('data_filtro')
     termo_busca = request.GET.get('busca')
-    status_finalizados = ['APROVADO', 'CANCELADO', 'CONCLUIDO', 'ENTREGUE']
-    hoje = timezone.now().date()
+    status_finalizados = contadores.STATUS_FINALIZADOS
+    hoje = timezone.localdate()
     
-    total_abertos = Atendimento.objects.filter(
-        despachante=despachante
-    ).exclude(status__in=status_finalizados).count()
-
-    total_mes = Atendimento.objects.filter(
-        despachante=despachante, 
-        data_solicitacao__month=hoje.month,
-        data_solicitacao__year=hoje.year
-    ).count()
+    # Contadores mantidos pelos signals (cadastro/signals.py): leitura O(1)
+    total_abertos = contadores.total_abertos(despachante)
+    total_mes = contadores.total_mes(despachante, hoje)
 
     # Query Principal
     fila_processos = Atendimento.objects.select_related(
@@ -220,7 +206,7 @@ def dashboard(request):
         despachante=despachante
     ).exclude(
         status__in=status_finalizados
-    ).order_by('data_solicitacao')
+    )
     
     if data_filtro:
         fila_processos = fila_processos.filter(data_solicitacao=data_filtro)
@@ -233,23 +219,20 @@ def dashboard(request):
             Q(servico__icontains=termo_busca)
         )
     
-    # Paginação
-    paginator = Paginator(fila_processos, 50)
-    page_obj = paginator.get_page(request.GET.get('page'))
-
-    # Lógica de Cores da Tabela
-    for processo in page_obj:
-        if processo.data_entrega:
-            dias_restantes = (processo.data_entrega - hoje).days
-            processo.dias_na_fila = dias_restantes
-            if dias_restantes < 0: processo.alerta_cor = 'danger'
-            elif dias_restantes <= 2: processo.alerta_cor = 'warning'
-            else: processo.alerta_cor = 'success'
-        else:
-            dias_corridos = (hoje - processo.data_solicitacao).days
-            if dias_corridos >= 30: processo.alerta_cor = 'danger'
-            elif dias_corridos >= 15: processo.alerta_cor = 'warning'
-            else: processo.alerta_cor = 'success'
+    # Urgência (SLA) calculada no banco: dá para filtrar e ordenar a fila inteira
+    filtro_urgencia = request.GET.get('urgencia')
+    ordem = request.GET.get('ordem')
+    fila_processos = sla.filtrar_urgencia(fila_processos, despachante, filtro_urgencia, hoje)
+    if ordem == 'urgencia':
+        # Uma consulta por faixa de urgência, cada uma ordenada pelo índice de data
+        fila_processos = sla.consultas_por_urgencia(fila_processos, despachante, hoje)
+        ordenacao = sla.ORDENACAO_URGENCIA
+    else:
+        fila_processos = sla.anotar_urgencia(fila_processos, despachante, hoje)
+        ordenacao = ['data_solicitacao', 'id']
+
+    # Paginação por cursor (custo constante em qualquer página, sem COUNT)
+    page_obj = paginar(request, fila_processos, 50, ordenacao)
 
     context = {
         'fila_processos': page_obj,
@@ -258,6 +241,10 @@ def dashboard(request):
         'perfil': perfil,
         'data_filtro': data_filtro,
         'termo_busca': termo_busca,
+        'filtro_urgencia': filtro_urgencia,
+        'ordem': ordem,
+        'chave_fragmento': versoes.chave_pagina(request),
+        'ultimo_evento': eventos.ultimo_id(despachante.id),
         
         # Passando as variáveis do aviso para o HTML
         'aviso_assinatura': aviso_assinatura,
@@ -266,6 +253,58 @@ def dashboard(request):
     
     return render(request, 'dashboard.html', context)
 
+
+# --- FILA AO VIVO (SERVER-SENT EVENTS) ---
+SSE_BATIMENTO = 15       # comentário ": ping" para proxies não fecharem a conexão
+SSE_DURACAO = 300        # fecha e deixa o EventSource reconectar (com Last-Event-ID)
+
+
+async def _fluxo_eventos_fila(despachante_id, ultimo):
+    yield "retry: 5000\n\n"
+
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+
+    # Uma leitura da sequência por escritório neste worker, compartilhada por todas as abas
+    async with eventos.observar(despachante_id) as observador:
+        while (restante := SSE_DURACAO - (loop.time() - inicio)) > 0:
+            atual = await observador.esperar(ultimo, min(SSE_BATIMENTO, restante))
+
+            if atual < ultimo:
+                # Sequência reiniciada: o cliente não tem como saber o que perdeu
+                yield f"id: {atual}\nevent: recarregar\ndata: {{}}\n\n"
+                ultimo = atual
+            elif atual > ultimo:
+                for seq, evento in await eventos.aeventos_desde(despachante_id, ultimo, atual):
+                    yield f"id: {seq}\nevent: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+                ultimo = atual
+            else:
+                yield ": ping\n\n"
+
+
+@login_required
+async def eventos_fila(request):
+    """
+    Stream (text/event-stream) com as mudanças da fila do escritório:
+    'criado', 'status' e 'excluido'. Só funciona servido por ASGI (config/asgi.py);
+    no WSGI responde 204, que faz o EventSource parar de tentar.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    tenant = request.tenant
+    if not tenant or not tenant.despachante:
+        return HttpResponse(status=204)
+
+    despachante_id = tenant.despachante.id
+    ultimo = request.headers.get('Last-Event-ID') or request.GET.get('desde') or ''
+    ultimo = int(ultimo) if ultimo.isdigit() else await eventos.aultimo_id(despachante_id)
+
+    resposta = StreamingHttpResponse(_fluxo_eventos_fila(despachante_id, ultimo), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'  # Nginx: não segurar o stream em buffer
+    return resposta
+
 # ==============================================================================
 # GESTÃO DE ATENDIMENTOS (CRUD) - REFATORADO PARA MODEL INTELIGENTE
 # ==============================================================================
@@ -287,35 +326,8 @@ def novo_atendimento(request):
             if not atendimento.responsavel:
                 atendimento.responsavel = request.user
             
-            # --- CORREÇÃO FINANCEIRA COMPLETA (DECIMAL) ---
-            if atendimento.tipo_servico:
-                # 1. Se valores estiverem zerados, puxa do catálogo
-                if not atendimento.valor_taxas_detran:
-                    atendimento.valor_taxas_detran = atendimento.tipo_servico.valor_base
-                
-                if not atendimento.valor_honorarios:
-                    atendimento.valor_honorarios = atendimento.tipo_servico.honorarios
-                
-                # 2. Lógica da Taxa Sindego (FALTAVA ISSO!)
-                if atendimento.custo_taxa_sindego == 0:
-                    if atendimento.tipo_servico.usa_taxa_sindego_reduzida:
-                        atendimento.custo_taxa_sindego = despachante.valor_taxa_sindego_reduzida
-                    else:
-                        atendimento.custo_taxa_sindego = despachante.valor_taxa_sindego_padrao
-
-            # 3. Recalcula Custos Variáveis (Imposto e Banco) com precisão
-            val_honorarios = Decimal(str(atendimento.valor_honorarios or 0))
-            val_taxas = Decimal(str(atendimento.valor_taxas_detran or 0))
-            
-            aliq_imposto = Decimal(str(despachante.aliquota_imposto or 0))
-            aliq_banco = Decimal(str(despachante.taxa_bancaria_padrao or 0))
-
-            # Imposto incide apenas sobre Honorários
-            atendimento.custo_impostos = val_honorarios * (aliq_imposto / 100)
-            
-            # Taxa bancária incide sobre o total transacionado
-            total_transacao = val_taxas + val_honorarios
-            atendimento.custo_taxa_bancaria = total_transacao * (aliq_banco / 100)
+            # --- FINANCEIRO: catálogo (se vazio), taxa sindical e custos ---
+            precificacao.precificar(atendimento, despachante)
 
             atendimento.save()
 
@@ -351,27 +363,9 @@ def editar_atendimento(request, id):
             atendimento_obj = form.save(commit=False)
             
             # --- FORÇA RECALCULO FINANCEIRO AO EDITAR ---
-            # Converte para Decimal
-            val_honorarios = Decimal(str(atendimento_obj.valor_honorarios or 0))
-            val_taxas = Decimal(str(atendimento_obj.valor_taxas_detran or 0))
-            
-            aliq_imposto = Decimal(str(despachante.aliquota_imposto or 0))
-            aliq_banco = Decimal(str(despachante.taxa_bancaria_padrao or 0))
-
-            # Recalcula custos proporcionais
-            atendimento_obj.custo_impostos = val_honorarios * (aliq_imposto / 100)
-            
-            total_transacao = val_taxas + val_honorarios
-            atendimento_obj.custo_taxa_bancaria = total_transacao * (aliq_banco / 100)
-            
-            # Nota: A taxa do sindicato (sindego) geralmente é fixa, então não recalculamos
-            # automaticamente na edição para não sobrescrever caso seja uma exceção manual.
-            # Mas garantimos que não fique zerada se foi esquecida.
-            if atendimento_obj.custo_taxa_sindego == 0 and atendimento_obj.tipo_servico:
-                 if atendimento_obj.tipo_servico.usa_taxa_sindego_reduzida:
-                     atendimento_obj.custo_taxa_sindego = despachante.valor_taxa_sindego_reduzida
-                 else:
-                     atendimento_obj.custo_taxa_sindego = despachante.valor_taxa_sindego_padrao
+            # A taxa do sindicato geralmente é fixa: só é preenchida se estiver zerada
+            # (para não sobrescrever uma exceção manual). Imposto e banco são sempre recalculados.
+            precificacao.precificar(atendimento_obj, despachante)
 
             atendimento_obj.save()
             
@@ -430,7 +424,7 @@ def excluir_atendimento(request, id):
 
 @login_required
 def imprimir_capa_processo(request, id):
-    atendimento = get_object_or_404(Atendimento, id=id, despachante=request.user.perfilusuario.despachante)
+    atendimento = get_object_or_404(Atendimento, id=id, despachante=request.tenant.despachante)
 
     # Lógica: Se enviou um POST, é porque está salvando o número
     if request.method == 'POST':
@@ -495,76 +489,22 @@ def cadastro_rapido(request):
                 obs_geral = request.POST.get('observacoes', '')
                 prazo_input = request.POST.get('prazo_entrega')
 
-                # LISTA PARA O RESUMO (NOVIDADE)
-                processos_criados = []
-
-                for i in range(len(placas)):
-                    placa_limpa = placas[i].replace('-', '').replace(' ', '').upper()
-                    if not placa_limpa: continue
-
-                    # 1. Cria ou Pega o Veículo (Mantido)
-                    veiculo, _ = Veiculo.objects.get_or_create(
-                        placa=placa_limpa,
-                        despachante=despachante,
-                        defaults={'cliente': cliente, 'modelo': modelos[i].upper()}
-                    )
-
-                    # 2. SOMATÓRIA DOS SERVIÇOS (Mantido)
-                    nomes_selecionados = [s.strip() for s in servicos_str_lista[i].split('+')]
-                    
-                    total_taxas_detran = Decimal('0.00')
-                    total_honorarios = Decimal('0.00')
-                    total_custo_sindego = Decimal('0.00')
-                    tipo_servico_vinculado = None
-
-                    for nome_s in nomes_selecionados:
-                        s_base = servicos_db.filter(nome__iexact=nome_s).first()
-                        
-                        if s_base:
-                            total_taxas_detran += s_base.valor_base
-                            total_honorarios += s_base.honorarios
-
-                            if s_base.usa_taxa_sindego_reduzida:
-                                total_custo_sindego += despachante.valor_taxa_sindego_reduzida
-                            else:
-                                total_custo_sindego += despachante.valor_taxa_sindego_padrao
-
-                            if len(nomes_selecionados) == 1:
-                                tipo_servico_vinculado = s_base
-
-                    # 3. CÁLCULO DE IMPOSTOS (Mantido)
-                    aliquota_db = Decimal(str(despachante.aliquota_imposto or 0))
-                    taxa_maq_db = Decimal(str(despachante.taxa_bancaria_padrao or 0))
-                    
-                    custo_imp = total_honorarios * (aliquota_db / 100)
-                    custo_ban = total_honorarios * (taxa_maq_db / 100)
+                # Lote inteiro com número fixo de queries (cadastro/lote.py)
+                linhas = [
+                    {
+                        'placa': placa,
+                        'modelo': modelos[i] if i < len(modelos) else '',
+                        'servico': servicos_str_lista[i] if i < len(servicos_str_lista) else '',
+                        'numero': atendimentos[i] if i < len(atendimentos) else '',
+                    }
+                    for i, placa in enumerate(placas)
+                ]
 
-                    # 4. CRIAÇÃO DO ATENDIMENTO (Mantido)
-                    atendimento = Atendimento.objects.create(
-                        despachante=despachante,
-                        cliente=cliente,
-                        veiculo=veiculo,
-                        tipo_servico=tipo_servico_vinculado, 
-                        servico=servicos_str_lista[i], 
-                        responsavel=responsavel_obj,
-                        numero_atendimento=atendimentos[i] if i < len(atendimentos) else '',
-                        
-                        valor_taxas_detran=total_taxas_detran,
-                        valor_honorarios=total_honorarios,
-                        
-                        custo_impostos=custo_imp,
-                        custo_taxa_bancaria=custo_ban,
-                        custo_taxa_sindego=total_custo_sindego,
-                        
-                        status_financeiro='ABERTO',
-                        status='SOLICITADO',
-                        data_solicitacao=timezone.now().date(),
-                        data_entrega=prazo_input if prazo_input else None,
-                        observacoes_internas=f"{obs_geral}\nGerado via Cadastro Rápido."
-                    )
-                    
-                    # ADICIONA À LISTA DE RESUMO
-                    processos_criados.append(atendimento)
+                # LISTA PARA O RESUMO (NOVIDADE)
+                processos_criados = criar_processos_em_lote(
+                    despachante, cliente, responsavel_obj, linhas,
+                    prazo_entrega=prazo_input, observacoes=obs_geral
+                )
 
             # --- REDIRECIONAMENTO NOVO ---
             # Em vez de voltar pro dashboard, vai pro resumo pra imprimir capas
@@ -697,13 +637,83 @@ def novo_cliente(request):
 
     return render(request, 'clientes/cadastro_cliente.html')
 
+# --- IMPORTAÇÃO DE PLANILHA (CLIENTES + VEÍCULOS) ---
+# O POST só salva o arquivo; a página processa em etapas (importar_clientes_etapa)
+FORMATO_TOKEN_IMPORTACAO = re.compile(r'[0-9a-f]{16}')
+
+
+@login_required
+@admin_obrigatorio()
+def importar_clientes(request):
+    despachante = request.tenant.despachante
+
+    if request.method == 'POST':
+        form = ImportacaoClientesForm(request.POST, request.FILES)
+        if form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            try:
+                token = importacao.iniciar(despachante, arquivo, arquivo.name)
+            except ArquivoInvalido as e:
+                messages.error(request, str(e))
+            else:
+                return redirect(f"{reverse('importar_clientes')}?importacao={token}")
+    else:
+        form = ImportacaoClientesForm()
+
+    token = request.GET.get('importacao', '')
+    estado = importacao.estado_importacao(despachante.id, token) if FORMATO_TOKEN_IMPORTACAO.fullmatch(token) else None
+
+    return render(request, 'clientes/importar_clientes.html', {
+        'form': form,
+        'importacao': token if estado and not estado['concluida'] else None,
+        'resultado': estado['resultado'] if estado and estado['concluida'] else None,
+    })
+
+
+@login_required
+@admin_obrigatorio()
+@require_POST
+def importar_clientes_etapa(request, token):
+    """Processa a próxima etapa da importação. A página chama até vir 'concluida'."""
+    despachante = request.tenant.despachante
+    if not FORMATO_TOKEN_IMPORTACAO.fullmatch(token):
+        raise Http404
+    antes = importacao.estado_importacao(despachante.id, token)
+    if antes is None:
+        raise Http404
+
+    estado = importacao.continuar(despachante, token)
+    resultado = estado['resultado']
+    if estado['concluida'] and not antes['concluida']:
+        registrar_log(
+            request,
+            'CRIACAO',
+            f"Importou a planilha {estado['nome']}: {resultado['clientes_criados']} clientes novos, "
+            f"{resultado['clientes_atualizados']} atualizados, {resultado['veiculos_criados']} veículos novos, "
+            f"{resultado['erros']} linhas com erro."
+        )
+        messages.success(request, f"Importação concluída: {resultado['linhas']} linhas lidas.")
+    return JsonResponse({'concluida': estado['concluida'], **resultado})
+
+
+@login_required
+@admin_obrigatorio()
+def baixar_relatorio_importacao(request, nome):
+    # Só arquivos do próprio escritório, com o nome no formato gerado pelo sistema
+    if not re.fullmatch(r'erros_[0-9a-f]{16}\.csv', nome):
+        raise Http404
+    caminho = pasta_relatorios(request.tenant.despachante.id) / nome
+    if not caminho.exists():
+        raise Http404
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=f"relatorio_{nome}")
+
 @login_required
 def novo_veiculo(request):
     if request.method == 'POST':
         form = VeiculoForm(request.user, request.POST)
         if form.is_valid():
             veiculo = form.save(commit=False)
-            veiculo.despachante = request.user.perfilusuario.despachante
+            veiculo.despachante = request.tenant.despachante
             veiculo.save()
             return redirect('dashboard')
     else:
@@ -712,33 +722,75 @@ def novo_veiculo(request):
     return render(request, 'veiculos/veiculo_form.html', {'form': form})
 
 @login_required
+@pagina_condicional
 def lista_clientes(request):
     perfil = request.user.perfilusuario
-    # Otimização: Traz apenas o necessário
-    clientes = Cliente.objects.filter(despachante=perfil.despachante).order_by('nome')
+    # Resumo de atividade (veículos, processos, devido, último serviço) em subconsultas: uma query por página
+    ordem = request.GET.get('ordem', carteira.ORDENACAO_PADRAO)
+    if ordem not in carteira.ORDENACOES:
+        ordem = carteira.ORDENACAO_PADRAO
+    clientes = carteira.anotar_resumo(Cliente.objects.filter(despachante=perfil.despachante), perfil.despachante_id)
+    clientes = carteira.ordenar(clientes, ordem)
     search_term = request.GET.get('q')
 
     if search_term:
-        clientes = clientes.filter(
-            Q(nome__icontains=search_term) | 
-            Q(cpf_cnpj__icontains=search_term) |
-            Q(telefone__icontains=search_term)
-        )
+        clientes = clientes.filter(filtro_busca(
+            search_term,
+            texto=['nome'],
+            documento=['documento_busca', 'telefone_busca'],
+        ))
     
     # Paginação para evitar crash com muitos clientes
     paginator = Paginator(clientes, 50)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    return render(request, 'clientes/lista_clientes.html', {'clientes': page_obj})
+    return render(request, 'clientes/lista_clientes.html', {
+        'clientes': page_obj,
+        'ordem': ordem,
+        'chave_fragmento': versoes.chave_pagina(request),
+    })
+
+# Frota do cliente (frotistas podem ter milhares de veículos): sempre paginada por cursor
+ORDENACAO_FROTA = ['placa', 'id']
+VEICULOS_POR_PAGINA = 50
+MAX_VEICULOS_POR_PAGINA = 200
+
+CAMPOS_VEICULO_API = (
+    'id', 'placa', 'modelo', 'renavam', 'marca', 'cor', 'ano_fabricacao', 'ano_modelo', 'tipo',
+    'proprietario_nome', 'proprietario_cpf', 'proprietario_telefone',
+)
+
+
+def _frota_cliente(despachante, cliente_id, termo):
+    veiculos = Veiculo.objects.filter(cliente_id=cliente_id, despachante=despachante)
+    if termo:
+        veiculos = veiculos.filter(filtro_veiculo(termo))
+    return veiculos
+
 
 @login_required
+@pagina_condicional
 def detalhe_cliente(request, id):
     perfil = request.user.perfilusuario
     cliente = get_object_or_404(Cliente, id=id, despachante=perfil.despachante)
-    # Usa o índice de veículo
-    veiculos = Veiculo.objects.filter(cliente_id=cliente.id, despachante=perfil.despachante).order_by('-id')
-    return render(request, 'clientes/detalhe_cliente.html', {'cliente': cliente, 'veiculos': veiculos})
+    termo = request.GET.get('q', '').strip()
+
+    veiculos = _frota_cliente(perfil.despachante, cliente.id, termo).only(
+        'id', 'placa', 'marca', 'modelo', 'cor', 'ano_fabricacao', 'ano_modelo', 'proprietario_nome'
+    )
+    pagina = paginar_por_cursor(veiculos, request.GET.get('cursor'), VEICULOS_POR_PAGINA, ORDENACAO_FROTA, request.GET)
+
+    # Linha do tempo: processos, orçamentos e auditoria do cliente (por cursor, em cache por versão do cliente)
+    linha_do_tempo = historico.pagina_historico(cliente.id, request.GET.get('historico'))
+
+    return render(request, 'clientes/detalhe_cliente.html', {
+        'cliente': cliente,
+        'veiculos': pagina,
+        'total_veiculos': Veiculo.objects.filter(cliente_id=cliente.id, despachante=perfil.despachante).count(),
+        'termo': termo,
+        'linha_do_tempo': linha_do_tempo,
+    })
 
 @login_required
 def editar_cliente(request, id):
@@ -809,7 +861,7 @@ def excluir_veiculo(request, id):
 # GESTÃO DE SERVIÇOS E APIS
 # ==============================================================================
 @login_required
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def gerenciar_servicos(request):
     perfil = request.user.perfilusuario
     servicos = TipoServico.objects.filter(despachante=perfil.despachante, ativo=True)
@@ -842,7 +894,7 @@ def gerenciar_servicos(request):
     return render(request, 'gerenciar_servicos.html', {'servicos': servicos})
 
 @login_required
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def editar_servico(request, id):
     if not request.user.is_superuser and not request.user.perfilusuario.tipo_usuario == 'ADMIN':
         messages.error(request, "Você não tem permissão para editar serviços.")
@@ -871,7 +923,7 @@ def editar_servico(request, id):
     return render(request, 'cadastro/editar_servico.html', {'servico': servico})
 
 @login_required
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def excluir_servico(request, id):
     perfil = request.user.perfilusuario
     servico = get_object_or_404(TipoServico, id=id, despachante=perfil.despachante)
@@ -894,55 +946,62 @@ def buscar_clientes(request):
     if not perfil or not perfil.despachante:
         return JsonResponse({'results': []}, safe=False)
 
-    despachante = perfil.despachante
-    # Otimização com select_related e índices
-    filters = Q(despachante=despachante)
-
-    if term:
-        term_limpo = re.sub(r'\D', '', term) 
-        filters = filters & (
-            Q(nome__icontains=term) | 
-            Q(cpf_cnpj__icontains=term) | 
-            Q(telefone__icontains=term) |
-            Q(veiculos__placa__icontains=term)  
-        )
-        if term_limpo:
-             filters |= Q(cpf_cnpj__icontains=term_limpo)
-
-    clientes = Cliente.objects.filter(filters).distinct().order_by('nome')[:20]
-    results = [{'id': c.id, 'text': f"{c.nome.upper()} - {c.cpf_cnpj}"} for c in clientes]
+    # Índice de prefixos em memória (cadastro/autocompletar.py): não consulta o banco a cada tecla
+    clientes = autocompletar.buscar(perfil.despachante_id, term)
+    results = [{'id': cliente_id, 'text': f"{nome.upper()} - {cpf_cnpj}"} for cliente_id, nome, cpf_cnpj in clientes]
     return JsonResponse({'results': results}, safe=False)
 
 @login_required
+@pagina_condicional
 def api_veiculos_cliente(request, cliente_id):
+    """
+    Veículos do cliente em páginas: ?q= (placa, modelo ou renavam), ?cursor= e ?limite=.
+    Retorna {'results': [...], 'proximo': cursor da próxima página ou null}.
+    """
     # Garante segurança: só busca se o usuário estiver logado e vinculado a um despachante
     if not hasattr(request.user, 'perfilusuario'):
-        return JsonResponse([], safe=False)
+        return JsonResponse({'results': [], 'proximo': None})
+
+    despachante = request.tenant.despachante
+    try:
+        limite = min(max(int(request.GET.get('limite', VEICULOS_POR_PAGINA)), 1), MAX_VEICULOS_POR_PAGINA)
+    except ValueError:
+        limite = VEICULOS_POR_PAGINA
 
-    despachante = request.user.perfilusuario.despachante
-    
     # Filtra veiculos do cliente, mas APENAS deste despachante (segurança)
-    veiculos = Veiculo.objects.filter(cliente_id=cliente_id, despachante=despachante)
-    
+    veiculos = _frota_cliente(despachante, cliente_id, request.GET.get('q', '').strip()).values(*CAMPOS_VEICULO_API)
+    pagina = paginar_por_cursor(veiculos, request.GET.get('cursor'), limite, ORDENACAO_FROTA)
+
     data = [{
-        'id': v.id,
-        'placa': v.placa,
-        'modelo': v.modelo,
-        'renavam': v.renavam or '',
-        'marca': v.marca or '',
-        'cor': v.cor,
-        'ano_fab': v.ano_fabricacao,
-        'ano_mod': v.ano_modelo,
-        'tipo': v.tipo,
-        
-        # --- NOVOS CAMPOS ADICIONADOS ---
+        'id': v['id'],
+        'placa': v['placa'],
+        'modelo': v['modelo'],
+        'renavam': v['renavam'] or '',
+        'marca': v['marca'] or '',
+        'cor': v['cor'],
+        'ano_fab': v['ano_fabricacao'],
+        'ano_mod': v['ano_modelo'],
+        'tipo': v['tipo'],
         # O 'or ""' garante que se estiver vazio no banco, vai uma string vazia para o JSON
-        'proprietario_nome': v.proprietario_nome or '', 
-        'proprietario_cpf': v.proprietario_cpf or '',
-        'proprietario_telefone': v.proprietario_telefone or ''
-    } for v in veiculos]
-    
-    return JsonResponse(data, safe=False)
+        'proprietario_nome': v['proprietario_nome'] or '',
+        'proprietario_cpf': v['proprietario_cpf'] or '',
+        'proprietario_telefone': v['proprietario_telefone'] or '',
+    } for v in pagina]
+
+    return JsonResponse({'results': data, 'proximo': pagina.next_cursor})
+
+@login_required
+def api_consultar_placas(request):
+    """
+    Pré-validação do cadastro rápido: ?placas=ABC1234,ABC1D23,... (até 100).
+    Diz quais já existem, de qual cliente são e os processos em aberto de cada uma.
+    """
+    if not hasattr(request.user, 'perfilusuario'):
+        return JsonResponse({'encontradas': {}, 'novas': [], 'invalidas': []})
+
+    placas = re.split(r'[\s,;]+', request.GET.get('placas', ''))
+    placas = [placa for placa in placas if placa][:MAX_PLACAS_CONSULTA]
+    return JsonResponse(consultar_placas(request.tenant.despachante, placas))
 
 # ==============================================================================
 # ORÇAMENTOS
@@ -983,11 +1042,18 @@ def novo_orcamento(request):
                     raise Exception("Adicione pelo menos um item ao orçamento.")
 
                 # --- 2. PROCESSA OS ITENS E SOMA AS TAXAS ---
+                # Todos os serviços do catálogo numa consulta só (e só os deste escritório)
+                ids_catalogo = {int(servico_id) for servico_id in ids_servicos if servico_id.isdigit()}
+                catalogo = TipoServico.objects.filter(despachante=perfil.despachante).in_bulk(ids_catalogo)
+                if len(catalogo) != len(ids_catalogo):
+                    # A tela só manda serviços do catálogo: id de fora é de outro escritório ou foi excluído
+                    raise Exception("Serviço não encontrado no catálogo do escritório.")
+
                 itens_para_criar = []
                 soma_taxas = Decimal('0.00')
 
                 for servico_id, taxa_raw in zip(ids_servicos, valores_taxas_lista):
-                    servico_obj = TipoServico.objects.filter(id=servico_id).first()
+                    servico_obj = catalogo.get(int(servico_id)) if servico_id.isdigit() else None
                     nome_servico = servico_obj.nome if servico_obj else "Serviço Avulso"
                     
                     valor_taxa_item = limpar_valor(taxa_raw)
@@ -995,6 +1061,7 @@ def novo_orcamento(request):
 
                     # Preparamos o item para criação posterior
                     itens_para_criar.append(ItemOrcamento(
+                        tipo_servico=servico_obj,
                         servico_nome=nome_servico,
                         valor=valor_taxa_item
                     ))
@@ -1004,10 +1071,15 @@ def novo_orcamento(request):
                 valor_total_calculado = (soma_taxas + honorarios_globais) - desconto
 
                 # --- 4. CRIAÇÃO DO OBJETO ORÇAMENTO ---
-                veiculo_obj = Veiculo.objects.filter(id=veiculo_id).first() if veiculo_id else None
+                veiculo_obj = Veiculo.objects.filter(id=veiculo_id, despachante=perfil.despachante).first() if veiculo_id else None
+
+                # Vincula cliente cadastrado ou nome avulso (já no INSERT, sem um save() extra)
+                cliente_obj = Cliente.objects.filter(id=cliente_id, despachante=perfil.despachante).first() if cliente_id else None
                 
                 orcamento = Orcamento.objects.create(
                     despachante=perfil.despachante,
+                    cliente=cliente_obj,
+                    nome_cliente_avulso=nome_avulso.upper() if nome_avulso and not cliente_id else None,
                     veiculo=veiculo_obj,
                     observacoes=observacoes,
                     status='PENDENTE',
@@ -1017,18 +1089,11 @@ def novo_orcamento(request):
                     valor_total=valor_total_calculado
                 )
 
-                # Vincula cliente cadastrado ou nome avulso
-                if cliente_id:
-                    orcamento.cliente = Cliente.objects.filter(id=cliente_id).first()
-                elif nome_avulso:
-                    orcamento.nome_cliente_avulso = nome_avulso.upper()
-                
-                orcamento.save()
-
                 # --- 5. SALVA OS ITENS VINCULADOS ---
+                # Um INSERT para todos (o post_save do Orcamento já renovou a versão dos dados)
                 for item in itens_para_criar:
                     item.orcamento = orcamento
-                    item.save()
+                ItemOrcamento.objects.bulk_create(itens_para_criar)
 
                 messages.success(request, f"Orçamento #{orcamento.id} gerado com sucesso!")
                 return redirect('detalhe_orcamento', id=orcamento.id)
@@ -1046,44 +1111,44 @@ def detalhe_orcamento(request, id):
     orcamento = get_object_or_404(
         Orcamento.objects.prefetch_related('itens'), 
         id=id, 
-        despachante=request.user.perfilusuario.despachante
+        despachante=request.tenant.despachante
     )
     return render(request, 'financeiro/detalhe_orcamento.html', {'orcamento': orcamento})
 
 @login_required
 def aprovar_orcamento(request, id):
-    # Garante que o orçamento pertence ao despachante logado
-    orcamento = get_object_or_404(Orcamento, id=id, despachante=request.user.perfilusuario.despachante)
-    despachante = request.user.perfilusuario.despachante
-
-    if orcamento.status == 'APROVADO':
-        messages.warning(request, "Este orçamento já foi aprovado anteriormente.")
-        return redirect('listar_orcamentos')
-
-    # Verifica e Cria Cliente Avulso se necessário
-    if not orcamento.cliente and orcamento.nome_cliente_avulso:
-        try:
-            novo_cliente = Cliente.objects.create(
-                despachante=orcamento.despachante,
-                nome=orcamento.nome_cliente_avulso.upper(),
-                telefone="(00) 00000-0000", 
-                observacoes="Criado automaticamente via Aprovação de Orçamento."
-            )
-            orcamento.cliente = novo_cliente
-            orcamento.save()
-        except Exception as e:
-            messages.error(request, f"Erro ao criar cliente avulso: {e}")
-            return redirect('detalhe_orcamento', id=id)
-
-    if not orcamento.cliente:
-        messages.error(request, "Não foi possível aprovar: Cliente não identificado.")
-        return redirect('detalhe_orcamento', id=id)
+    despachante = request.tenant.despachante
 
     try:
         with transaction.atomic():
-            # 1. Atualiza status do orçamento
-            orcamento.status = 'APROVADO'
-            orcamento.save()
+            # 1. Passa de PENDENTE para APROVADO num UPDATE condicional: de dois cliques
+            # (ou abas) ao mesmo tempo, só um muda a linha e gera o processo. Vale no
+            # SQLite também, onde o select_for_update não trava nada. O update() não
+            # dispara signals: o processo criado abaixo renova a versão dos dados.
+            aprovou = Orcamento.objects.filter(id=id, despachante=despachante, status='PENDENTE').update(status='APROVADO')
+            orcamento = get_object_or_404(Orcamento.objects.select_related('cliente'), id=id, despachante=despachante)
+
+            if not aprovou:
+                if orcamento.status == 'APROVADO':
+                    messages.warning(request, "Este orçamento já foi aprovado anteriormente.")
+                else:
+                    messages.warning(request, "Orçamento cancelado não pode ser aprovado.")
+                return redirect('listar_orcamentos')
+
+            # Verifica e Cria Cliente Avulso se necessário
+            if not orcamento.cliente and orcamento.nome_cliente_avulso:
+                orcamento.cliente = Cliente.objects.create(
+                    despachante=despachante,
+                    nome=orcamento.nome_cliente_avulso.upper(),
+                    telefone="(00) 00000-0000",
+                )
+                orcamento.save(update_fields=['cliente'])
+
+            if not orcamento.cliente:
+                # Desfaz a aprovação: o orçamento continua pendente
+                transaction.set_rollback(True)
+                messages.error(request, "Não foi possível aprovar: Cliente não identificado.")
+                return redirect('detalhe_orcamento', id=id)
 
             # 2. Pega os valores GLOBAIS que já estão salvos no orçamento (Muito mais fácil!)
             total_taxas_reais = orcamento.valor_taxas
@@ -1095,41 +1160,21 @@ def aprovar_orcamento(request, id):
             detalhes_texto = []
             total_custo_sindego = Decimal('0.00')
 
-            for item in orcamento.itens.all():
+            # Itens e o serviço do catálogo de cada um numa consulta só
+            for item in orcamento.itens.select_related('tipo_servico'):
                 lista_descricoes.append(item.servico_nome)
                 detalhes_texto.append(f"- {item.servico_nome}: Taxa R$ {item.valor}")
                 
-                # --- Cálculo da Taxa Sindicato (SINDEGO) ---
-                servico_catalogo = TipoServico.objects.filter(
-                    despachante=orcamento.despachante, 
-                    nome__iexact=item.servico_nome
-                ).first()
-
-                if servico_catalogo:
-                    if servico_catalogo.isenta_taxa_sindego:
-                        total_custo_sindego += Decimal('0.00')
-                    elif servico_catalogo.usa_taxa_sindego_reduzida:
-                        total_custo_sindego += despachante.valor_taxa_sindego_reduzida
-                    else:
-                        total_custo_sindego += despachante.valor_taxa_sindego_padrao
-                else:
-                    # Se for serviço avulso ou não achar, cobra padrão
-                    total_custo_sindego += despachante.valor_taxa_sindego_padrao
+                # --- Taxa Sindicato (SINDEGO): serviço avulso (ou que saiu do catálogo) cobra a padrão ---
+                total_custo_sindego += precificacao.taxa_sindego(despachante, item.tipo_servico)
 
             # 4. Cálculo de Lucro Líquido (Honorário - Desconto)
             honorario_liquido = total_honorarios_reais - desconto
             if honorario_liquido < 0: honorario_liquido = Decimal('0.00')
 
-            # 5. Cálculo de Custos Variáveis (Imposto e Banco)
-            aliq_imposto = Decimal(str(despachante.aliquota_imposto or 0))
-            aliq_banco = Decimal(str(despachante.taxa_bancaria_padrao or 0))
-
-            # Imposto apenas sobre o Honorário Líquido (Nota Fiscal)
-            custo_impostos = honorario_liquido * (aliq_imposto / 100)
-            
-            # Taxa Bancária sobre o valor TOTAL transacionado (Cliente pagou tudo no cartão)
-            valor_transacionado = total_taxas_reais + honorario_liquido
-            custo_bancario = valor_transacionado * (aliq_banco / 100)
+            # 5. Cálculo de Custos Variáveis (Imposto e Banco) sobre o Honorário Líquido
+            custo_impostos = precificacao.custo_impostos(despachante, honorario_liquido)
+            custo_bancario = precificacao.custo_bancario(despachante, total_taxas_reais, honorario_liquido)
 
             # 6. Definição de Pagador
             # Se cobramos taxas no orçamento, o dinheiro entrou aqui -> Nós pagamos o Detran
@@ -1150,7 +1195,7 @@ def aprovar_orcamento(request, id):
 
             # 8. CRIAÇÃO DO PROCESSO (ATENDIMENTO)
             Atendimento.objects.create(
-                despachante=orcamento.despachante,
+                despachante=despachante,
                 cliente=orcamento.cliente,
                 veiculo=orcamento.veiculo,
                 
@@ -1178,21 +1223,16 @@ def aprovar_orcamento(request, id):
         messages.success(request, f"Processo gerado com sucesso! Honorário Líquido: R$ {honorario_liquido}")
         return redirect('dashboard')
 
+    except Http404:
+        raise
     except Exception as e:
-        print(f"ERRO CRÍTICO AO APROVAR ORÇAMENTO: {e}") 
-        messages.error(request, f"Erro crítico ao gerar processo: {str(e)}")
-        return redirect('detalhe_orcamento', id=id)
-
-        messages.success(request, f"Processo gerado com sucesso! Honorário Líquido: R$ {honorario_liquido}")
-        return redirect('dashboard')
-
-    except Exception as e:
-        print(f"ERRO CRÍTICO AO APROVAR ORÇAMENTO: {e}") 
+        logger.exception("Erro ao aprovar o orçamento %s", id)
         messages.error(request, f"Erro crítico ao gerar processo: {str(e)}")
         return redirect('detalhe_orcamento', id=id)
     
     
 @login_required
+@pagina_condicional
 def listar_orcamentos(request):
     termo = request.GET.get('termo', '').strip()
     status_filtro = request.GET.get('status')
@@ -1205,12 +1245,11 @@ def listar_orcamentos(request):
     ).select_related('cliente', 'veiculo').prefetch_related('itens').order_by('-data_criacao')
     
     if termo:
-        filtros = (
-            Q(cliente__nome__icontains=termo) |
-            Q(cliente__cpf_cnpj__icontains=termo) |
-            Q(nome_cliente_avulso__icontains=termo) |
-            Q(veiculo__placa__icontains=termo) |
-            Q(veiculo__modelo__icontains=termo)
+        filtros = filtro_busca(
+            termo,
+            texto=['cliente__nome', 'nome_cliente_avulso', 'veiculo__modelo'],
+            documento=['cliente__documento_busca'],
+            placa=['veiculo__placa_busca'],
         )
         if termo.isdigit():
             filtros |= Q(id=termo)
@@ -1224,7 +1263,11 @@ def listar_orcamentos(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
         
-    return render(request, 'financeiro/lista_orcamentos.html', {'orcamentos': page_obj, 'filters': request.GET})
+    return render(request, 'financeiro/lista_orcamentos.html', {
+        'orcamentos': page_obj,
+        'filters': request.GET,
+        'chave_fragmento': versoes.chave_pagina(request),
+    })
 
 @login_required
 def excluir_orcamento(request, id):
@@ -1276,7 +1319,7 @@ from django.db.models import Count
 
 @login_required
 def relatorio_mensal(request):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     
     # 1. Filtros
     data_inicio = request.GET.get('data_inicio')
@@ -1284,31 +1327,39 @@ def relatorio_mensal(request):
     termo = request.GET.get('cliente_placa')
     responsavel_id = request.GET.get('responsavel')
 
-    # 2. Query Base
-    processos = Atendimento.objects.filter(despachante=despachante).select_related('cliente', 'veiculo', 'responsavel').order_by('-data_solicitacao')
+    # 2. Query Base (+ arquivo, se o período alcançar processos arquivados)
+    def filtrar(modelo):
+        processos = modelo.objects.filter(despachante=despachante).select_related('cliente', 'veiculo', 'responsavel').order_by('-data_solicitacao')
 
-    # 3. Aplica Filtros
-    if data_inicio: processos = processos.filter(data_solicitacao__gte=data_inicio)
-    if data_fim: processos = processos.filter(data_solicitacao__lte=data_fim)
-    
-    if termo:
-        processos = processos.filter(
-            Q(cliente__nome__icontains=termo) | 
-            Q(veiculo__placa__icontains=termo)
-        )
-    
-    if responsavel_id:
-        processos = processos.filter(responsavel_id=responsavel_id)
+        # 3. Aplica Filtros
+        if data_inicio: processos = processos.filter(data_solicitacao__gte=data_inicio)
+        if data_fim: processos = processos.filter(data_solicitacao__lte=data_fim)
+
+        if termo:
+            processos = processos.filter(filtro_busca(
+                termo,
+                texto=['cliente__nome'],
+                documento=['cliente__documento_busca'],
+                placa=['veiculo__placa_busca'],
+            ))
+
+        if responsavel_id:
+            processos = processos.filter(responsavel_id=responsavel_id)
+        return processos
+
+    consultas = [filtrar(modelo) for modelo in arquivo.modelos_do_periodo(despachante.id, data_inicio)]
 
     # 4. Cálculos de Resumo (Totais Globais - Antes da Paginação)
-    # Isso garante que os cards mostrem o total real do filtro
-    resumo_status = processos.values('status').annotate(total=Count('status')).order_by('status')
-    total_qtd = processos.count()
+    # Isso garante que os cards mostrem o total real do filtro.
+    # Só período: lê o resumo diário em vez de contar os processos
+    if termo or responsavel_id:
+        resumo_status = arquivo.somar_contagens(consultas, 'status')
+    else:
+        resumo_status = resumo_diario.contagem_por_status(resumo_diario.linhas(despachante.id, data_inicio, data_fim))
+    total_qtd = sum(item['total'] for item in resumo_status)
 
-    # 5. Paginação (20 por página)
-    paginator = Paginator(processos, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # 5. Paginação por cursor (20 por página)
+    page_obj = paginar(request, consultas, 20, ['-data_solicitacao', '-id'])
 
     # 6. Contexto
     equipe = PerfilUsuario.objects.filter(despachante=despachante) # Para o select de operadores
@@ -1336,19 +1387,32 @@ def relatorio_servicos(request):
     total_geral_valor = 0
 
     if cliente_placa:
-        # Filtra atendimentos aprovados
-        atendimentos = Atendimento.objects.filter(
-            despachante=request.user.perfilusuario.despachante,
-            status='APROVADO' 
-        ).select_related('cliente', 'veiculo').order_by('cliente__nome', '-data_solicitacao')
-
-        # Aplica filtros extras
-        if data_inicio: atendimentos = atendimentos.filter(data_solicitacao__gte=data_inicio)
-        if data_fim: atendimentos = atendimentos.filter(data_solicitacao__lte=data_fim)
-        if status_fin: atendimentos = atendimentos.filter(status_financeiro=status_fin)
-
-        # Filtro de busca textual
-        atendimentos = atendimentos.filter(Q(cliente__nome__icontains=cliente_placa) | Q(veiculo__placa__icontains=cliente_placa))
+        despachante = request.tenant.despachante
+
+        def filtrar(modelo):
+            # Filtra atendimentos aprovados
+            atendimentos = modelo.objects.filter(
+                despachante=despachante,
+                status='APROVADO'
+            ).select_related('cliente', 'veiculo').order_by('cliente__nome', '-data_solicitacao')
+
+            # Aplica filtros extras
+            if data_inicio: atendimentos = atendimentos.filter(data_solicitacao__gte=data_inicio)
+            if data_fim: atendimentos = atendimentos.filter(data_solicitacao__lte=data_fim)
+            if status_fin: atendimentos = atendimentos.filter(status_financeiro=status_fin)
+
+            # Filtro de busca textual
+            return atendimentos.filter(filtro_busca(
+                cliente_placa,
+                texto=['cliente__nome'],
+                documento=['cliente__documento_busca'],
+                placa=['veiculo__placa_busca'],
+            ))
+
+        modelos = arquivo.modelos_do_periodo(despachante.id, data_inicio)
+        atendimentos = [item for modelo in modelos for item in filtrar(modelo)]
+        if len(modelos) > 1:
+            atendimentos.sort(key=lambda item: (item.cliente.nome, -item.data_solicitacao.toordinal()))
 
         relatorio_agrupado = {}
         
@@ -1446,11 +1510,13 @@ def relatorio_servicos(request):
 def is_admin_or_superuser(user):
     return user.is_superuser or (hasattr(user, 'perfilusuario') and user.perfilusuario.tipo_usuario == 'ADMIN')
 
+VALIDADE_RESUMO_FLUXO_CAIXA = 60 * 60 * 24  # Segundos; a chave já muda a cada alteração de dados
+
 @login_required
 @plano_minimo('MEDIO')
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def fluxo_caixa(request):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     
     # Filtros da URL
     data_inicio = request.GET.get('data_inicio')
@@ -1458,70 +1524,109 @@ def fluxo_caixa(request):
     cliente_nome = request.GET.get('cliente')
     status_fin = request.GET.get('status_financeiro')
 
-    # QuerySet Base (Otimizada)
-    # Adicionamos 'tipo_servico' no select_related para evitar queries extras na tabela
-    processos = Atendimento.objects.filter(
-        despachante=despachante, 
-        status='APROVADO'
-    ).select_related('cliente', 'veiculo', 'tipo_servico').order_by('-data_solicitacao')
-
-    # Aplicação dos Filtros
-    if not any([data_inicio, data_fim, cliente_nome, status_fin]):
-        # Se não tem filtro, mostra o mês atual
-        hoje = timezone.now().date()
-        processos = processos.filter(data_solicitacao__month=hoje.month, data_solicitacao__year=hoje.year)
-    else:
+    # Sem filtro, mostra o mês atual (que nunca está no arquivo)
+    sem_filtro = not any([data_inicio, data_fim, cliente_nome, status_fin])
+    inicio_periodo = timezone.now().date().replace(day=1) if sem_filtro else data_inicio
+
+    def filtrar(modelo):
+        # QuerySet Base (Otimizada)
+        # Adicionamos 'tipo_servico' no select_related para evitar queries extras na tabela
+        processos = modelo.objects.filter(
+            despachante=despachante,
+            status='APROVADO'
+        ).select_related('cliente', 'veiculo', 'tipo_servico').order_by('-data_solicitacao')
+
+        # Aplicação dos Filtros
+        if sem_filtro:
+            hoje = timezone.now().date()
+            return processos.filter(data_solicitacao__month=hoje.month, data_solicitacao__year=hoje.year)
+
         if data_inicio: processos = processos.filter(data_solicitacao__gte=data_inicio)
         if data_fim: processos = processos.filter(data_solicitacao__lte=data_fim)
-        
-        if cliente_nome: 
+
+        if cliente_nome:
             # --- ATUALIZAÇÃO AQUI ---
             # Agora busca também pelo nome do Proprietário do Veículo
-            processos = processos.filter(
-                Q(cliente__nome__icontains=cliente_nome) | 
-                Q(veiculo__placa__icontains=cliente_nome) |
-                Q(numero_atendimento__icontains=cliente_nome) |
-                Q(veiculo__proprietario_nome__icontains=cliente_nome) # <--- Nova linha
-            )
-            
+            processos = processos.filter(filtro_busca(
+                cliente_nome,
+                texto=['cliente__nome', 'veiculo__proprietario_nome'],
+                documento=['cliente__documento_busca'],
+                placa=['veiculo__placa_busca'],
+                sempre=['numero_atendimento'],
+            ))
+
         if status_fin: processos = processos.filter(status_financeiro=status_fin)
+        return processos
+
+    consultas = [filtrar(modelo) for modelo in arquivo.modelos_do_periodo(despachante.id, inicio_periodo)]
+
+    # --- AGREGAÇÃO DE VALORES ---
+    def calcular_resumo():
+        if cliente_nome:
+            # Busca por cliente/placa: só os processos sabem quem é quem.
+            # Somas e pendentes numa consulta só (por tabela: processos e arquivo)
+            dados_financeiros = arquivo.agregar(
+                consultas,
+                quantidade_aberto=Count('id', filter=Q(status_financeiro='ABERTO')),
+                soma_taxas=Sum('valor_taxas_detran'),
+                soma_honorarios=Sum('valor_honorarios'),
+                soma_impostos=Sum('custo_impostos'),
+                soma_bancario=Sum('custo_taxa_bancaria'),
+                soma_sindego=Sum('custo_taxa_sindego')
+            )
+        else:
+            # Só período/situação: soma as linhas do resumo diário (cadastro/resumo.py)
+            if sem_filtro:
+                hoje = timezone.now().date()
+                linhas = resumo_diario.linhas(despachante.id, status='APROVADO', data__month=hoje.month, data__year=hoje.year)
+            else:
+                linhas = resumo_diario.linhas(despachante.id, data_inicio, data_fim, status='APROVADO')
+                if status_fin: linhas = linhas.filter(status_financeiro=status_fin)
+            dados_financeiros = resumo_diario.totais(linhas)
+
+        # Prepara o resumo tratando valores None como 0
+        resumo = {
+            'total_pendentes': dados_financeiros['quantidade_aberto'] or 0,
+            'valor_taxas': dados_financeiros['soma_taxas'] or 0,
+            'valor_honorarios_bruto': dados_financeiros['soma_honorarios'] or 0,
+            'valor_impostos': dados_financeiros['soma_impostos'] or 0,
+            'valor_bancario': dados_financeiros['soma_bancario'] or 0,
+            'valor_sindego': dados_financeiros['soma_sindego'] or 0,
+        }
 
-    # --- AGREGAÇÃO DE VALORES (Cálculo via Banco de Dados) ---
-    # Isso é mais rápido que somar no Python quando se usa paginação
-    dados_financeiros = processos.aggregate(
-        total_taxas=Sum('valor_taxas_detran'),
-        total_honorarios=Sum('valor_honorarios'),
-        total_impostos=Sum('custo_impostos'),
-        total_bancario=Sum('custo_taxa_bancaria'),
-        total_sindego=Sum('custo_taxa_sindego') 
-    )
+        # --- CÁLCULOS FINAIS ---
+        resumo['faturamento_total'] = resumo['valor_taxas'] + resumo['valor_honorarios_bruto']
 
-    # Prepara o resumo tratando valores None como 0
-    resumo = {
-        'total_pendentes': processos.filter(status_financeiro='ABERTO').count(),
-        'valor_taxas': dados_financeiros['total_taxas'] or 0,
-        'valor_honorarios_bruto': dados_financeiros['total_honorarios'] or 0,
-        'valor_impostos': dados_financeiros['total_impostos'] or 0,
-        'valor_bancario': dados_financeiros['total_bancario'] or 0,
-        'valor_sindego': dados_financeiros['total_sindego'] or 0, 
-    }
-    
-    # --- CÁLCULOS FINAIS ---
-    resumo['faturamento_total'] = resumo['valor_taxas'] + resumo['valor_honorarios_bruto']
-    
-    resumo['total_custos_operacionais'] = (
-        resumo['valor_impostos'] + 
-        resumo['valor_bancario'] + 
-        resumo['valor_sindego']
+        resumo['total_custos_operacionais'] = (
+            resumo['valor_impostos'] +
+            resumo['valor_bancario'] +
+            resumo['valor_sindego']
+        )
+
+        resumo['lucro_liquido_total'] = resumo['valor_honorarios_bruto'] - resumo['total_custos_operacionais']
+        return resumo
+
+    # Os totais não mudam ao trocar de página: ficam em cache por filtro até a
+    # próxima alteração de dados do escritório (o cursor não entra na chave)
+    filtros_normalizados = (
+        sem_filtro,
+        str(inicio_periodo or ''),
+        data_fim or '',
+        (cliente_nome or '').strip().lower(),
+        status_fin or '',
     )
-    
-    resumo['lucro_liquido_total'] = resumo['valor_honorarios_bruto'] - resumo['total_custos_operacionais']
+    chave_resumo = "resumo_fluxo_caixa_{}_{}_{}".format(
+        despachante.id,
+        hashlib.md5(repr(filtros_normalizados).encode()).hexdigest(),
+        versoes.carimbo(despachante.id),
+    )
+    resumo = cache.get(chave_resumo)
+    if resumo is None:
+        resumo = calcular_resumo()
+        cache.set(chave_resumo, resumo, VALIDADE_RESUMO_FLUXO_CAIXA)
 
-    # Paginação para não travar fluxo de caixa
-    # Usei 100 itens para testar o scroll, mas você pode manter 50
-    paginator = Paginator(processos, 50) 
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginação por cursor para não travar fluxo de caixa
+    page_obj = paginar(request, consultas, 50, ['-data_solicitacao', '-id'])
 
     return render(request, 'financeiro/fluxo_caixa.html', { 
         'processos': page_obj,  # Envia a página atual
@@ -1531,7 +1636,7 @@ def fluxo_caixa(request):
 
 @login_required
 def dar_baixa_pagamento(request, id):
-    processo = get_object_or_404(Atendimento, id=id, despachante=request.user.perfilusuario.despachante)
+    processo = get_object_or_404(Atendimento, id=id, despachante=request.tenant.despachante)
     
     processo.status_financeiro = 'PAGO'
     processo.data_pagamento = timezone.now().date()
@@ -1554,7 +1659,7 @@ def gerar_boleto_agrupado(request, cliente_id):
         messages.error(request, "Ação inválida.")
         return redirect('relatorio_servicos')
 
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     cliente = get_object_or_404(Cliente, id=cliente_id, despachante=despachante)
     
     # 1. Validação da Chave API
@@ -1665,6 +1770,7 @@ def gerar_boleto_agrupado(request, cliente_id):
 
         # 6. Salva o ID do boleto em TODOS os atendimentos
         atendimentos.update(asaas_id=boleto_id)
+        versoes.tocar(despachante.id)  # .update() não dispara signals
 
         messages.success(request, f"Boleto Unificado gerado! Valor: R$ {valor_total_agrupado}")
         return redirect(link_pagamento)
@@ -1676,99 +1782,63 @@ def gerar_boleto_agrupado(request, cliente_id):
     
 @login_required
 @plano_minimo('MEDIO')
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def dashboard_financeiro(request):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     
     # --- 1. DEFINIÇÃO DO PERÍODO (FILTROS) ---
     # Se não vier data na URL, pega o mês atual inteiro (do dia 1 até hoje)
     hoje = timezone.now().date()
     inicio_mes = hoje.replace(day=1)
-    
-    data_inicio = request.GET.get('data_inicio', inicio_mes.strftime('%Y-%m-%d'))
-    data_fim = request.GET.get('data_fim', hoje.strftime('%Y-%m-%d'))
-
-    # --- 2. QUERYSET BASE ---
-    # Filtra tudo que é APROVADO dentro do período selecionado
-    processos = Atendimento.objects.filter(
-        despachante=despachante,
-        status='APROVADO',
-        data_solicitacao__range=[data_inicio, data_fim]
-    ).exclude(status='CANCELADO')
 
-    # --- 3. CÁLCULOS NO BANCO DE DADOS (PostgreSQL faz a conta) ---
-    zero = Value(0, output_field=DecimalField())
+    try:
+        data_inicio = date.fromisoformat(request.GET.get('data_inicio') or inicio_mes.isoformat())
+        data_fim = date.fromisoformat(request.GET.get('data_fim') or hoje.isoformat())
+    except ValueError:
+        data_inicio, data_fim = inicio_mes, hoje
 
-    # Aqui a mágica acontece: O banco soma e subtrai as colunas
-    agregados = processos.aggregate(
-        # Receita
-        soma_taxas=Coalesce(Sum('valor_taxas_detran'), zero),
-        soma_honorarios=Coalesce(Sum('valor_honorarios'), zero),
-        
-        # Custos
-        soma_impostos=Coalesce(Sum('custo_impostos'), zero),
-        soma_bancario=Coalesce(Sum('custo_taxa_bancaria'), zero),
-        soma_sindego=Coalesce(Sum('custo_taxa_sindego'), zero),
-        
-        # Lucro Líquido calculado no SQL: Honorarios - (Impostos + Banco + Sindicato)
-        lucro_liquido_real=Coalesce(Sum(
-            F('valor_honorarios') - (
-                F('custo_impostos') + 
-                F('custo_taxa_bancaria') + 
-                F('custo_taxa_sindego')
-            )
-        ), zero)
-    )
+    # Agrupamento do gráfico: escolhido na tela ou, no automático, semanas até ~3 meses
+    periodo = request.GET.get('agrupar')
+    if periodo not in resumo_diario.TRUNCAR:
+        periodo = 'semana' if (data_fim - data_inicio).days <= 92 else 'mes'
 
-    # --- 4. PREPARAÇÃO PARA O DASHBOARD ---
-    # Convertendo Decimal para Float para passar pro JSON/Template
-    total_taxas = float(agregados['soma_taxas'])
-    total_honorarios = float(agregados['soma_honorarios'])
-    total_bruto = total_taxas + total_honorarios
-    
-    custos_ops = float(agregados['soma_impostos'] + agregados['soma_bancario'] + agregados['soma_sindego'])
-    lucro_real = float(agregados['lucro_liquido_real'])
+    # --- 2. SÉRIE DO PERÍODO (um GROUP BY no resumo diário, em cache) ---
+    # Só processos APROVADOS; os totais dos cards são a soma dos pontos
+    serie = resumo_diario.serie_financeira(despachante.id, data_inicio, data_fim, periodo)
+    totais = serie['totais']
 
     # Dados para o Gráfico de Rosca (Composição)
     pie_data = [
-        lucro_real, 
-        float(agregados['soma_impostos']), 
-        float(agregados['soma_bancario']), 
-        float(agregados['soma_sindego'])
+        float(totais['lucro']),
+        float(totais['impostos']),
+        float(totais['bancario']),
+        float(totais['sindego'])
     ]
 
-    # --- 5. GRÁFICO DE EVOLUÇÃO (Barras) ---
-    # Mostra a evolução mensal DENTRO do período selecionado
-    evolucao = processos.annotate(
-        mes=ExtractMonth('data_solicitacao')
-    ).values('mes').annotate(
-        total=Sum('valor_honorarios')
-    ).order_by('mes')
-
-    meses_nomes = {
-        1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun',
-        7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'
-    }
-
-    labels_meses = [meses_nomes.get(item['mes'], 'Mês') for item in evolucao]
-    valores_meses = [float(item['total']) for item in evolucao]
+    # --- 3. GRÁFICO DE EVOLUÇÃO (Barras) ---
+    # Um ponto por mês/semana do período, inclusive os sem movimento
+    pontos = serie['pontos']
 
     context = {
         'resumo': {
-            'bruto': total_bruto,
-            'detran': total_taxas,
-            'custos_operacionais': custos_ops,
-            'lucro': lucro_real,
-            'pendente': processos.filter(status_financeiro='ABERTO').count()
+            'bruto': totais['receita'],
+            'detran': totais['taxas'],
+            'custos_operacionais': totais['custos'],
+            'lucro': totais['lucro'],
+            'pendente': totais['pendentes']
         },
         'pie_data': json.dumps(pie_data),
-        'labels_meses': json.dumps(labels_meses),
-        'valores_meses': json.dumps(valores_meses),
+        'labels_periodos': json.dumps([ponto['rotulo'] for ponto in pontos]),
+        'valores_honorarios': json.dumps([float(ponto['honorarios']) for ponto in pontos]),
+        'valores_custos': json.dumps([float(ponto['custos']) for ponto in pontos]),
+        'valores_lucro': json.dumps([float(ponto['lucro']) for ponto in pontos]),
+        'valores_pendentes': json.dumps([ponto['pendentes'] for ponto in pontos]),
         
         # Devolvemos as datas para manter o input preenchido
         'filtros': {
-            'inicio': data_inicio,
-            'fim': data_fim
+            'inicio': data_inicio.isoformat(),
+            'fim': data_fim.isoformat(),
+            'agrupar': request.GET.get('agrupar', ''),
         }
     }
     
@@ -1777,7 +1847,7 @@ def dashboard_financeiro(request):
 @login_required
 @plano_minimo('MEDIO')
 def relatorio_inadimplencia(request):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     hoje = timezone.now().date()
     
     devedores_qs = Atendimento.objects.filter(
@@ -1786,9 +1856,9 @@ def relatorio_inadimplencia(request):
         status_financeiro='ABERTO'
     ).select_related('cliente', 'veiculo').order_by('data_solicitacao')
 
-    agregados = devedores_qs.aggregate(total_taxas=Sum('valor_taxas_detran'), total_honorarios=Sum('valor_honorarios'))
-    total_taxas = agregados['total_taxas'] or 0
-    total_honorarios = agregados['total_honorarios'] or 0
+    agregados = resumo_diario.totais(resumo_diario.linhas(despachante.id, status='APROVADO', status_financeiro='ABERTO'))
+    total_taxas = agregados['soma_taxas']
+    total_honorarios = agregados['soma_honorarios']
 
     lista_devedores = []
     for item in devedores_qs:
@@ -1826,9 +1896,9 @@ def relatorio_inadimplencia(request):
 
 @login_required
 @plano_minimo('MEDIO')
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def relatorio_contabil(request):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     
     hoje = timezone.now()
     try:
@@ -1838,24 +1908,37 @@ def relatorio_contabil(request):
         mes = hoje.month
         ano = hoje.year
     
+    try:
+        inicio_mes = date(ano, mes, 1)
+    except ValueError:
+        inicio_mes = None
+
     # --- FILTRO ATUALIZADO (SEGURANÇA FISCAL) ---
-    processos = Atendimento.objects.filter(
-        despachante=despachante,
-        data_solicitacao__month=mes,
-        data_solicitacao__year=ano,
-        status_financeiro='PAGO' # <--- ADICIONADO: Só conta se o dinheiro entrou!
-    ).exclude(status__in=['CANCELADO', 'ORCAMENTO']).order_by('data_solicitacao')
-
-    zero = Value(0, output_field=DecimalField())
-    
-    # 1. Busca os totais do banco de dados
-    resumo = processos.aggregate(
-        total_honorarios=Coalesce(Sum('valor_honorarios'), zero),
-        total_taxas_orgaos=Coalesce(Sum('valor_taxas_detran'), zero),
-        total_impostos_retidos=Coalesce(Sum('custo_impostos'), zero),
+    consultas = [
+        modelo.objects.filter(
+            despachante=despachante,
+            data_solicitacao__month=mes,
+            data_solicitacao__year=ano,
+            status_financeiro='PAGO' # <--- ADICIONADO: Só conta se o dinheiro entrou!
+        ).exclude(status__in=['CANCELADO', 'ORCAMENTO']).order_by('data_solicitacao')
+        for modelo in arquivo.modelos_do_periodo(despachante.id, inicio_mes)
+    ]
+    processos = [processo for consulta in consultas for processo in consulta]
+    if len(consultas) > 1:
+        processos.sort(key=lambda processo: (processo.data_solicitacao, processo.id))
+
+    # 1. Busca os totais no resumo diário (mesmo filtro da lista)
+    linhas = resumo_diario.linhas(
+        despachante.id, data__month=mes, data__year=ano, status_financeiro='PAGO'
+    ).exclude(status__in=['CANCELADO', 'ORCAMENTO'])
+    totais = resumo_diario.totais(linhas)
+    resumo = {
+        'total_honorarios': totais['soma_honorarios'],
+        'total_taxas_orgaos': totais['soma_taxas'],
+        'total_impostos_retidos': totais['soma_impostos'],
         # Soma taxas bancárias + sindicato
-        total_despesas_operacionais=Coalesce(Sum('custo_taxa_bancaria'), zero) + Coalesce(Sum('custo_taxa_sindego'), zero)
-    )
+        'total_despesas_operacionais': totais['soma_bancario'] + totais['soma_sindego'],
+    }
 
     # 2. Faz os cálculos matemáticos no Python
     total_honorarios = float(resumo['total_honorarios'])
@@ -1880,7 +1963,7 @@ def relatorio_contabil(request):
 
 @login_required
 def configuracoes_despachante(request):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
 
     if request.method == 'POST':
         # Porcentagens
@@ -1897,6 +1980,8 @@ def configuracoes_despachante(request):
         # Chave API
         api_key_asaas = request.POST.get('asaas_api_key')
 
+        percentuais_antes = (despachante.aliquota_imposto, despachante.taxa_bancaria_padrao)
+
         # --- PROCESSAMENTO ---
         if aliquota_imposto:
             despachante.aliquota_imposto = aliquota_imposto.replace(',', '.')
@@ -1917,7 +2002,19 @@ def configuracoes_despachante(request):
         if api_key_asaas is not None:
             despachante.asaas_api_key = api_key_asaas.strip()
 
+        # Prazos da fila (SLA)
+        for campo in ('sla_dias_alerta', 'sla_dias_atraso', 'sla_dias_aviso_prazo'):
+            valor = request.POST.get(campo, '').strip()
+            if valor.isdigit() and int(valor) <= 3650:
+                setattr(despachante, campo, int(valor))
+
         despachante.save()
+
+        # Alíquota ou taxa bancária mudou: reaplica nos processos ainda não pagos
+        despachante.refresh_from_db(fields=['aliquota_imposto', 'taxa_bancaria_padrao'])
+        if (despachante.aliquota_imposto, despachante.taxa_bancaria_padrao) != percentuais_antes:
+            recalculados = precificacao.recalcular_em_aberto(despachante)
+            messages.info(request, f"Custos de {recalculados} processos em aberto recalculados com as novas taxas.")
         
         messages.success(request, 'Configurações atualizadas com sucesso!')
         return redirect('configuracoes_despachante')
@@ -1926,7 +2023,10 @@ def configuracoes_despachante(request):
 
 @login_required
 def emitir_recibo(request, id):
-    atendimento = get_object_or_404(Atendimento, id=id, despachante=request.user.perfilusuario.despachante)
+    # Recibo de processo antigo sai da cópia do arquivo
+    atendimento = arquivo.buscar_processo(id=id, despachante=request.tenant.despachante)
+    if atendimento is None:
+        raise Http404
     taxas = atendimento.valor_taxas_detran or 0
     honorarios = atendimento.valor_honorarios or 0
     total = taxas + honorarios
@@ -1938,7 +2038,7 @@ def emitir_recibo(request, id):
 # ==============================================================================
 @login_required
 def selecao_documento(request):
-    despachante_logado = request.user.perfilusuario.despachante
+    despachante_logado = request.tenant.despachante
     clientes = Cliente.objects.filter(despachante=despachante_logado).order_by('nome')
     servicos = TipoServico.objects.filter(despachante=despachante_logado, ativo=True)
     return render(request, 'documentos/selecao_documento.html', {'clientes': clientes, 'servicos': servicos})
@@ -1996,7 +2096,7 @@ def imprimir_documento(request):
         tipo_solicitante_baixa = request.POST.get('tipo_solicitante_baixa')
         possui_procurador_baixa = request.POST.get('possui_procurador_baixa') 
 
-        despachante_obj = request.user.perfilusuario.despachante
+        despachante_obj = request.tenant.despachante
         cliente = get_object_or_404(Cliente, id=cliente_id, despachante=despachante_obj)
         
         veiculo = None
@@ -2244,6 +2344,17 @@ def pagar_mensalidade(request):
         messages.error(request, f"Erro ao gerar fatura: {resultado.get('erro')}")
         return redirect('bloqueio_financeiro_admin')
     
+@login_required
+@user_passes_test(is_master)
+def master_metricas_cache(request):
+    """Hits/misses do cache compartilhado (somando todos os workers)."""
+    if request.GET.get('zerar') == '1':
+        cache.zerar_metricas()
+    return JsonResponse({
+        'backend': settings.CACHES['default']['BACKEND'],
+        **cache.metricas()
+    })
+
 @login_required
 @user_passes_test(is_master)
 def master_listar_despachantes(request):
@@ -2380,7 +2491,7 @@ def master_editar_usuario(request, id):
 
 @login_required
 @plano_minimo('PREMIUM')
-@user_passes_test(is_admin_or_superuser, login_url='/dashboard/')
+@admin_obrigatorio(login_url='/dashboard/')
 def relatorio_auditoria(request):
     try:
         perfil = request.user.perfilusuario
@@ -2427,10 +2538,8 @@ def relatorio_auditoria(request):
             Q(usuario__first_name__icontains=busca)
         )
 
-    # 3. Paginação
-    paginator = Paginator(logs, 20) 
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # 3. Paginação por cursor
+    page_obj = paginar(request, logs, 20, ['-data', '-id'])
     
     usuarios_equipe = PerfilUsuario.objects.filter(despachante=perfil.despachante).select_related('user')
 
@@ -2457,7 +2566,7 @@ def relatorio_auditoria(request):
 @login_required
 @plano_minimo('MEDIO')
 def gerar_cobranca_asaas(request, id):
-    despachante = request.user.perfilusuario.despachante
+    despachante = request.tenant.despachante
     atendimento = get_object_or_404(Atendimento, id=id, despachante=despachante)
     
     # 1. VALIDAÇÃO DE SEGURANÇA
@@ -2576,7 +2685,9 @@ def gerar_cobranca_asaas(request, id):
     
 def rastreio_publico(request, token):
     # Busca o atendimento pelo Token seguro (UUID)
-    atendimento = get_object_or_404(Atendimento, token_rastreio=token)
+    atendimento = arquivo.buscar_processo(token_rastreio=token)
+    if atendimento is None:
+        raise Http404
     
     # Lógica Visual (Progresso e Cores)
     progresso = 0
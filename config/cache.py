@@ -0,0 +1,131 @@
+"""
+Backends de cache compartilhados entre os workers do Gunicorn.
+
+- ArquivoCache: padrão, sem servidor externo. Os arquivos ficam numa pasta
+  comum a todos os workers (e a todos os containers que montarem o volume).
+- RedisCache: usado quando a variável REDIS_URL existe (precisa do pacote 'redis').
+
+Os dois contam hits/misses. Cada worker acumula a contagem na memória e
+descarrega no próprio cache de tempos em tempos, para o número ser global.
+As métricas são aproximadas: no ArquivoCache o incr lê e regrava o arquivo,
+então descargas simultâneas de dois workers podem perder uma das parcelas.
+
+O ArquivoCache tem MAX_ENTRIES: quando lota, apaga um terço dos arquivos ao
+acaso, inclusive os gravados sem validade. Para saber se lotou, cada set()
+lista a pasta inteira, por isso o limite fica baixo (CACHE_MAX_ENTRIES em
+config/settings.py). Estado que não pode sumir (token
+da sessão ativa, carimbos de versão dos dados) vai para o cache 'estado'
+(cache_estado abaixo): ArquivoCachePermanente numa subpasta, que nunca
+descarta por lotação. Com Redis, os dois apelidos apontam para o mesmo
+servidor (configure o Redis com maxmemory-policy noeviction ou volatile-*).
+"""
+
+import time
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.redis import RedisCache as DjangoRedisCache
+from django.utils.connection import ConnectionProxy
+
+CHAVE_HITS = 'cache_metricas_hits'
+CHAVE_MISSES = 'cache_metricas_misses'
+
+# Descarrega a contagem local a cada N leituras ou X segundos
+DESCARGA_LEITURAS = 100
+DESCARGA_SEGUNDOS = 30
+
+_AUSENTE = object()
+
+
+class MetricasCacheMixin:
+    """Conta hits e misses de get/get_many sem mudar o comportamento do backend."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hits = 0
+        self._misses = 0
+        self._ultima_descarga = time.monotonic()
+        self._dentro_get_many = False
+
+    def _registrar(self, hits, misses):
+        self._hits += hits
+        self._misses += misses
+        if (self._hits + self._misses >= DESCARGA_LEITURAS
+                or time.monotonic() - self._ultima_descarga >= DESCARGA_SEGUNDOS):
+            self._descarregar()
+
+    def _somar(self, chave, valor):
+        # Aproximado no ArquivoCache (incr não é atômico entre workers); exato no Redis
+        if not valor:
+            return
+        try:
+            super().incr(chave, valor)
+        except ValueError:
+            # Primeira descarga: a chave ainda não existe
+            if not super().add(chave, valor, timeout=None):
+                super().incr(chave, valor)
+
+    def _descarregar(self):
+        hits, misses = self._hits, self._misses
+        self._hits = self._misses = 0
+        self._ultima_descarga = time.monotonic()
+        try:
+            self._somar(CHAVE_HITS, hits)
+            self._somar(CHAVE_MISSES, misses)
+        except Exception:
+            # Métrica nunca pode derrubar o request
+            pass
+
+    def get(self, key, default=None, version=None):
+        valor = super().get(key, _AUSENTE, version)
+        if not self._dentro_get_many:
+            self._registrar(0 if valor is _AUSENTE else 1, 1 if valor is _AUSENTE else 0)
+        return default if valor is _AUSENTE else valor
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        # O get_many padrão chama self.get() para cada chave: conta uma vez só aqui
+        self._dentro_get_many = True
+        try:
+            encontrados = super().get_many(keys, version)
+        finally:
+            self._dentro_get_many = False
+        self._registrar(len(encontrados), len(keys) - len(encontrados))
+        return encontrados
+
+    def metricas(self):
+        """Totais de todos os workers: {'hits', 'misses', 'taxa_acerto'}."""
+        self._descarregar()
+        hits = super().get(CHAVE_HITS, 0) or 0
+        misses = super().get(CHAVE_MISSES, 0) or 0
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'taxa_acerto': round(hits * 100 / total, 1) if total else None,
+        }
+
+    def zerar_metricas(self):
+        self._hits = self._misses = 0
+        super().delete_many([CHAVE_HITS, CHAVE_MISSES])
+
+
+class ArquivoCache(MetricasCacheMixin, FileBasedCache):
+    pass
+
+
+class RedisCache(MetricasCacheMixin, DjangoRedisCache):
+    pass
+
+
+class ArquivoCachePermanente(FileBasedCache):
+    """
+    Cache em arquivos sem descarte por lotação: só some o que expirou ou foi
+    apagado. Para poucas chaves de estado (uma por usuário/escritório/cliente).
+    """
+
+    def _cull(self):
+        pass
+
+
+# Cache do estado que os requests tratam como verdade (settings.CACHES['estado'])
+cache_estado = ConnectionProxy(caches, 'estado')
@@ -1,43 +1,90 @@
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser
+from cadastro.tenant import carregar_tenant
+from cadastro.sessoes import sessao_valida
+
+class TenantMiddleware:
+    """
+    Resolve o escritório do usuário UMA vez por request e expõe em request.tenant.
+    Deve vir logo depois do AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant = carregar_tenant(request.user) if request.user.is_authenticated else None
+        return self.get_response(request)
+
+
+class SessaoUnicaMiddleware:
+    """
+    Derruba a sessão quando o mesmo usuário fez login em outro lugar.
+    A conferência é feita contra o token ativo no cache (sem query por request).
+    Deve vir depois do TenantMiddleware e do MessageMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.user.is_authenticated and not sessao_valida(request):
+            # flush() em vez de logout(): o logout() dispararia user_logged_out
+            # e invalidaria também a sessão nova, que é a legítima
+            request.session.flush()
+            request.user = AnonymousUser()
+            request.tenant = None
+            messages.warning(request, "Sua sessão foi encerrada porque sua conta foi acessada em outro dispositivo.")
+            return redirect('login')
+
+        return self.get_response(request)
+
 
 class BloqueioSaaSMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        # Whitelist compilada uma única vez (no primeiro request, quando as URLs já estão carregadas)
+        self._rotas_livres = None
+        self._url_bloqueio_admin = None
+
+    def _compilar_rotas(self):
+        # --- LISTA DE URLS PERMITIDAS (Whitelist) ---
+        # Estas páginas NUNCA podem ser bloqueadas pelo Financeiro.
+        rotas_livres = [
+            reverse('logout'), 
+            reverse('admin:index'), 
+            reverse('pagar_mensalidade'),         # Ação de gerar boleto (Botão)
+            reverse('bloqueio_financeiro_admin'), # Tela de aviso antes de cobrar
+            '/api/webhook/',                      # O Asaas precisa conseguir avisar o pagamento
+            
+            # [ATUALIZAÇÃO] Permitir telas de troca de senha
+            # Isso evita conflito com o ForcarTrocaSenhaMiddleware
+            reverse('password_change'),
+            reverse('password_change_done'),
+        ]
+        # Tupla: o str.startswith testa todos os prefixos de uma vez
+        self._rotas_livres = tuple(rotas_livres)
+        self._url_bloqueio_admin = reverse('bloqueio_financeiro_admin')
 
     def __call__(self, request):
         # 1. Se não estiver logado ou for Superusuário, deixa passar livre
         if not request.user.is_authenticated or request.user.is_superuser:
             return self.get_response(request)
 
-        # 2. Verifica se o usuário tem vínculo com despachante
-        if hasattr(request.user, 'perfilusuario') and request.user.perfilusuario.despachante:
-            despachante = request.user.perfilusuario.despachante
-            perfil = request.user.perfilusuario
-            
-            # --- LISTA DE URLS PERMITIDAS (Whitelist) ---
-            # Estas páginas NUNCA podem ser bloqueadas pelo Financeiro.
-            rotas_livres = [
-                reverse('logout'), 
-                reverse('admin:index'), 
-                reverse('pagar_mensalidade'),         # Ação de gerar boleto (Botão)
-                reverse('bloqueio_financeiro_admin'), # Tela de aviso antes de cobrar
-                '/api/webhook/',                      # O Asaas precisa conseguir avisar o pagamento
-                
-                # [ATUALIZAÇÃO] Permitir telas de troca de senha
-                # Isso evita conflito com o ForcarTrocaSenhaMiddleware
-                reverse('password_change'),
-                reverse('password_change_done'),
-            ]
-            
+        # 2. Verifica se o usuário tem vínculo com despachante (já carregado pelo TenantMiddleware)
+        tenant = request.tenant
+        if tenant.despachante:
+            despachante = tenant.despachante
+
+            if self._rotas_livres is None:
+                self._compilar_rotas()
+
             # Se a URL atual começa com alguma das livres, libera
-            for rota in rotas_livres:
-                if request.path.startswith(rota):
-                    return self.get_response(request)
+            if request.path.startswith(self._rotas_livres):
+                return self.get_response(request)
 
             # --- REGRA 1: BLOQUEIO TOTAL (Empresa Desativada no Painel Master) ---
-            if not despachante.ativo:
+            if not tenant.ativo:
                 return render(request, 'financeiro/bloqueio_suspenso.html', {
                     'empresa': despachante.nome_fantasia,
                     'motivo': 'Suspensão Administrativa'
@@ -45,15 +92,13 @@ class BloqueioSaaSMiddleware:
 
             # --- REGRA 2: BLOQUEIO FINANCEIRO (Data de Validade Expirada) ---
             # Verificamos a data da EMPRESA
-            dias_restantes = despachante.get_dias_restantes()
-            
             # Se não for vitalício (None) E estiver vencido (< 0)
-            if dias_restantes is not None and dias_restantes < 0:
+            if tenant.assinatura_vencida:
                 
                 # Se for o DONO (Admin)
-                if perfil.tipo_usuario == 'ADMIN':
+                if tenant.tipo_usuario == 'ADMIN':
                     # Redireciona para a tela de aviso/cobrança
-                    if request.path != reverse('bloqueio_financeiro_admin'):
+                    if request.path != self._url_bloqueio_admin:
                         return redirect('bloqueio_financeiro_admin')
                     
                     return self.get_response(request)
@@ -51,7 +51,11 @@ INSTALLED_APPS = [
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Sessão assinada no próprio cookie: nenhum acesso ao banco por request.
+# A regra de "um acesso por usuário" fica no SessaoUnicaMiddleware (cadastro/sessoes.py).
+# Para voltar ao banco: SESSION_ENGINE=django.contrib.sessions.backends.db no .env
+# (e agendar o limpar_sessoes, que só age nesse caso)
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.signed_cookies')
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 MIDDLEWARE = [
@@ -61,7 +65,11 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Carrega Perfil + Despachante uma vez por request (request.tenant)
+    'config.middleware.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    # Um acesso por usuário: derruba a sessão antiga quando há login novo
+    'config.middleware.SessaoUnicaMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     
     # [CORREÇÃO CRÍTICA] O Bloqueio só funciona se esta linha existir!
@@ -228,12 +236,45 @@ UNFOLD = {
     },
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# --- CACHE COMPARTILHADO ---
+# O Gunicorn roda com 3 workers: um cache em memória (LocMem) ficaria isolado em
+# cada processo. Padrão: cache em arquivos numa pasta comum (sem servidor externo).
+# Se existir REDIS_URL no .env (ex: redis://localhost:6379/0), usa o Redis.
+REDIS_URL = os.getenv('REDIS_URL')
+
+# 'estado' guarda o que não pode ser descartado quando o cache lota (config/cache.py).
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'estado': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHE_DIR = Path(os.getenv('CACHE_DIR', BASE_DIR / 'cache'))
+    # O FileBasedCache lista a pasta inteira a cada set() para ver se lotou, e
+    # todo processo salvo grava um evento da fila: o limite precisa ser baixo
+    # para essa varredura custar pouco. Preço: com muitos escritórios ativos o
+    # cache lota mais cedo e descarta um terço das entradas (fragmentos, índices
+    # do autocomplete, eventos ainda não entregues), que são refeitos na próxima
+    # leitura. Com muitos escritórios, prefira o Redis (REDIS_URL): não varre nada.
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2000))
+    CACHES = {
+        'default': {
+            'BACKEND': 'config.cache.ArquivoCache',
+            'LOCATION': CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        },
+        'estado': {
+            'BACKEND': 'config.cache.ArquivoCachePermanente',
+            'LOCATION': CACHE_DIR / 'estado',
+            'TIMEOUT': None,
+        },
     }
-}
 
 # ==============================================================================
 # 10. E-MAIL (SMTP REAL)